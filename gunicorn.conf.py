@@ -0,0 +1,10 @@
+"""
+gunicorn settings, read from the working directory by `gunicorn matcher.wsgi` and `gunicorn matcher.asgi:application`.
+"""
+
+
+def post_worker_init(worker):
+    """start building the candidate index as soon as the worker has loaded the application - in the background, so
+    the worker keeps answering the arbiter's heartbeat, and requests only wait for what is left of the build"""
+    from matcher_app import match_index
+    match_index.start_rebuild()
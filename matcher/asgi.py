@@ -0,0 +1,28 @@
+"""
+ASGI config for matcher project.
+
+It exposes the ASGI callable as a module-level variable named ``application``, which serves the read endpoints with
+their async views (matcher_app.async_views). Run it with e.g.
+
+    gunicorn matcher.asgi:application -k uvicorn.workers.UvicornWorker
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
+"""
+
+import os
+
+from asgiref.sync import ThreadSensitiveContext
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'matcher.settings')
+os.environ.setdefault('MATCHER_ASYNC_VIEWS', '1')
+
+django_application = get_asgi_application()
+
+
+async def application(scope, receive, send):
+    # the sync views (the writes) each get a thread of their own, instead of all requests sharing the single thread
+    # Django 3.2 runs them in otherwise
+    async with ThreadSensitiveContext():
+        await django_application(scope, receive, send)
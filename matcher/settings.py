@@ -47,6 +47,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'matcher_app.middleware.QueryMetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'matcher.urls'
@@ -69,19 +70,55 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'matcher.wsgi.application'
 
+ASGI_APPLICATION = 'matcher.asgi.application'
+
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'matcher',
-        'USER': os.environ['POSTGRES_USER'],
-        'PASSWORD': os.environ['POSTGRES_PASSWORD'],
-        'HOST': 'localhost',
-        'PORT': '5432',
+# MATCHER_DATABASE=sqlite runs on a local SQLite file instead of Postgres (e.g. for `manage.py benchmark_matching`)
+
+if os.environ.get('MATCHER_DATABASE') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': 'matcher',
+            'USER': os.environ['POSTGRES_USER'],
+            'PASSWORD': os.environ['POSTGRES_PASSWORD'],
+            'HOST': 'localhost',
+            'PORT': '5432',
+        }
+    }
+
+# Seconds a worker thread keeps its database connection open across requests (0 closes it after every request, an
+# empty MATCHER_CONN_MAX_AGE or 'none' keeps it for good). Threads keep one connection each, so a process opens at
+# most one per gunicorn thread plus MATCHER_ASYNC_THREADS - put PgBouncer in front of Postgres to share them between
+# processes.
+
+_conn_max_age = os.environ.get('MATCHER_CONN_MAX_AGE', '60').strip()
+DATABASES['default']['CONN_MAX_AGE'] = None if _conn_max_age.lower() in ('', 'none') else int(_conn_max_age)
+
+# Read replica behind the 'replica' alias: GET requests of the read-only endpoints read from it (see
+# matcher_app.routers) when MATCHER_REPLICA_HOST / MATCHER_REPLICA_PORT point at a streaming replica of the Postgres
+# database above, e.g. a second local server. Without them the alias is a second connection to the primary, which the
+# tests use as the replica.
+
+DATABASES['replica'] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+if os.environ.get('MATCHER_REPLICA_HOST') or os.environ.get('MATCHER_REPLICA_PORT'):
+    DATABASES['replica']['HOST'] = os.environ.get('MATCHER_REPLICA_HOST', DATABASES['default'].get('HOST'))
+    DATABASES['replica']['PORT'] = os.environ.get('MATCHER_REPLICA_PORT', DATABASES['default'].get('PORT'))
+    MATCHER_REPLICA_DATABASE = 'replica'
+else:
+    MATCHER_REPLICA_DATABASE = None
+
+DATABASE_ROUTERS = ['matcher_app.routers.ReplicaRouter']
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -113,7 +150,108 @@ USE_L10N = True
 
 USE_TZ = True
 
+# Tables keep the integer primary keys they were created with
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
 STATIC_URL = '/static/'
+
+# Candidate matching
+# The candidate index (matcher_app.match_index) is built once per process and kept in sync by model signals.
+# Signals only fire in the process that made the write, so with several gunicorn workers each worker also
+# rebuilds its index once it is older than this many seconds, in the background (None disables the periodic rebuild).
+
+MATCHER_INDEX_MAX_AGE = 300
+
+# Write-behind of match results (matcher_app.match_writer): candidates requests queue their matches and
+# `manage.py flush_matches` writes them to the Match table every MATCHER_MATCH_FLUSH_INTERVAL seconds, in batches of
+# up to MATCHER_MATCH_FLUSH_BATCH_SIZE requests. When disabled, the matches are written during the request.
+# On shutdown the worker writes the rows queued until then for at most MATCHER_MATCH_DRAIN_TIMEOUT seconds - keep it
+# below the grace period of the platform (30 seconds on Heroku) so the last transaction is not cut off.
+
+MATCHER_MATCH_WRITE_BEHIND = True
+MATCHER_MATCH_FLUSH_INTERVAL = 1.0
+MATCHER_MATCH_FLUSH_BATCH_SIZE = 200
+MATCHER_MATCH_DRAIN_TIMEOUT = 20.0
+
+# Directory of the match index snapshots written by `manage.py build_match_snapshot`. When set, workers memory-map
+# the latest snapshot instead of loading the candidate tables and candidate writes are logged for them to replay.
+
+MATCHER_SNAPSHOT_DIR = os.environ.get('MATCHER_SNAPSHOT_DIR')
+
+# Number of per-skill candidate bitsets the index keeps for multi-skill jobs (each takes one bit per candidate)
+MATCHER_MAX_SKILL_BITSETS = 256
+
+# .npz file holding the skill co-occurrence model used by the ranking - written by imports and by
+# `manage.py build_skill_cooccurrence` and loaded by every worker. Without it each worker computes the model itself.
+
+MATCHER_COOCCURRENCE_PATH = os.environ.get('MATCHER_COOCCURRENCE_PATH')
+
+# Maximum number of typos (Levenshtein distance) tolerated per word when matching job titles to candidate titles
+MATCHER_TITLE_MAX_DISTANCE = 2
+
+# Once a transaction writing candidates commits, the open jobs whose title may match the titles it wrote are looked up
+# to invalidate their cached matches. With more than MATCHER_INVALIDATION_MAX_JOBS open jobs every job is invalidated.
+MATCHER_INVALIDATION_MAX_JOBS = 1000
+
+# Title similarity by meaning (matcher_app.title_similarity): the candidates of the MATCHER_TITLE_SIMILARITY_TOP_K
+# titles whose TF-IDF similarity to the job title is at least MATCHER_TITLE_MIN_SIMILARITY are matched as well.
+# MATCHER_TITLE_VECTORS_PATH holds the vectors trained by `manage.py build_title_vectors` (trained per worker when
+# unset) and MATCHER_TITLE_SYNONYMS_PATH the synonym table used for training.
+
+MATCHER_TITLE_SIMILARITY = True
+MATCHER_TITLE_MIN_SIMILARITY = 0.5
+MATCHER_TITLE_SIMILARITY_TOP_K = 50
+MATCHER_TITLE_VECTORS_PATH = os.environ.get('MATCHER_TITLE_VECTORS_PATH')
+MATCHER_TITLE_SYNONYMS_PATH = os.path.join(BASE_DIR, 'matcher_app', 'title_synonyms.json')
+
+# Alias table of the skill registry (matcher_app.skill_registry) - a JSON list of groups of names, the first name of
+# a group being the stored skill name the others resolve to (e.g. JS to Javascript)
+
+MATCHER_SKILL_ALIASES_PATH = os.path.join(BASE_DIR, 'matcher_app', 'skill_aliases.json')
+
+# Match result cache (matcher_app.match_cache): 'local' keeps results in each worker, which only learns of other
+# workers' writes when its candidate index is rebuilt. 'django' stores the versions in the cache below so that all
+# gunicorn workers see each other's invalidations - only use it once CACHES points at memcached / redis, the
+# LocMemCache is private to each process. Its results expire after MATCHER_MATCH_CACHE_TIMEOUT seconds.
+
+MATCHER_MATCH_CACHE_BACKEND = 'local'
+MATCHER_MATCH_CACHE_MAX_ENTRIES = 1000
+MATCHER_MATCH_CACHE_ALIAS = 'default'
+MATCHER_MATCH_CACHE_TIMEOUT = 300
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    }
+}
+
+# Number of processes a single job is filtered and ranked on (1 ranks it in the worker), and the least number of
+# title and skill matched candidates a job needs to be split into shards - smaller jobs are cheaper on one core.
+# Only single threaded processes fork (sync gunicorn workers without --threads, management commands).
+MATCHER_SHARD_WORKERS = int(os.environ.get('MATCHER_SHARD_WORKERS', 1))
+MATCHER_SHARD_MIN_CANDIDATES = 100000
+
+# Number of processes the batch matching endpoint forks to match many jobs in parallel (1 matches in the worker)
+MATCHER_BATCH_WORKERS = 1
+
+# Page size of /candidates/<job_id>/ when a cursor is given without a limit, and the largest limit accepted
+MATCHER_PAGE_SIZE = 100
+MATCHER_MAX_PAGE_SIZE = 1000
+
+# The read endpoints are served by their async variants (matcher_app.async_views) - set by matcher/asgi.py, so the
+# ASGI deployment uses them and the WSGI one the sync views. Their ORM work runs in a pool of this many threads per
+# process, which bounds the database connections a process opens.
+MATCHER_ASYNC_VIEWS = os.environ.get('MATCHER_ASYNC_VIEWS') == '1'
+MATCHER_ASYNC_THREADS = 16
+
+# History retention (`manage.py compact_history`, see matcher_app.history): likes, dislikes and matches of closed jobs
+# older than MATCHER_HISTORY_RETENTION_DAYS are rolled up per job and candidate, archived to gzipped files under
+# MATCHER_HISTORY_ARCHIVE_DIR and deleted, MATCHER_HISTORY_BATCH_SIZE rows per transaction.
+
+MATCHER_HISTORY_RETENTION_DAYS = 180
+MATCHER_HISTORY_ARCHIVE_DIR = os.environ.get('MATCHER_HISTORY_ARCHIVE_DIR', os.path.join(BASE_DIR, 'history_archive'))
+MATCHER_HISTORY_BATCH_SIZE = 500
@@ -1,5 +1,10 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class MatcherAppConfig(AppConfig):
     name = 'matcher_app'
+
+    def ready(self):
+        from matcher_app import signals, indexes  # noqa: F401 - connects the signal handlers
+        post_migrate.connect(indexes.create_trigram_indexes, sender=self)
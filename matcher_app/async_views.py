@@ -0,0 +1,197 @@
+"""
+Async variants of the read endpoints of matcher_app.views, served in their place under ASGI (matcher/asgi.py sets
+MATCHER_ASYNC_VIEWS), so a request waiting on the database no longer pins a worker.
+
+The ORM work of the requests runs in a bounded pool of MATCHER_ASYNC_THREADS threads per process, and the queries of
+a request that do not depend on each other run at the same time:
+    * /candidates/<job_id>/ - the job and its ETag, then the job's skills and the candidates with an opinion
+    * /candidates/liked/<job_id>/ - the job and its ETag, then the notes and the likes of the job
+    * /job/<job_id>/ - the ETag and the stats of the job
+Matching a job (candidate_finder.match_job) is CPU bound and runs in the pool too, so the event loop keeps serving
+other requests meanwhile. Responses, ETags and query budgets are those of the sync views, and PUT /job/ is handed
+to the sync view.
+"""
+from matcher_app import models, views, utils, candidate_finder, match_cache, job_stats, versions, metrics, ranking, \
+    routers
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import partial, wraps
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.http import HttpResponse, HttpResponseNotAllowed
+from django.utils.cache import get_conditional_response
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+import threading
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """the process-wide pool the ORM work of async views runs in"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.MATCHER_ASYNC_THREADS)
+        return _executor
+
+
+def _call_in_pool(recorder, read_only, func, args, kwargs):
+    try:
+        with ExitStack() as stack:
+            if recorder is not None:  # count the queries for the request (see matcher_app.middleware)
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+            if read_only:
+                stack.enter_context(routers.read_only())
+            return func(*args, **kwargs)
+    finally:
+        close_old_connections()  # pool threads serve no request of their own, so they apply CONN_MAX_AGE here
+
+
+def run_in_pool(request, func, *args, **kwargs):
+    """await func(*args, **kwargs) run in the pool, with its queries recorded for the request and its reads routed
+    like the request's"""
+    recorder = getattr(request, 'query_recorder', None)
+    read_only = getattr(request, 'replica_reads', False)
+    return asyncio.get_event_loop().run_in_executor(get_executor(),
+                                                    partial(_call_in_pool, recorder, read_only, func, args, kwargs))
+
+
+def async_view(methods, budget, sync_view=None, replica_reads=False):
+    """declare the allowed methods and the query budget of an async view
+
+    requests of other methods are handed to sync_view when given, and answered with 405 otherwise. Like the sync
+    views, async views are exempt from CSRF checks (django's csrf_exempt does not support async views in 3.2).
+    With replica_reads, the reads of GET requests go to the replica like with matcher_app.routers.replica_reads.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            request.replica_reads = replica_reads and request.method in routers.READ_METHODS
+            if request.method not in methods:
+                if sync_view is not None:
+                    return await run_in_pool(request, sync_view, request, *args, **kwargs)
+                return HttpResponseNotAllowed(methods)
+            return await view(request, *args, **kwargs)
+
+        wrapper.csrf_exempt = True
+        return metrics.query_budget(budget)(wrapper)
+    return decorator
+
+
+def render(data, status_code=status.HTTP_200_OK, etag=None):
+    """JSON response rendered like the Response of the sync views"""
+    response = HttpResponse(JSONRenderer().render(data), status=status_code, content_type='application/json')
+    if etag is not None:
+        response['ETag'] = etag
+    return response
+
+
+def get_not_modified(request, etag):
+    """304 response if the request's If-None-Match holds etag, None otherwise"""
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response['ETag'] = etag
+    return response
+
+
+def _get_job(job_id):
+    return models.Job.objects.filter(job_id=job_id).first()
+
+
+def _get_cached(cache, job_id):
+    version = cache.get_version(job_id)
+    return version, cache.get(job_id, version)
+
+
+async def find_candidates(request, job_obj):
+    """ranking.RankedCandidates of the job like match_cache.get_or_compute(job_obj, candidate_finder.candidate_finder)
+    - the job's skills and its opinionated candidates are read at the same time"""
+    cache = match_cache.get_cache()
+    version, ranked_candidates = await run_in_pool(request, _get_cached, cache, job_obj.job_id)
+    if ranked_candidates is not None:
+        return ranked_candidates
+
+    job_skills, opinionated_candidates = await asyncio.gather(
+        run_in_pool(request, candidate_finder.get_job_skills_if_known, job_obj),
+        run_in_pool(request, candidate_finder.get_opinionated_candidates, job_obj.job_id))
+    if job_skills is None:
+        ranked_candidates = ranking.RankedCandidates([], [])
+    else:
+        ranked_candidates = await run_in_pool(request, candidate_finder.match_job, job_obj, job_skills,
+                                              opinionated_candidates)
+        await run_in_pool(request, candidate_finder.save_matches, job_obj, ranked_candidates)
+    await run_in_pool(request, cache.set, job_obj.job_id, version, ranked_candidates)
+    return ranked_candidates
+
+
+@async_view(['GET'], budget=17)
+async def get_all_candidates_for_job(request, job_id):
+    """async variant of matcher_app.views.get_all_candidates_for_job"""
+    job_obj, etag = await asyncio.gather(run_in_pool(request, _get_job, job_id),
+                                         run_in_pool(request, versions.candidates_etag, request, job_id))
+    not_modified = get_not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+    if job_obj is None:
+        return render({"detail": "No Job matches the given query."}, status.HTTP_404_NOT_FOUND)
+    if job_obj.status == 'closed':  # do not return any candidates if given job is closed
+        return render([], status.HTTP_204_NO_CONTENT, etag)
+
+    ranked_candidates = await find_candidates(request, job_obj)
+    logger.info(f'Number of candidates for job {job_id}: {len(ranked_candidates)}')
+    if 'stream' in request.GET:
+        response = utils.stream_json_list(ranked_candidates.ranked_ids().tolist())
+        response['ETag'] = etag
+        return response
+
+    if 'limit' in request.GET or 'cursor' in request.GET:
+        try:
+            limit = utils.parse_page_size(request.GET.get('limit'))
+            after = utils.decode_cursor(request.GET.get('cursor'))
+        except ValueError as e:
+            return render(str(e), status.HTTP_400_BAD_REQUEST, etag)
+        page_ids, next_position = ranked_candidates.page(limit, after)
+        return render({"results": page_ids.tolist(), "next_cursor": utils.encode_cursor(next_position)}, etag=etag)
+
+    return render(ranked_candidates.ranked_ids().tolist(), etag=etag)
+
+
+@async_view(['GET'], budget=4, replica_reads=True)
+async def get_data_for_liked_candidates(request, job_id):
+    """async variant of matcher_app.views.get_data_for_liked_candidates"""
+    job_obj, etag = await asyncio.gather(run_in_pool(request, _get_job, job_id),
+                                         run_in_pool(request, versions.liked_candidates_etag, request, job_id))
+    not_modified = get_not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+    if job_obj is None:
+        return render({"detail": "No Job matches the given query."}, status.HTTP_404_NOT_FOUND)
+    if job_obj.status == 'closed':  # do not return any candidates if given job is closed
+        return render([], status.HTTP_204_NO_CONTENT, etag)
+
+    notes_per_candidate, likes = await asyncio.gather(
+        run_in_pool(request, utils.get_notes_per_candidate, job_id),
+        run_in_pool(request, lambda: list(utils.get_likes(job_id))))
+    liked_candidates = utils.attach_notes(job_id, likes, notes_per_candidate)
+    if 'stream' in request.GET:
+        response = utils.stream_json_list(liked_candidates)
+        response['ETag'] = etag
+        return response
+    return render(list(liked_candidates), etag=etag)
+
+
+@async_view(['GET'], budget=5, sync_view=views.handle_given_job, replica_reads=True)
+async def handle_given_job(request, job_id=None):
+    """async variant of matcher_app.views.handle_given_job - status updates (PUT) run the sync view"""
+    if job_id is None:
+        return await run_in_pool(request, views.handle_given_job, request)
+    etag, stats = await asyncio.gather(run_in_pool(request, versions.job_stats_etag, request, job_id),
+                                       run_in_pool(request, job_stats.get_stats, [job_id]))
+    return get_not_modified(request, etag) or render(stats[job_id], etag=etag)
@@ -0,0 +1,60 @@
+"""
+Matching many jobs at once - used by the batch endpoint and `manage.py match_jobs`.
+
+Everything a job's match needs from the database (the job, its skills and the candidates who already received an
+opinion) is loaded for all jobs with one query each, the jobs are matched against the shared in-memory candidate
+index, and the results are persisted and cached together. With workers > 1 the jobs are matched in a pool of
+forked processes, which inherit the already built index instead of loading it again - when the process can fork
+safely (see matcher_app.sharding.can_fork), otherwise in the calling process.
+"""
+from matcher_app import models, utils, candidate_finder, match_index, match_cache, ranking, sharding
+from django.db import connections, transaction
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _match_job_in_worker(task):
+    """pool task - runs in a forked worker process, which uses the index inherited from the parent"""
+    job_obj, job_skills, opinionated_candidates = task
+    index = match_index.get_loaded_index()
+    return job_obj.job_id, candidate_finder.match_job(job_obj, job_skills, opinionated_candidates, index)
+
+
+def match_jobs(job_ids, workers=1, persist=True):
+    """match many jobs at once
+
+    returns ({job id: ranking.RankedCandidates}, ids of jobs that do not exist) - closed jobs and jobs whose skill
+    is unknown get no candidates, just like a single job request
+    """
+    jobs = models.Job.objects.in_bulk(job_ids)
+    missing_job_ids = [job_id for job_id in job_ids if job_id not in jobs]
+    results = {job_id: ranking.RankedCandidates([], []) for job_id in jobs}
+
+    open_jobs = [job_obj for job_obj in jobs.values() if job_obj.status != models.CLOSED]
+    job_skills = candidate_finder.get_skills_for_jobs(open_jobs)
+    open_jobs = [job_obj for job_obj in open_jobs if job_skills[job_obj.job_id] is not None]
+    opinions = candidate_finder.get_opinionated_candidates_for_jobs([job_obj.job_id for job_obj in open_jobs])
+
+    cache = match_cache.get_cache()
+    versions = {job_obj.job_id: cache.get_version(job_obj.job_id) for job_obj in open_jobs}
+    tasks = [(job_obj, job_skills[job_obj.job_id], opinions[job_obj.job_id]) for job_obj in open_jobs]
+    index = match_index.get_index()  # built before forking, so every worker shares it
+    if workers > 1 and len(tasks) > 1 and sharding.can_fork():  # match in this process otherwise
+        connections.close_all()  # forked workers must not share the parent's database connections
+        with sharding.get_fork_context().Pool(min(workers, len(tasks))) as pool:
+            results.update(pool.imap_unordered(_match_job_in_worker, tasks, chunksize=8))
+    else:
+        for job_obj, skills, opinionated_candidates in tasks:
+            results[job_obj.job_id] = candidate_finder.match_job(job_obj, skills, opinionated_candidates, index)
+
+    if persist:  # results are only cached once persisted, since a cache hit skips writing the matches
+        with transaction.atomic():
+            for job_id, ranked_candidates in results.items():
+                if len(ranked_candidates):
+                    utils.add_ranked_candidates_to_table(ranked_candidates.candidate_ids.tolist(), job_id)
+        for job_id, version in versions.items():
+            cache.set(job_id, version, results[job_id])
+
+    logger.info(f'Matched {len(results)} jobs ({len(missing_job_ids)} missing)')
+    return results, missing_job_ids
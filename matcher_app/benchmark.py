@@ -0,0 +1,181 @@
+"""
+Benchmark of the endpoints and the matching stages on synthetic data - used by `manage.py benchmark_matching`.
+
+For every data size the database is flushed and filled by matcher_app.synthetic, then every endpoint is called a
+fixed number of times for randomly picked jobs (the picks are seeded too, so two runs send the same requests).
+The report holds latency percentiles, throughput and SQL queries per request of every endpoint, and the time of
+every candidate_finder stage as recorded by matcher_app.metrics. Reports are plain JSON, so the reports of two
+commits can be compared with compare_reports.
+"""
+from matcher_app import models, synthetic, match_index, match_cache, metrics, skill_registry
+from matcher_app.middleware import QueryRecorder
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client
+import numpy as np
+import subprocess
+import datetime
+import platform
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 90, 99)
+BULK_OPINIONS = 100  # opinions per bulk opinion request
+
+
+def _candidates(job_id, job_ids, candidate_ids, rng):
+    return 'get', f'/candidates/{job_id}/', None
+
+
+def _candidates_page(job_id, job_ids, candidate_ids, rng):
+    return 'get', f'/candidates/{job_id}/?limit=100', None
+
+
+def _liked_candidates(job_id, job_ids, candidate_ids, rng):
+    return 'get', f'/candidates/liked/{job_id}/', None
+
+
+def _job_stats(job_id, job_ids, candidate_ids, rng):
+    return 'get', f'/job/{job_id}/', None
+
+
+def _jobs_stats(job_id, job_ids, candidate_ids, rng):
+    picked = rng.choice(job_ids, size=min(len(job_ids), 20), replace=False)
+    return 'get', f'/jobs/stats/?job_ids={",".join(str(job_id) for job_id in picked)}', None
+
+
+def _opinion(job_id, job_ids, candidate_ids, rng):
+    return 'post', '/candidate/opinion/', {"job_id": job_id, "candidate_id": int(rng.choice(candidate_ids)),
+                                           "is_liked": False}
+
+
+def _bulk_opinions(job_id, job_ids, candidate_ids, rng):
+    picked = rng.choice(candidate_ids, size=min(len(candidate_ids), BULK_OPINIONS), replace=False)
+    return 'post', '/candidate/opinions/', [{"job_id": job_id, "candidate_id": int(candidate_id), "is_liked": False}
+                                            for candidate_id in picked]
+
+
+# (name, request builder, whether the cached matches of the job are dropped before every request)
+ENDPOINTS = (
+    ('candidates_uncached', _candidates, True),
+    ('candidates_cached', _candidates, False),
+    ('candidates_page', _candidates_page, False),
+    ('liked_candidates', _liked_candidates, False),
+    ('job_stats', _job_stats, False),
+    ('jobs_stats', _jobs_stats, False),
+    ('opinion', _opinion, False),
+    ('bulk_opinions', _bulk_opinions, False),
+)
+
+
+def summarize(latencies):
+    """count, mean, max and percentiles of a list of latencies in seconds"""
+    latencies = np.asarray(latencies, dtype=float)
+    summary = {"count": len(latencies), "mean": float(latencies.mean()), "max": float(latencies.max())}
+    summary.update({f'p{p}': float(value) for p, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES))})
+    return summary
+
+
+def benchmark_endpoint(client, build_request, uncached, num_requests, job_ids, candidate_ids, rng):
+    """send num_requests requests and summarize their latency, throughput and SQL queries"""
+    latencies, queries, errors = [], [], 0
+    for _ in range(num_requests):
+        job_id = int(rng.choice(job_ids))
+        method, url, data = build_request(job_id, job_ids, candidate_ids, rng)
+        if uncached:
+            match_cache.get_cache().invalidate_job(job_id)
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            started = time.perf_counter()
+            response = getattr(client, method)(url, data=data, content_type='application/json')
+            latencies.append(time.perf_counter() - started)
+        queries.append(recorder.queries)
+        errors += response.status_code >= 400
+
+    summary = summarize(latencies)
+    summary["throughput"] = num_requests / sum(latencies)
+    summary["queries_per_request"] = float(np.mean(queries))
+    summary["errors"] = errors
+    return summary
+
+
+def stage_summaries():
+    """per stage summary of the candidate_finder stage timers recorded since the metrics were reset"""
+    with metrics.registry.lock:
+        series = dict(metrics.registry.histograms.get('matcher_stage_seconds', {}))
+    summaries = {}
+    for key, histogram in sorted(series.items()):
+        summary = {"count": histogram.count, "mean": histogram.sum / histogram.count}
+        summary.update({f'p{p}': histogram.quantile(p / 100) for p in PERCENTILES})  # estimated from the buckets
+        summaries[dict(key)['stage']] = summary
+    return summaries
+
+
+def run_size(config, num_requests):
+    """benchmark one data size on an emptied database"""
+    call_command('flush', interactive=False, verbosity=0)
+    match_index.reset_index()
+    skill_registry.reset_registry()
+    match_cache.reset_cache()
+
+    started = time.perf_counter()
+    job_ids = synthetic.populate(config)
+    populate_seconds = time.perf_counter() - started
+    candidate_ids = np.array(models.Candidate.objects.values_list('candidate_id', flat=True))
+
+    match_index.reset_index()
+    started = time.perf_counter()
+    match_index.get_index()
+    index_build_seconds = time.perf_counter() - started
+
+    metrics.reset_metrics()
+    client = Client()
+    rng = np.random.RandomState(config.seed + 2)
+    endpoints = {}
+    for name, build_request, uncached in ENDPOINTS:
+        endpoints[name] = benchmark_endpoint(client, build_request, uncached, num_requests, job_ids, candidate_ids,
+                                             rng)
+        logger.info(f'{config.num_candidates} candidates - {name}: p50 {endpoints[name]["p50"] * 1000:.1f}ms')
+    return {"num_candidates": config.num_candidates, "config": config.as_dict(),
+            "populate_seconds": populate_seconds, "index_build_seconds": index_build_seconds,
+            "endpoints": endpoints, "stages": stage_summaries()}
+
+
+def _get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(sizes, num_requests=100, progress=None, **config_options):
+    """benchmark every data size (number of candidates) and return the report
+
+    config_options are passed on to synthetic.SyntheticDataConfig, progress(size report) is called after every size
+    """
+    report = {"created_at": datetime.datetime.utcnow().isoformat() + 'Z', "commit": _get_commit(),
+              "database": connection.vendor, "python": platform.python_version(), "num_requests": num_requests,
+              "sizes": []}
+    for size in sizes:
+        size_report = run_size(synthetic.SyntheticDataConfig(num_candidates=size, **config_options), num_requests)
+        report["sizes"].append(size_report)
+        if progress is not None:
+            progress(size_report)
+    return report
+
+
+def compare_reports(old, new, percentile='p50'):
+    """[(number of candidates, endpoint, old latency, new latency, new / old)] for the sizes and endpoints of both"""
+    old_sizes = {size["num_candidates"]: size for size in old["sizes"]}
+    rows = []
+    for size in new["sizes"]:
+        old_size = old_sizes.get(size["num_candidates"])
+        if old_size is None:
+            continue
+        for name, summary in size["endpoints"].items():
+            if name in old_size["endpoints"]:
+                old_latency, new_latency = old_size["endpoints"][name][percentile], summary[percentile]
+                rows.append((size["num_candidates"], name, old_latency, new_latency, new_latency / old_latency))
+    return rows
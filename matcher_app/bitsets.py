@@ -0,0 +1,61 @@
+"""
+Packed candidate bitsets - bit i of a bitset is set when candidate id i is a member.
+
+A bitset is a little endian array of uint64 words, so ANDing or ORing the bitsets of two skills over a million
+candidates touches 16k words instead of two sorted lists of ids. Bitsets of different lengths are combined as if
+the shorter one was padded with zeros (candidates created after it was built are not members).
+"""
+import numpy as np
+
+WORD_DTYPE = np.dtype('<u8')
+WORD_BITS = 64
+EMPTY_BITSET = np.zeros(0, dtype=WORD_DTYPE)
+POPCOUNT_TABLE = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+
+def from_ids(ids, num_bits):
+    """bitset of num_bits bits with the bits of the given candidate ids set"""
+    members = np.zeros(-(-num_bits // WORD_BITS) * WORD_BITS, dtype=bool)
+    members[np.asarray(ids, dtype=np.int64)] = True
+    return np.packbits(members, bitorder='little').view(WORD_DTYPE)
+
+
+def to_ids(bitset):
+    """sorted ids of the members of the bitset"""
+    return np.flatnonzero(np.unpackbits(bitset.view(np.uint8), bitorder='little')).astype(np.int32)
+
+
+def popcount(bitset):
+    """number of members of the bitset"""
+    return int(POPCOUNT_TABLE[bitset.view(np.uint8)].sum(dtype=np.int64))
+
+
+def contains(bitset, ids):
+    """boolean array telling which of the given ids are members of the bitset"""
+    ids = np.asarray(ids, dtype=np.int64)
+    words = ids >> 6
+    inside = words < len(bitset)
+    result = np.zeros(len(ids), dtype=bool)
+    bits = bitset[words[inside]] >> (ids[inside] & 63).astype(np.uint64)
+    result[inside] = (bits & np.uint64(1)).astype(bool)
+    return result
+
+
+def intersect(bitsets):
+    """AND of the given bitsets - the sparsest ones first, stopping as soon as nothing is left"""
+    bitsets = sorted(bitsets, key=popcount)
+    result = bitsets[0].copy()
+    for bitset in bitsets[1:]:
+        length = min(len(result), len(bitset))
+        result = result[:length] & bitset[:length]
+        if not result.any():
+            break
+    return result
+
+
+def union(bitsets):
+    """OR of the given bitsets"""
+    result = np.zeros(max((len(bitset) for bitset in bitsets), default=0), dtype=WORD_DTYPE)
+    for bitset in bitsets:
+        result[:len(bitset)] |= bitset
+    return result
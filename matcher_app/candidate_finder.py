@@ -1,110 +1,249 @@
 """
-The naive approach taken below checks for a match based on title matching (or some substring
-of the title matching) as well as a skills match.
+Candidates are matched on their title as well as their skills.
 
-A more advanced approach for this use case would be to use fuzzy matching. Since the goal is to link some text
-(candidate job title / skills) with the target job title / skill, we can try to identify non-exact matches
-between the two.
-
-We can do this by calculating the Levenshtein Distance representing the number of transformations required to get
-from the source string to the target string, with a lower distance representing a higher match probability.
+Titles are matched with fuzzy matching: since the goal is to link some text (candidate job title) with the target job
+title, we try to identify non-exact matches between the two. Every word of the job title is compared with the words
+of all candidate titles using the Levenshtein Distance - the number of transformations required to get from the
+source string to the target string, with a lower distance representing a higher match probability. This tolerates
+typos ("Sofware Engneer") and titles of any length. The lookup goes through a BK-tree over the distinct title words
+(matcher_app.fuzzy), so the job title is never compared against every candidate.
 
 The downside to this approach is that it does not account for relevance, and misspellings / typos could completely
 transform the meaning of the word. This would be problematic when comparing "Developer" to "Engineer".
 Even though the two words are very similar job wise, the Levenshtein distance would be large between the two.
+Candidates whose title is similar in meaning (TF-IDF vectors with a synonym table, matcher_app.title_similarity)
+are therefore matched as well.
 """
-from matcher_app import utils, models
-from django.db.models import Q
+from matcher_app import models, match_index, match_writer, ranking, metrics, title_similarity, sharding, \
+    cooccurrence, skill_registry, history, fuzzy
+from django.conf import settings
+import numpy as np
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-def rank_final_candidates(final_candidates, job_obj):
-    """This function shows at a high level how to approach ranking all candidates that have been matched"""
-    # candidate1_skills = ["ruby", "javascript"]  # 0 points
-    # candidate2_skills = ["cobalt", "azure"]  # 99 points
-
-    # job_skills = ["cobalt"] --> working under assumption for this exercise that job contains only 1 skill
-    # job_probabilities = [1] # represented as %
+def rank_final_candidates(final_candidates, job_skills, title_matches=None, index=None):
+    """rank the matched candidates by the weighted rarity of their skills, discounting the skills implied by another
+    skill of the candidate (see matcher_app.ranking)
     """
-    We can assign probabilities to each job skill - for example, we assume 70% of 
-    candidates know python, while only 1% know cobalt. 
-    
-    We can convert each skill into points based on this percentage (ex: 70% --> 30 points, 1% --> 99 points) and 
-    sum the total points for each candidate to create a ranking. This rewards candidates who 
-    have a skill that is less common and presumably also more difficult to learn. 
-
-    There are a few problems with this approach:
-    1. It is linear - the maximum points that can be given for a given skill with this method
-    is 99 points. It would be better for the point system to be exponential, where a skill 
-    that a smaller percentage of candidates have is represented by a greater number of points
-    
-    2. It does not take into account conditional probabilities: for example, a candidate 
-    who has skills of django and python, where django is conditional on knowing python
-    """
-    return final_candidates
+    scores = ranking.score_candidates(final_candidates, job_skills.weights, title_matches, index)
+    return ranking.RankedCandidates(final_candidates, scores)
 
 
-def get_matches_from_job_title(job_obj):
-    """check for identical or partial match with certain substring (ex: Software Engineer / Software Developer)"""
-    job_title = models.Job.objects.get(job_id=job_obj.job_id).title
-    title_list = job_title.split()
-    if len(title_list) == 2:  # naive approach - assuming all titles are max 2 words
-        query_set_titles = models.Candidate.objects.filter(
-            (Q(title__icontains=title_list[0]) | Q(title__icontains=title_list[1])))
-    else:
-        query_set_titles = models.Candidate.objects.filter(title=job_title)
+def get_matches_from_job_title(job_obj, max_distance=None, index=None):
+    """fuzzy match of the job title against all candidate titles (ex: Software Engineer / Sofware Developer)
 
-    return query_set_titles
+    returns (candidate ids, title similarity) ranked by similarity - the best of the typo tolerant similarity
+    (see matcher_app.match_index.get_similar_titles) and of the similarity in meaning (matcher_app.title_similarity)
+    """
+    if max_distance is None:
+        max_distance = settings.MATCHER_TITLE_MAX_DISTANCE
+    index = index or match_index.get_index()
+    candidate_ids, similarities = index.get_fuzzy_title_matches(job_obj.title, max_distance)
+    if not settings.MATCHER_TITLE_SIMILARITY:
+        return candidate_ids, similarities
 
+    similar_ids, similar_similarities = title_similarity.get_similar_title_matches(job_obj.title, index)
+    candidate_ids = np.concatenate((candidate_ids, similar_ids))
+    similarities = np.concatenate((similarities, similar_similarities))
+    order = np.lexsort((-similarities, candidate_ids))  # by id, best similarity first
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = candidate_ids[order][1:] != candidate_ids[order][:-1]
+    best = order[first]
+    best = best[np.lexsort((candidate_ids[best], -similarities[best]))]
+    return candidate_ids[best], similarities[best]
 
-def get_matches_from_skill(job_obj):
-    """checks for candidates who have the skill required for the job"""
-    skill_to_check = job_obj.skill.capitalize()
-    skill_id = models.Skill.objects.get(skill_name=skill_to_check).id
-    query_set_skills = models.Candidate.objects.filter(skills=skill_id)
 
-    return query_set_skills
+class JobSkills:
+    """the skills a job asks for - {skill id: weight} and the ids of the skills a candidate must have"""
 
+    def __init__(self, weights, required):
+        self.weights = weights
+        self.required = sorted(required)
 
-def check_if_opinions_exist_for_candidates(potential_candidates):
-    """ensures the final list of matched candidates does not include candidates who received an opinion"""
-    final_candidates = []
-    for candidate in potential_candidates:
-        like_opinion = next(iter(models.Like.objects.filter(candidate_id=candidate)), None)
-        dislike_opinion = next(iter(models.Dislike.objects.filter(candidate_id=candidate)), None)
+    @property
+    def optional(self):
+        return sorted(skill_id for skill_id in self.weights if skill_id not in self.required)
 
-        if not dislike_opinion and not like_opinion:  # if no opinions (good or bad) exist for potential candidate
-            final_candidates.append(candidate)
+    def __eq__(self, other):
+        return isinstance(other, JobSkills) and (self.weights, self.required) == (other.weights, other.required)
 
-    return final_candidates
+    def __repr__(self):
+        return f'JobSkills({self.weights}, required={self.required})'
 
 
-def candidate_finder(job_obj):
-    """utility function to evaluate matches for given job_id"""
-    ranked_candidates = []
-    try:
-        # for a more accurate approach -> implement levenshtein distance algorithm as described at the top of the file
-        matching_title_candidates = get_matches_from_job_title(job_obj)
-        matching_skills_candidates = get_matches_from_skill(job_obj)
+def get_job_skills(job_obj):
+    """skills of the job as JobSkills - its JobSkill rows, or the single required Job.skill of jobs without any
 
+    Job.skill is resolved by name or alias in the skill registry (matcher_app.skill_registry)
+    """
+    job_skills = models.JobSkill.objects.filter(job_id_id=job_obj.job_id).values_list('skill_id_id', 'weight',
+                                                                                       'required')
+    if job_skills:
+        return JobSkills({skill_id: weight for skill_id, weight, _ in job_skills},
+                         [skill_id for skill_id, _, required in job_skills if required])
+    skill_id = skill_registry.resolve(job_obj.skill)
+    if skill_id is None:
+        raise models.Skill.DoesNotExist(f'Unknown skill {job_obj.skill}')
+    return JobSkills({skill_id: 1.0}, [skill_id])
+
+
+def get_skills_for_jobs(job_objs):
+    """{job id: JobSkills as returned by get_job_skills} for many jobs with one query - None for unknown skills"""
+    weights, required = {}, {}
+    rows = models.JobSkill.objects.filter(job_id_id__in=[job_obj.job_id for job_obj in job_objs])
+    for job_id, skill_id, weight, is_required in rows.values_list('job_id_id', 'skill_id_id', 'weight', 'required'):
+        weights.setdefault(job_id, {})[skill_id] = weight
+        if is_required:
+            required.setdefault(job_id, []).append(skill_id)
+    job_skills = {job_id: JobSkills(weights[job_id], required.get(job_id, [])) for job_id in weights}
+
+    legacy_jobs = [job_obj for job_obj in job_objs if job_obj.job_id not in job_skills]
+    skill_ids = skill_registry.get_registry().resolve_many({job_obj.skill for job_obj in legacy_jobs})
+    for job_obj in legacy_jobs:
+        skill_id = skill_ids.get(job_obj.skill)
+        job_skills[job_obj.job_id] = JobSkills({skill_id: 1.0}, [skill_id]) if skill_id is not None else None
+    return job_skills
+
+
+def get_matches_from_skill(job_skills, index=None):
+    """ids of the candidates who have every required skill of the job (any of its skills if none is required)"""
+    index = index or match_index.get_index()
+    return index.get_requirement_matches(job_skills.required, job_skills.optional)
+
+
+def get_jobs_with_skills(skill_ids):
+    """ids of the open jobs asking for any of the given skills - through their JobSkill rows or their Job.skill"""
+    skill_ids = {int(skill_id) for skill_id in skill_ids}
+    if not skill_ids:
+        return set()
+    open_jobs = models.Job.objects.exclude(status=models.CLOSED)
+    job_ids = set(models.JobSkill.objects.filter(skill_id_id__in=skill_ids, job_id__in=open_jobs)
+                  .values_list('job_id_id', flat=True))
+    legacy_jobs = list(open_jobs.filter(jobskill__isnull=True).values_list('job_id', 'skill'))
+    resolved = skill_registry.get_registry().resolve_many({skill for _, skill in legacy_jobs})
+    job_ids.update(job_id for job_id, skill in legacy_jobs if resolved.get(skill) in skill_ids)
+    return job_ids
+
+
+def title_matches_job(job_title, title, max_distance, vectors=None):
+    """whether get_matches_from_job_title may match a candidate title to the job title - a word of the job title is
+    a few typos away from a word of the title, or the titles are similar in meaning (with the title vectors given)"""
+    words = match_index.tokenize_title(title)
+    for token in match_index.tokenize_title(job_title):
+        allowed_distance = min(max_distance, max(len(token) - 1, 0) // 3)  # as in CandidateIndex.get_similar_titles
+        if any(fuzzy.levenshtein(token, word) <= allowed_distance for word in words):
+            return True
+    return vectors is not None and vectors.get_similarity(job_title, title) >= settings.MATCHER_TITLE_MIN_SIMILARITY
+
+
+def get_jobs_matching_titles(titles, vectors=None, max_jobs=None):
+    """ids of the open jobs whose title may match any of the given candidate titles (see title_matches_job) - None
+    when there are more than max_jobs open jobs to go through"""
+    titles = {title for title in titles if title}
+    if not titles:
+        return set()
+    max_distance = settings.MATCHER_TITLE_MAX_DISTANCE
+    open_jobs = models.Job.objects.exclude(status=models.CLOSED).values_list('job_id', 'title')
+    if max_jobs is not None:
+        open_jobs = list(open_jobs[:max_jobs + 1])
+        if len(open_jobs) > max_jobs:
+            return None
+    return {job_id for job_id, job_title in open_jobs
+            if any(title_matches_job(job_title, title, max_distance, vectors) for title in titles)}
+
+
+def get_opinionated_candidates_for_jobs(job_ids):
+    """{job id: ids of candidates who received an opinion for the job} for many jobs at once - a single query"""
+    opinion_fields = ('job_id_id', 'candidate_id_id')
+    liked = models.Like.objects.filter(job_id_id__in=job_ids).order_by().values_list(*opinion_fields)
+    disliked = models.Dislike.objects.filter(job_id_id__in=job_ids).order_by().values_list(*opinion_fields)
+    # opinions compacted by `manage.py compact_history`, for jobs reopened after that
+    compacted = models.HistoryRollup.objects.filter(kind__in=history.OPINION_KINDS, job_id__in=job_ids).order_by() \
+        .values_list('job_id', 'candidate_id')
+    opinions = {job_id: [] for job_id in job_ids}
+    for job_id, candidate_id in liked.union(disliked, compacted):
+        opinions[job_id].append(candidate_id)
+    return {job_id: np.unique(np.array(candidate_ids, dtype=match_index.ID_DTYPE))
+            for job_id, candidate_ids in opinions.items()}
+
+
+def get_opinionated_candidates(job_id):
+    """ids of all candidates who received an opinion (like or dislike) for the given job - a single query"""
+    return get_opinionated_candidates_for_jobs([job_id])[job_id]
+
+
+def check_if_opinions_exist_for_candidates(potential_candidates, job_id):
+    """ensures the final list of matched candidates does not include candidates who received an opinion for the job"""
+    opinionated_candidates = get_opinionated_candidates(job_id)
+    return np.setdiff1d(potential_candidates, opinionated_candidates, assume_unique=True)
+
+
+def match_job(job_obj, job_skills, opinionated_candidates, index=None):
+    """match and rank candidates for a job entirely in memory - returns the ranking.RankedCandidates
+
+    opinionated_candidates holds the ids of the candidates who already received an opinion for the job
+    """
+    with metrics.stage_timer('index'):  # only takes time when the index is (re)built
+        index = index or match_index.get_index()
+    with metrics.stage_timer('title_match'):
+        title_ids, title_similarities = get_matches_from_job_title(job_obj, index=index)
+        by_id = np.argsort(title_ids)
+        title_matches = (title_ids[by_id], title_similarities[by_id])
+    matching_title_candidates = title_matches[0]
+    with metrics.stage_timer('skill_match'):
+        matching_skills_candidates = get_matches_from_skill(job_skills, index)
+
+    if sharding.should_shard(len(matching_title_candidates) + len(matching_skills_candidates)):
+        # broad jobs are filtered and ranked in shards of candidate ids on several cores (see matcher_app.sharding)
+        with metrics.stage_timer('sharded_rank'):
+            return sharding.match_in_shards(title_matches, matching_skills_candidates, opinionated_candidates,
+                                            job_skills, index, cooccurrence.get_model())
+
+    with metrics.stage_timer('opinion_filter'):
         # ideal candidates will match with both title and skill
-        potential_candidates = list(set(matching_title_candidates) & set(matching_skills_candidates))
-        if not potential_candidates:  # if there are no matches for both skills - try taking candidates with only one
-            potential_candidates = list(set(matching_title_candidates) | set(matching_skills_candidates))
+        potential_candidates = np.intersect1d(matching_title_candidates, matching_skills_candidates,
+                                              assume_unique=True)
+        if not len(potential_candidates):  # if there are no matches for both - try taking candidates with only one
+            potential_candidates = np.union1d(matching_title_candidates, matching_skills_candidates)
 
         # If an opinion was expressed for the candidate for this job, remove candidate from final list of candidates
-        final_candidates = check_if_opinions_exist_for_candidates(potential_candidates)
+        final_candidates = np.setdiff1d(potential_candidates, opinionated_candidates, assume_unique=True)
 
-        # rank the final candidates based on how strong the match is to the job
-        ranked_candidates = rank_final_candidates(final_candidates, job_obj)
+    # rank the final candidates based on how strong the match is to the job
+    with metrics.stage_timer('rank'):
+        return rank_final_candidates(final_candidates, job_skills, title_matches, index)
 
-        # save final list of matched candidates to Match table
-        if ranked_candidates:
-            utils.add_ranked_candidates_to_table(ranked_candidates, job_obj.job_id)
 
-    except Exception as e:
-        logger.error(f'Error getting all matching candidates: {e}')
+def get_job_skills_if_known(job_obj):
+    """skills of the job as returned by get_job_skills, or None for a job whose skill is unknown"""
+    try:
+        return get_job_skills(job_obj)
+    except models.Skill.DoesNotExist:
+        logger.warning(f'Unknown skill {job_obj.skill} for job {job_obj.job_id} - no candidates matched')
+        return None
+
+
+def save_matches(job_obj, ranked_candidates):
+    """save final list of matched candidates to Match table (queued for the write-behind worker, see match_writer)"""
+    if len(ranked_candidates):
+        with metrics.stage_timer('persist'):
+            match_writer.save_matches(job_obj.job_id, ranked_candidates.candidate_ids)
+
 
+def candidate_finder(job_obj):
+    """utility function to evaluate matches for given job_id - returns the ranking.RankedCandidates of the job
+
+    a job whose skill is unknown gets no candidates - any other error is raised
+    """
+    with metrics.stage_timer('job_skills'):
+        job_skills = get_job_skills_if_known(job_obj)
+    if job_skills is None:
+        return ranking.RankedCandidates([], [])
+
+    with metrics.stage_timer('opinions'):
+        opinionated_candidates = get_opinionated_candidates(job_obj.job_id)
+    ranked_candidates = match_job(job_obj, job_skills, opinionated_candidates)
+    save_matches(job_obj, ranked_candidates)
     return ranked_candidates
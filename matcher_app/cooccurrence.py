@@ -0,0 +1,260 @@
+"""
+Skill co-occurrence model - how often two skills are held by the same candidate, giving P(skill B | skill A).
+
+The ranking (matcher_app.ranking) uses it to discount redundant skills: a candidate who knows django almost certainly
+knows python, so their python is worth less than the python of a candidate without django.
+
+The model is a sparse matrix of candidate counts per ordered skill pair, stored as sorted int64 pair keys
+(A << 32 | B) with their counts, plus the number of candidates per skill. It is computed from the Candidate.skills
+through table, updated incrementally by the bulk importer (matcher_app.importer) and, when MATCHER_COOCCURRENCE_PATH
+is set, persisted as a compressed .npz file which every worker loads on first use (and again whenever the file
+changes) instead of recomputing it. Without a path the model is kept in memory and recounted over every new candidate
+index (MATCHER_INDEX_MAX_AGE) by the thread building it, while the current model keeps serving. Single candidate edits
+are not applied to the model in between - `manage.py build_skill_cooccurrence` recomputes it from the database.
+Pairs are counted a chunk of candidates at a time, so no more than about PAIR_CHUNK_SIZE of them are held at once.
+"""
+from matcher_app import models, match_index
+from django.conf import settings
+from django.dispatch import receiver
+import numpy as np
+import threading
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+MIN_SUPPORT = 5  # P(B | A) is only trusted once at least this many candidates have skill A
+KEY_SHIFT = np.int64(32)
+PAIR_CHUNK_SIZE = 1 << 22  # about how many skill pairs are materialized at once while counting them
+
+
+def pair_keys(first_skills, second_skills):
+    return (np.asarray(first_skills, dtype=np.int64) << KEY_SHIFT) | np.asarray(second_skills, dtype=np.int64)
+
+
+def row_pairs(indptr):
+    """(entry, partner entry) positions of every ordered pair of entries in the same CSR row, self pairs included
+
+    pairs are grouped by entry, in entry order, and every entry has row length pairs
+    """
+    lengths = np.diff(indptr)
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    pairs_per_entry = lengths[rows]
+    entries = np.repeat(np.arange(len(rows)), pairs_per_entry)
+    offsets = np.arange(len(entries)) - np.repeat(np.cumsum(pairs_per_entry) - pairs_per_entry, pairs_per_entry)
+    partners = indptr[:-1][rows][entries] + offsets
+    return entries, partners
+
+
+def _merge_counts(key_arrays, count_arrays):
+    """(sorted distinct keys, summed counts) of several (keys, counts) arrays"""
+    keys, inverse = np.unique(np.concatenate(key_arrays), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate(count_arrays), minlength=len(keys)).astype(np.int64)
+    return keys, counts
+
+
+def count_row_pairs(indptr, skill_ids):
+    """(sorted pair keys, counts) of the ordered pairs of distinct skills held in the same CSR row
+
+    the rows are counted chunk by chunk, so only about PAIR_CHUNK_SIZE pairs are materialized at once
+    """
+    lengths = np.diff(indptr)
+    row_ends = np.cumsum(lengths * lengths)  # pairs up to the end of every row, self pairs included
+    chunk_ends = np.searchsorted(row_ends, np.arange(PAIR_CHUNK_SIZE, row_ends[-1] if len(row_ends) else 0,
+                                                     PAIR_CHUNK_SIZE), side='right')
+    keys, counts = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    pending_keys, pending_counts, num_pending = [], [], 0
+    for start, end in zip(np.concatenate(([0], chunk_ends)), np.concatenate((chunk_ends, [len(lengths)]))):
+        if start == end:  # a row of more than PAIR_CHUNK_SIZE pairs, counted as a chunk of its own
+            continue
+        entries, partners = row_pairs(indptr[start:end + 1] - indptr[start])
+        chunk_skills = skill_ids[indptr[start]:indptr[end]]
+        distinct = entries != partners
+        chunk_keys, chunk_counts = np.unique(pair_keys(chunk_skills[partners[distinct]],
+                                                       chunk_skills[entries[distinct]]), return_counts=True)
+        pending_keys.append(chunk_keys)
+        pending_counts.append(chunk_counts)
+        num_pending += len(chunk_keys)
+        if num_pending > PAIR_CHUNK_SIZE:
+            keys, counts = _merge_counts([keys] + pending_keys, [counts] + pending_counts)
+            pending_keys, pending_counts, num_pending = [], [], 0
+    if pending_keys:
+        keys, counts = _merge_counts([keys] + pending_keys, [counts] + pending_counts)
+    return keys, counts
+
+
+class SkillCooccurrence:
+    """candidate counts per ordered skill pair and per skill - see the module docstring"""
+
+    def __init__(self, keys=None, counts=None, skill_counts=None, num_candidates=0):
+        self.keys = keys if keys is not None else np.zeros(0, dtype=np.int64)
+        self.counts = counts if counts is not None else np.zeros(0, dtype=np.int64)
+        self.skill_counts = skill_counts if skill_counts is not None else np.zeros(0, dtype=np.int64)
+        self.num_candidates = num_candidates
+        self.loaded_at = None
+
+    def copy(self):
+        return SkillCooccurrence(self.keys.copy(), self.counts.copy(), self.skill_counts.copy(), self.num_candidates)
+
+    def add(self, indptr, skill_ids):
+        """count the candidates given as CSR rows (indptr, skill ids) - every row holds distinct skill ids"""
+        indptr = np.asarray(indptr, dtype=np.int64)
+        skill_ids = np.asarray(skill_ids, dtype=np.int64)
+        new_keys, new_counts = count_row_pairs(indptr, skill_ids)
+        self.keys, self.counts = _merge_counts((self.keys, new_keys), (self.counts, new_counts))
+
+        if len(skill_ids):
+            added = np.bincount(skill_ids)
+            skill_counts = np.zeros(max(len(added), len(self.skill_counts)), dtype=np.int64)
+            skill_counts[:len(self.skill_counts)] = self.skill_counts
+            skill_counts[:len(added)] += added
+            self.skill_counts = skill_counts
+        self.num_candidates += len(indptr) - 1
+        return self
+
+    def conditional_probabilities(self, given_skills, skills):
+        """P(skills[i] | given_skills[i]) for two parallel arrays of skill ids - 0 below MIN_SUPPORT"""
+        given_skills = np.asarray(given_skills, dtype=np.int64)
+        keys = pair_keys(given_skills, skills)
+        positions = np.minimum(np.searchsorted(self.keys, keys), max(len(self.keys) - 1, 0))
+        found = self.keys[positions] == keys if len(self.keys) else np.zeros(len(keys), dtype=bool)
+        given_counts = np.zeros(len(given_skills), dtype=np.int64)
+        known = given_skills < len(self.skill_counts)
+        given_counts[known] = self.skill_counts[given_skills[known]]
+        supported = found & (given_counts >= MIN_SUPPORT)
+        probabilities = np.zeros(len(keys))
+        probabilities[supported] = self.counts[positions[supported]] / given_counts[supported]
+        return probabilities
+
+    def get_redundancy(self, indptr, skill_ids, weights):
+        """for every entry of the CSR rows (indptr, skill ids), the largest P(skill | other skill of the row)
+
+        only skills worth more (by weights, then by lower id) explain away a skill, so of two skills that always
+        come together the rarer one keeps its full value
+        """
+        if not len(skill_ids):
+            return np.zeros(0)
+        skill_ids = np.asarray(skill_ids, dtype=np.int64)
+        entries, partners = row_pairs(indptr)
+        skills, others = skill_ids[entries], skill_ids[partners]
+        skill_weights, other_weights = weights[skills], weights[others]
+        explains = (other_weights > skill_weights) | ((other_weights == skill_weights) & (others < skills))
+        probabilities = np.zeros(len(entries))
+        probabilities[explains] = self.conditional_probabilities(others[explains], skills[explains])
+        pairs_per_entry = np.diff(indptr)[np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))]
+        starts = np.cumsum(pairs_per_entry) - pairs_per_entry  # every entry has at least its self pair
+        return np.maximum.reduceat(probabilities, starts)
+
+    def save(self, path):
+        """write the model to path as a compressed .npz, replacing the file atomically"""
+        temporary_path = f'{path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'wb') as output:
+            np.savez_compressed(output, keys=self.keys, counts=self.counts.astype(np.int32),
+                                skill_counts=self.skill_counts, num_candidates=self.num_candidates)
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['keys'], data['counts'].astype(np.int64), data['skill_counts'],
+                       int(data['num_candidates']))
+
+    @classmethod
+    def build(cls):
+        """count every candidate's skills from the database"""
+        started = time.monotonic()
+        links = models.Candidate.skills.through.objects.values_list('candidate_id', 'skill_id')
+        link_array = np.fromiter((value for link in links.iterator() for value in link), dtype=np.int64)
+        link_candidates, link_skills = link_array[0::2], link_array[1::2]
+        order = np.lexsort((link_skills, link_candidates))
+        link_candidates, link_skills = link_candidates[order], link_skills[order]
+        _, starts = np.unique(link_candidates, return_index=True)
+        model = cls().add(np.append(starts, len(link_candidates)), link_skills)
+        logger.info(f'Built skill co-occurrence model of {model.num_candidates} candidates with '
+                    f'{len(model.keys)} skill pairs in {time.monotonic() - started:.2f}s')
+        return model
+
+    @classmethod
+    def from_index(cls, index):
+        """count every candidate's skills from a candidate index (matcher_app.match_index), without reading the
+        database"""
+        started = time.monotonic()
+        with index.lock:
+            indptr, skill_ids = index.rows.get_skill_matrix(index.rows.get_candidate_ids())
+        lengths = np.diff(indptr)
+        model = cls().add(np.concatenate(([0], np.cumsum(lengths[lengths > 0]))), skill_ids)
+        logger.info(f'Counted skill co-occurrences of {model.num_candidates} candidates with '
+                    f'{len(model.keys)} skill pairs in {time.monotonic() - started:.2f}s')
+        return model
+
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def _get_path():
+    return getattr(settings, 'MATCHER_COOCCURRENCE_PATH', None)
+
+
+def _is_stale(model, path):
+    """a model whose file changed - the in-memory model is rebuilt with the index (see rebuild_model)"""
+    return path is not None and os.path.exists(path) and model.loaded_at != os.path.getmtime(path)
+
+
+def get_model():
+    """return the process-wide model - loaded from MATCHER_COOCCURRENCE_PATH when it exists, built on first use
+    otherwise"""
+    global _model
+    model = _model
+    path = _get_path()
+    if model is None or _is_stale(model, path):
+        with _model_lock:
+            if _model is model:
+                if path is not None and os.path.exists(path):
+                    model = SkillCooccurrence.load(path)
+                    model.loaded_at = os.path.getmtime(path)
+                else:
+                    model = SkillCooccurrence.build()
+                    if path is not None:
+                        model.save(path)
+                        model.loaded_at = os.path.getmtime(path)
+                    else:
+                        model.loaded_at = time.monotonic()
+                _model = model
+    return _model
+
+
+@receiver(match_index.index_built)
+def rebuild_model(sender, index, **kwargs):
+    """recount the in-memory model over a new candidate index in the thread building it, and swap it in once counted -
+    a model read from MATCHER_COOCCURRENCE_PATH is reloaded when the file changes instead"""
+    global _model
+    if _get_path() is not None:
+        return
+    model = SkillCooccurrence.from_index(index)
+    model.loaded_at = time.monotonic()
+    _model = model
+
+
+def get_loaded_model():
+    """return the process-wide model if it has already been loaded, without loading it"""
+    return _model
+
+
+def save_model(model):
+    """persist the model to MATCHER_COOCCURRENCE_PATH (if set) and make it the process-wide model"""
+    global _model
+    path = _get_path()
+    if path is not None:
+        model.save(path)
+        model.loaded_at = os.path.getmtime(path)
+    elif model.loaded_at is None:
+        model.loaded_at = time.monotonic()
+    _model = model
+
+
+def reset_model():
+    """drop the process-wide model (used by tests)"""
+    global _model
+    _model = None
@@ -0,0 +1,64 @@
+"""
+Typo tolerant string lookup - Levenshtein distance and a BK-tree over a vocabulary of words.
+
+A BK-tree stores every word under its parent at the edge labelled with their edit distance. Since the
+Levenshtein distance is a metric, a search for words within distance k of a query only has to descend into
+children whose edge label is within k of the distance between the query and the current node (triangle
+inequality), which avoids comparing the query against every word in the vocabulary.
+"""
+
+
+def levenshtein(source, target):
+    """number of single character insertions, deletions and substitutions needed to turn source into target"""
+    if len(source) < len(target):
+        source, target = target, source
+    previous_row = list(range(len(target) + 1))
+    for i, source_char in enumerate(source, 1):
+        current_row = [i]
+        for j, target_char in enumerate(target, 1):
+            current_row.append(min(previous_row[j] + 1,  # deletion
+                                   current_row[j - 1] + 1,  # insertion
+                                   previous_row[j - 1] + (source_char != target_char)))  # substitution
+        previous_row = current_row
+    return previous_row[-1]
+
+
+class BKTree:
+    """BK-tree over a growing vocabulary of words - see the module docstring"""
+
+    def __init__(self, words=()):
+        self.root = None  # every node is [word, {distance: child node}]
+        self.size = 0
+        for word in words:
+            self.add(word)
+
+    def add(self, word):
+        if self.root is None:
+            self.root = [word, {}]
+            self.size = 1
+            return
+        node = self.root
+        while True:
+            distance = levenshtein(word, node[0])
+            if distance == 0:  # already in the tree
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [word, {}]
+                self.size += 1
+                return
+            node = child
+
+    def search(self, word, max_distance):
+        """all (word, distance) pairs in the tree within max_distance of word, closest first"""
+        matches = []
+        pending = [self.root] if self.root is not None else []
+        while pending:
+            node_word, children = pending.pop()
+            distance = levenshtein(word, node_word)
+            if distance <= max_distance:
+                matches.append((node_word, distance))
+            for edge, child in children.items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    pending.append(child)
+        return sorted(matches, key=lambda match: (match[1], match[0]))
@@ -0,0 +1,205 @@
+"""
+Retention of the like, dislike and match tables (`manage.py compact_history`).
+
+Rows of closed jobs older than MATCHER_HISTORY_RETENTION_DAYS leave the hot tables in batches of
+MATCHER_HISTORY_BATCH_SIZE rows, each in a short transaction of its own:
+    * the rows are selected FOR UPDATE SKIP LOCKED, so concurrent runs compact different rows
+    * the rows are rolled up into one HistoryRollup row per kind, job and candidate - the number of rows and the first
+      and last time of the like, dislike or match
+    * the raw rows are archived to a gzipped JSON lines file under MATCHER_HISTORY_ARCHIVE_DIR/<kind>/, named after
+      the first and last row id of the batch (read them back with read_archive) - it is written with a .pending
+      suffix and renamed once the transaction commits. An archive left pending by a run that stopped in between is
+      kept by the next run if its rows were deleted, dropped if they were not (they are archived again)
+    * the rows are deleted without sending signals - the job stats keep counting them (rebuild_job_stats adds the
+      rollups) and closed jobs have no cached matches to invalidate
+
+Open jobs are left alone, since their likes and matches are still served. A closed job that is reopened keeps its
+rolled up opinions out of its matches (candidate_finder.get_opinionated_candidates_for_jobs reads the rollups).
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from matcher_app import models
+from datetime import timedelta
+import logging
+import gzip
+import json
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# kind -> (model, time field)
+HISTORY_MODELS = {
+    'like': (models.Like, 'time_liked'),
+    'dislike': (models.Dislike, 'time_disliked'),
+    'match': (models.Match, 'time_matched'),
+}
+OPINION_KINDS = ('like', 'dislike')
+
+
+def get_cutoff(retention_days=None):
+    """rows older than this are compacted"""
+    retention_days = settings.MATCHER_HISTORY_RETENTION_DAYS if retention_days is None else retention_days
+    return timezone.now() - timedelta(days=retention_days)
+
+
+PENDING_SUFFIX = '.pending'  # archives whose batch may not have committed yet
+
+
+def get_archive_path(directory, kind, first_id, last_id):
+    return os.path.join(directory, kind, f'{kind}-{first_id:012d}-{last_id:012d}.jsonl.gz')
+
+
+def _publish_archive(pending_path):
+    try:
+        os.replace(pending_path, pending_path[:-len(PENDING_SUFFIX)])
+    except FileNotFoundError:  # already published by recover_archives
+        pass
+
+
+def write_archive(path, kind, rows):
+    """write (id, job id, candidate id, time) rows to a gzipped JSON lines file - replaced as a whole"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    with gzip.open(temporary_path, 'wt') as output:
+        for row_id, job_id, candidate_id, row_time in rows:
+            output.write(json.dumps({"kind": kind, "id": row_id, "job_id": job_id, "candidate_id": candidate_id,
+                                     "time": row_time.isoformat()}) + '\n')
+    os.replace(temporary_path, path)
+
+
+def read_archive(kind, directory=None, job_id=None):
+    """archived rows of a kind as dicts, in id order - only those of job_id when given"""
+    directory = os.path.join(directory or settings.MATCHER_HISTORY_ARCHIVE_DIR, kind)
+    if not os.path.isdir(directory):
+        return
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.jsonl.gz'):
+            continue
+        with gzip.open(os.path.join(directory, name), 'rt') as archive:
+            for line in archive:
+                row = json.loads(line)
+                if job_id is None or row["job_id"] == job_id:
+                    yield row
+
+
+def recover_archives(kind, directory):
+    """publish or drop the archives left pending by runs that stopped before renaming them - returns the number
+    published"""
+    model, _ = HISTORY_MODELS[kind]
+    directory = os.path.join(directory, kind)
+    if not os.path.isdir(directory):
+        return 0
+    published = 0
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.jsonl.gz' + PENDING_SUFFIX):
+            continue
+        path = os.path.join(directory, name)
+        with gzip.open(path, 'rt') as archive:
+            row_ids = [json.loads(line)["id"] for line in archive]
+        with transaction.atomic():  # waits for a run still compacting the rows
+            committed = not model.objects.select_for_update().filter(pk__in=row_ids).exists()
+            if not os.path.exists(path):  # published by that run
+                continue
+            if committed:
+                _publish_archive(path)
+                published += 1
+            else:
+                os.remove(path)
+        logger.warning(f'{"Published" if committed else "Dropped"} the pending archive {name}')
+    return published
+
+
+def _roll_up(kind, rows):
+    """add (id, job id, candidate id, time) rows to the rollups of their job and candidate"""
+    summaries = {}
+    for _, job_id, candidate_id, row_time in rows:
+        count, first_time, last_time = summaries.get((job_id, candidate_id), (0, row_time, row_time))
+        summaries[job_id, candidate_id] = (count + 1, min(first_time, row_time), max(last_time, row_time))
+
+    rollups = models.HistoryRollup.objects.select_for_update().filter(
+        kind=kind, job_id__in={job_id for job_id, _ in summaries},
+        candidate_id__in={candidate_id for _, candidate_id in summaries})
+    updated = []
+    for rollup in rollups:
+        summary = summaries.pop((rollup.job_id, rollup.candidate_id), None)
+        if summary is not None:
+            count, first_time, last_time = summary
+            rollup.count += count
+            rollup.first_time, rollup.last_time = min(rollup.first_time, first_time), max(rollup.last_time, last_time)
+            updated.append(rollup)
+    models.HistoryRollup.objects.bulk_update(updated, ['count', 'first_time', 'last_time'])
+    models.HistoryRollup.objects.bulk_create(
+        models.HistoryRollup(kind=kind, job_id=job_id, candidate_id=candidate_id, count=count, first_time=first_time,
+                             last_time=last_time)
+        for (job_id, candidate_id), (count, first_time, last_time) in summaries.items())
+
+
+def _delete_rows(model, row_ids):
+    """delete rows by id without fetching them or sending signals"""
+    quote = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(row_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {quote(model._meta.db_table)} WHERE {quote(model._meta.pk.column)} '
+                       f'IN ({placeholders})', row_ids)
+
+
+def compact_batch(kind, cutoff, directory, batch_size, after_id=0):
+    """roll up, archive and delete the next batch of old rows of closed jobs with ids above after_id - returns the
+    ids of the rows compacted"""
+    model, time_field = HISTORY_MODELS[kind]
+    with transaction.atomic():
+        rows = list(model.objects.select_for_update(skip_locked=True, of=('self',))
+                    .filter(pk__gt=after_id, job_id__status=models.CLOSED, **{f'{time_field}__lt': cutoff})
+                    .order_by('pk').values_list('pk', 'job_id_id', 'candidate_id_id', time_field)[:batch_size])
+        if not rows:
+            return []
+        row_ids = [row[0] for row in rows]
+        pending_path = get_archive_path(directory, kind, row_ids[0], row_ids[-1]) + PENDING_SUFFIX
+        write_archive(pending_path, kind, rows)
+        try:
+            _roll_up(kind, rows)
+            _delete_rows(model, row_ids)
+        except Exception:
+            os.remove(pending_path)  # the rows stay in the table, and are archived again by the next run
+            raise
+        transaction.on_commit(lambda: _publish_archive(pending_path))
+    return row_ids
+
+
+def compact(kinds=tuple(HISTORY_MODELS), retention_days=None, directory=None, batch_size=None, pause=0.0,
+            should_stop=lambda: False):
+    """compact the old rows of closed jobs of every kind, pausing for pause seconds between batches - returns
+    {kind: number of rows compacted}"""
+    cutoff = get_cutoff(retention_days)
+    directory = directory or settings.MATCHER_HISTORY_ARCHIVE_DIR
+    batch_size = batch_size or settings.MATCHER_HISTORY_BATCH_SIZE
+    compacted = {}
+    for kind in kinds:
+        recover_archives(kind, directory)
+        compacted[kind], after_id = 0, 0
+        while not should_stop():
+            started = time.monotonic()
+            row_ids = compact_batch(kind, cutoff, directory, batch_size, after_id)
+            if not row_ids:
+                break
+            compacted[kind] += len(row_ids)
+            after_id = row_ids[-1]
+            logger.info(f'Compacted {len(row_ids)} {kind} rows in {time.monotonic() - started:.3f}s')
+            if len(row_ids) < batch_size:
+                break
+            time.sleep(pause)
+    return compacted
+
+
+def run_scheduler(every, should_stop=lambda: False, **options):
+    """compact every `every` seconds until should_stop() is true - returns {kind: number of rows compacted}"""
+    total = dict.fromkeys(options.get('kinds', HISTORY_MODELS), 0)
+    while not should_stop():
+        for kind, count in compact(should_stop=should_stop, **options).items():
+            total[kind] += count
+        deadline = time.monotonic() + every
+        while not should_stop() and time.monotonic() < deadline:
+            time.sleep(min(1.0, every))
+    return total
@@ -0,0 +1,232 @@
+"""
+Bulk import of candidates - used by `manage.py import_candidates`.
+
+Rows are read lazily from JSONL ({"title": ..., "skills": [...]}) or CSV (title,skills with the skills separated by
+';') files and written in chunks: each chunk is saved with one bulk_create of candidates and one of
+candidate-skill links inside its own transaction, so memory stays bounded by the chunk size whatever the file size.
+Lines that are not a candidate (e.g. skills given as a string) are reported with their line number and skipped.
+Skills are looked up by name or alias in the skill registry (matcher_app.skill_registry) and created the first time
+they are seen.
+
+bulk_create sends no signals, so the in-memory index is updated after every committed chunk, and the cached matches
+are invalidated and the candidates version (matcher_app.versions) bumped once at the end of the import. The skill
+co-occurrence model (matcher_app.cooccurrence) is loaded before the first chunk, counts the skills of every chunk and
+is saved once at the end.
+"""
+from matcher_app import models, match_index, match_cache, cooccurrence, versions, skill_registry
+from django.db import connection, transaction
+from django.db.models import Max
+from itertools import islice
+import numpy as np
+import logging
+import json
+import csv
+
+logger = logging.getLogger(__name__)
+
+CSV_SKILL_SEPARATOR = ';'
+TITLE_MAX_LENGTH = models.Candidate._meta.get_field('title').max_length
+
+
+def normalize_skill_name(name):
+    """the form new skill names are stored in - single spaced and capitalized"""
+    return ' '.join(str(name).split()).capitalize()
+
+
+class InvalidRow(ValueError):
+    """a line of an import file that is not a candidate"""
+
+
+class InvalidLines:
+    """the first `limit` invalid lines reported by a reader as (line number, message), and the number of them all -
+    passed as the errors of a reader, so a file of invalid lines takes no more memory than a valid one"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.lines = []
+        self.count = 0
+
+    def append(self, line):
+        self.count += 1
+        if len(self.lines) < self.limit:
+            self.lines.append(line)
+
+
+def _report_invalid(errors, line_number, message):
+    logger.warning(f'Skipping line {line_number}: {message}')
+    if errors is not None:
+        errors.append((line_number, message))
+
+
+def parse_jsonl_row(line):
+    """(title, skill names) of a JSONL line - raises InvalidRow when it is not a candidate"""
+    try:
+        row = json.loads(line)
+    except ValueError as error:
+        raise InvalidRow(f'invalid JSON ({error})')
+    if not isinstance(row, dict):
+        raise InvalidRow('not an object')
+    title, skills = row.get('title'), row.get('skills')
+    if not isinstance(title, str):
+        raise InvalidRow('"title" is not a string')
+    if skills is None:
+        skills = []
+    if not isinstance(skills, list) or not all(isinstance(skill, str) for skill in skills):
+        raise InvalidRow('"skills" is not a list of strings')
+    return title, skills
+
+
+def read_jsonl(lines, errors=None):
+    """yield (title, skill names) for every non empty line of a JSONL file
+
+    invalid lines are logged and skipped, and added to errors as (line number, message) when given
+    """
+    for line_number, line in enumerate(lines, 1):
+        if line.strip():
+            try:
+                yield parse_jsonl_row(line)
+            except InvalidRow as error:
+                _report_invalid(errors, line_number, str(error))
+
+
+def read_csv(lines, errors=None):
+    """yield (title, skill names) for every row of a CSV file with a title and a skills column
+
+    rows with missing or extra columns are logged and skipped, and added to errors as (line number, message) when
+    given - as is the whole file when it has no title column
+    """
+    reader = csv.DictReader(lines)
+    if 'title' not in (reader.fieldnames or ()):
+        _report_invalid(errors, 1, 'no title column')
+        return
+    for row in reader:
+        if None in row or None in row.values():
+            _report_invalid(errors, reader.line_num, f'expected {len(reader.fieldnames)} columns')
+            continue
+        skills = row.get('skills') or ''
+        yield row['title'], [skill for skill in skills.split(CSV_SKILL_SEPARATOR) if skill.strip()]
+
+
+READERS = {
+    'jsonl': read_jsonl,
+    'csv': read_csv,
+}
+
+
+class SkillCache:
+    """canonical skill name -> skill id through the skill registry, creating the skills that do not exist yet"""
+
+    def __init__(self):
+        self.registry = skill_registry.get_registry()
+        self.ids = {}  # skills created by this import - added to the registry once their chunk commits
+        self.created = 0
+
+    def canonical(self, name):
+        return self.registry.canonical(name)
+
+    def get_ids(self, names):
+        """skill ids for the given canonical names - names the registry does not know are looked up in the database
+        (see SkillRegistry.resolve), and the ones that do not exist there are created with a single query"""
+        ids = {name: self.ids.get(name) or self.registry.resolve(name) for name in names}
+        missing = sorted({normalize_skill_name(name) for name, skill_id in ids.items() if skill_id is None})
+        if missing:
+            models.Skill.objects.bulk_create([models.Skill(skill_name=name) for name in missing],
+                                             ignore_conflicts=True)
+            created = list(models.Skill.objects.filter(skill_name__in=missing).values_list('id', 'skill_name'))
+            for skill_id, name in created:
+                self.ids[skill_registry.normalize(name)] = skill_id
+            transaction.on_commit(lambda: [self.registry.add(skill_id, name) for skill_id, name in created])
+            ids = {name: skill_id or self.ids[name] for name, skill_id in ids.items()}
+            self.created += len(missing)
+        return [ids[name] for name in names]
+
+
+def _can_return_ids():
+    features = connection.features
+    return (getattr(features, 'can_return_rows_from_bulk_insert', False) or
+            getattr(features, 'can_return_ids_from_bulk_insert', False))
+
+
+def _create_candidates(titles):
+    """bulk create candidates with the given titles and return their ids"""
+    candidates = [models.Candidate(title=title) for title in titles]
+    if not _can_return_ids():
+        # the backend (e.g. sqlite) does not return the ids of bulk inserted rows - assign them up front, which
+        # is only safe while nothing else is inserting candidates
+        next_id = (models.Candidate.objects.aggregate(last_id=Max('candidate_id'))['last_id'] or 0) + 1
+        for offset, candidate in enumerate(candidates):
+            candidate.candidate_id = next_id + offset
+    models.Candidate.objects.bulk_create(candidates)
+    return [candidate.candidate_id for candidate in candidates]
+
+
+class ImportResult:
+    """counters of an import"""
+
+    def __init__(self):
+        self.imported = 0
+        self.skipped = 0
+        self.links = 0
+        self.skills_created = 0
+
+
+def import_chunk(rows, skill_cache, result, skill_cooccurrence=None):
+    """save one chunk of (title, skill names) rows in a single transaction and index it once committed
+
+    the skills of the saved candidates are also counted in skill_cooccurrence, if given
+    """
+    titles, skill_lists = [], []
+    for title, skill_names in rows:
+        title = ' '.join(str(title or '').split())
+        if not title or len(title) > TITLE_MAX_LENGTH:
+            result.skipped += 1
+            continue
+        titles.append(title)
+        skill_lists.append(sorted({skill_cache.canonical(name) for name in skill_names if str(name).strip()}))
+    if not titles:
+        return
+
+    with transaction.atomic():
+        all_names = sorted({name for names in skill_lists for name in names})
+        skill_ids = dict(zip(all_names, skill_cache.get_ids(all_names)))
+        skill_lists = [[skill_ids[name] for name in names] for names in skill_lists]
+        candidate_ids = _create_candidates(titles)
+        through = models.Candidate.skills.through
+        links = [through(candidate_id=candidate_id, skill_id=skill_id)
+                 for candidate_id, candidate_skills in zip(candidate_ids, skill_lists) for skill_id in candidate_skills]
+        through.objects.bulk_create(links)
+
+    match_index.apply_update('add_candidates', candidate_ids, titles, skill_lists)
+    if skill_cooccurrence is not None:
+        indptr = np.cumsum([0] + [len(candidate_skills) for candidate_skills in skill_lists])
+        skill_cooccurrence.add(indptr, [skill_id for candidate_skills in skill_lists for skill_id in candidate_skills])
+    result.imported += len(candidate_ids)
+    result.links += len(links)
+
+
+def import_candidates(rows, chunk_size=1000, progress=None):
+    """import an iterable of (title, skill names) rows chunk by chunk
+
+    progress(result) is called after every chunk. Returns an ImportResult.
+    """
+    result = ImportResult()
+    skill_cache = SkillCache()
+    skill_cooccurrence = cooccurrence.get_model().copy()  # swapped in by save_model, readers never see a half update
+    rows = iter(rows)
+    try:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            import_chunk(chunk, skill_cache, result, skill_cooccurrence)
+            if progress is not None:
+                progress(result)
+    finally:
+        result.skills_created = skill_cache.created
+        if result.imported:
+            match_cache.get_cache().invalidate_all()
+            versions.bump(versions.CANDIDATES)
+            cooccurrence.save_model(skill_cooccurrence)
+    logger.info(f'Imported {result.imported} candidates ({result.skipped} skipped, '
+                f'{result.skills_created} new skills)')
+    return result
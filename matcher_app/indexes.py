@@ -0,0 +1,98 @@
+"""
+Indexes behind the hot lookups, and the query plans they give (`manage.py explain_queries`).
+
+    * (job_id, candidate_id) on the like, dislike and note tables - the opinions of a candidate for a job, the
+      opinionated candidates and the notes of a job (declared in the models, the match table's unique constraint
+      covers it)
+    * (job_id, time_liked) on the like table - the liked candidates of a job, newest first
+    * a trigram index on the upper case candidate titles - case insensitive substring search on titles
+      (title__icontains), which a b-tree index cannot serve. Only Postgres has trigram indexes (the pg_trgm
+      extension), so it is created after `manage.py migrate` on Postgres databases that can install the extension.
+"""
+from django.db import DatabaseError, router, transaction, connections
+from matcher_app import models, utils
+import logging
+
+logger = logging.getLogger(__name__)
+
+TRIGRAM_INDEXES = {
+    'candidate_title_trgm_idx': (models.Candidate, 'title'),
+}
+
+
+def create_trigram_indexes(using='default', **kwargs):
+    """post_migrate receiver creating the trigram indexes on Postgres - returns the names of the indexes created"""
+    connection = connections[using]
+    if connection.vendor != 'postgresql' or not router.allow_migrate_model(using, models.Candidate):
+        return []
+    quote = connection.ops.quote_name
+    created = []
+    for name, (model, field_name) in TRIGRAM_INDEXES.items():
+        column = model._meta.get_field(field_name).column
+        try:
+            with transaction.atomic(using=using), connection.cursor() as cursor:
+                cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+                # the expression icontains compares, so the planner can use the index for it
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS {quote(name)} ON {quote(model._meta.db_table)} '
+                               f'USING gin (UPPER({quote(column)}::text) gin_trgm_ops)')
+        except DatabaseError as e:  # e.g. no permission to install the extension
+            logger.warning(f'Could not create trigram index {name}: {e}')
+        else:
+            created.append(name)
+    return created
+
+
+def get_index_names():
+    """names of the indexes added for the hot lookups"""
+    names = [index.name for model in (models.Like, models.Dislike, models.Note) for index in model._meta.indexes]
+    return names + list(TRIGRAM_INDEXES)
+
+
+def get_hot_queries(job_id, candidate_id, title):
+    """{name: queryset} of the lookups the indexes are for, as the views and the matching run them"""
+    opinion_fields = ('job_id_id', 'candidate_id_id')
+    liked = models.Like.objects.filter(job_id_id__in=[job_id]).order_by().values_list(*opinion_fields)
+    disliked = models.Dislike.objects.filter(job_id_id__in=[job_id]).order_by().values_list(*opinion_fields)
+    notes = models.Note.objects.filter(job_id_id=job_id).order_by('id').values_list('candidate_id_id', 'note')
+    return {
+        "liked_candidates": utils.get_likes(job_id),
+        "notes_of_job": notes,
+        "is_liked": models.Like.objects.filter(candidate_id_id=candidate_id, job_id_id=job_id),
+        "is_disliked": models.Dislike.objects.filter(candidate_id_id=candidate_id, job_id_id=job_id),
+        "opinionated_candidates": liked.union(disliked),
+        "match_of_candidate": models.Match.objects.filter(candidate_id_id=candidate_id, job_id_id=job_id),
+        "title_search": models.Candidate.objects.filter(title__icontains=title).values_list('candidate_id'),
+    }
+
+
+def explain(queries, using='default', label='plan'):
+    """{name: query plan} of the querysets, like QuerySet.explain()
+
+    the label is added to the statements as a comment - SQLite reuses the plans of cached statements with the same
+    text, even after their indexes were dropped
+    """
+    connection = connections[using]
+    prefix = connection.ops.explain_query_prefix()
+    plans = {}
+    with connection.cursor() as cursor:
+        for name, queryset in queries.items():
+            sql, params = queryset.using(using).query.sql_with_params()
+            cursor.execute(f'{prefix} {sql} /* {label} */', params)
+            plans[name] = '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+    return plans
+
+
+def explain_report(job_id, candidate_id, title, using='default'):
+    """{name: {"sql", "before", "after"}} - the plans of the hot queries without the indexes of this module and with
+    them. The indexes are dropped in a transaction that is rolled back, which locks the tables meanwhile."""
+    queries = get_hot_queries(job_id, candidate_id, title)
+    after = explain(queries, using, 'after')
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        with connection.cursor() as cursor:
+            for name in get_index_names():
+                cursor.execute(f'DROP INDEX IF EXISTS {connection.ops.quote_name(name)}')
+        before = explain(queries, using, 'before')
+        transaction.set_rollback(True, using=using)
+    return {name: {"sql": str(queryset.query), "before": before[name], "after": after[name]}
+            for name, queryset in queries.items()}
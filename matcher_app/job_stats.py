@@ -0,0 +1,127 @@
+"""
+Materialized per-job counters (models.JobStats) for the job stats endpoint.
+
+The counters are updated in the same transaction as the write they count:
+    * likes, dislikes and notes through the signal handlers in matcher_app.signals
+    * matches by utils.add_ranked_candidates_to_table after every upsert
+
+New jobs get zero counters when they are saved. A job whose counters row does not exist (e.g. created before the
+table existed, or by a bulk insert) gets it counted from the source tables on its first write or read - reads served
+by the replica only count it and leave storing it to the primary. `manage.py rebuild_job_stats` rebuilds all of
+them. Rows compacted by `manage.py compact_history` are counted through their rollups (matcher_app.history).
+"""
+from matcher_app import models, routers
+from django.db import transaction
+from django.db.models import Count, Exists, F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+STATS_FIELDS = ('num_likes', 'num_dislikes', 'num_notes', 'num_matches')
+EMPTY_STATS = dict.fromkeys(STATS_FIELDS, 0)
+
+
+def _per_job(rows, aggregate=None):
+    """subquery of the aggregate (the number of rows by default) over the rows of the outer query's job - 0 without
+    any"""
+    totals = rows.filter(job_id=OuterRef('job_id')).order_by().values('job_id').annotate(total=aggregate or Count('pk'))
+    return Coalesce(Subquery(totals.values('total')), 0, output_field=IntegerField())
+
+
+def _count_expressions():
+    """{field: expression counting it for the job of the outer query} - rows compacted by `manage.py compact_history`
+    are counted through their rollups
+
+    a candidate counts once per job however often it was matched: a rolled up match is only counted when the candidate
+    was not matched again after its job was reopened (it has no row in the Match table)
+    """
+    rollups = models.HistoryRollup.objects.all()
+    live = models.Match.objects.filter(job_id_id=OuterRef('job_id'), candidate_id_id=OuterRef('candidate_id'))
+    return {
+        'num_likes': _per_job(models.Like.objects.all()) + _per_job(rollups.filter(kind='like'), Sum('count')),
+        'num_dislikes': _per_job(models.Dislike.objects.all()) + _per_job(rollups.filter(kind='dislike'), Sum('count')),
+        'num_notes': _per_job(models.Note.objects.all()),
+        'num_matches': _per_job(models.Match.objects.all()) + _per_job(rollups.filter(~Exists(live), kind='match')),
+    }
+
+
+def count_job_stats(job_ids):
+    """{job id: stats} of the given jobs that exist, counted from the source tables without storing them - one query"""
+    rows = models.Job.objects.filter(job_id__in=job_ids).values('job_id', **_count_expressions())
+    return {row.pop('job_id'): row for row in rows}
+
+
+def rebuild_job_stats(job_ids):
+    """recount the stats of the given jobs from the source tables and store them"""
+    stats = count_job_stats(job_ids)
+    with transaction.atomic():
+        models.JobStats.objects.filter(job_id_id__in=list(stats)).delete()
+        models.JobStats.objects.bulk_create([models.JobStats(job_id_id=job_id, **job_stats)
+                                             for job_id, job_stats in stats.items()], ignore_conflicts=True)
+    return stats
+
+
+def create_empty(job_id):
+    """zero counters for a new job, so that its first writes only update them"""
+    models.JobStats.objects.bulk_create([models.JobStats(job_id_id=job_id)], ignore_conflicts=True)
+
+
+def _create_missing(job_ids, deltas=None):
+    """create the counters of jobs without any (e.g. created before the table existed) from the source tables, less
+    the {job id: {field: delta}} the caller is about to add - returns {job id: stats} of those that exist
+
+    the counts include the caller's uncommitted writes but not those of other transactions, so taking them out gives
+    every concurrent first write the same starting point - only one row is inserted and every caller then adds its
+    own deltas to it
+    """
+    stats = count_job_stats(job_ids)
+    for job_id, field_deltas in (deltas or {}).items():
+        for field, delta in field_deltas.items():
+            if job_id in stats:
+                stats[job_id][field] = max(stats[job_id][field] - delta, 0)
+    models.JobStats.objects.bulk_create([models.JobStats(job_id_id=job_id, **job_stats)
+                                         for job_id, job_stats in stats.items()], ignore_conflicts=True)
+    return stats
+
+
+def increment(job_id, field, delta=1):
+    """add delta to one counter of the job - the caller's transaction makes it atomic with the counted write"""
+    updates = {field: F(field) + delta}
+    # without counters a delete is left to the counting that creates them
+    if not models.JobStats.objects.filter(job_id_id=job_id).update(**updates) and delta > 0:
+        _create_missing([job_id], {job_id: {field: delta}})
+        models.JobStats.objects.filter(job_id_id=job_id).update(**updates)
+
+
+def increment_many(deltas):
+    """apply {job id: {field: delta}} with one update per job - used by bulk writes, which send no signals"""
+    missing = {}
+    for job_id, field_deltas in deltas.items():
+        updates = {field: F(field) + delta for field, delta in field_deltas.items() if delta}
+        if updates and not models.JobStats.objects.filter(job_id_id=job_id).update(**updates):
+            missing[job_id] = field_deltas
+    if missing:
+        _create_missing(list(missing), missing)
+        for job_id, field_deltas in missing.items():
+            models.JobStats.objects.filter(job_id_id=job_id).update(
+                **{field: F(field) + delta for field, delta in field_deltas.items() if delta})
+
+
+def set_num_matches(job_id):
+    """recount the matches of the job in the update statement - every candidate once, like rebuild_job_stats"""
+    num_matches = _count_expressions()['num_matches']
+    if not models.JobStats.objects.filter(job_id_id=job_id).update(num_matches=num_matches):
+        _create_missing([job_id])
+        models.JobStats.objects.filter(job_id_id=job_id).update(num_matches=num_matches)
+
+
+def get_stats(job_ids):
+    """{job id: stats} for the given jobs with a single primary key lookup - jobs that do not exist get zeros
+
+    the counters of jobs without any are created - or, when the reads go to the replica (matcher_app.routers),
+    counted without being stored, since the replica may lag behind the primary they would be stored on
+    """
+    rows = models.JobStats.objects.filter(job_id_id__in=job_ids).values('job_id_id', *STATS_FIELDS)
+    stats = {row.pop('job_id_id'): row for row in rows}
+    missing_job_ids = [job_id for job_id in job_ids if job_id not in stats]
+    if missing_job_ids:
+        stats.update((count_job_stats if routers.reads_from_replica() else _create_missing)(missing_job_ids))
+    return {job_id: stats.get(job_id, dict(EMPTY_STATS)) for job_id in job_ids}
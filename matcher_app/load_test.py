@@ -0,0 +1,81 @@
+"""
+Load test of the read endpoints of running servers - used by `manage.py load_test`, e.g. to compare the throughput of
+the ASGI deployment with the WSGI baseline under concurrent requests:
+
+    gunicorn matcher.wsgi -w 4 -b :8000
+    gunicorn matcher.asgi:application -k uvicorn.workers.UvicornWorker -w 4 -b :8001
+    python manage.py load_test wsgi=http://localhost:8000 asgi=http://localhost:8001 --concurrency 1,16,64
+
+Every target first gets each url once, so the servers have built their candidate indexes. Then, for every
+concurrency level, that many clients send the urls back to back until the number of requests is reached. The report
+holds the throughput and latency percentiles (see matcher_app.benchmark.summarize) of every target per level, and the
+throughput of every target relative to the first one, the baseline.
+"""
+from matcher_app import benchmark
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import urlopen
+import datetime
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+ENDPOINTS = ('/candidates/{job_id}/', '/candidates/liked/{job_id}/', '/job/{job_id}/')
+
+
+def get_paths(job_ids, endpoints=ENDPOINTS):
+    """the paths of every endpoint for every job, interleaved so consecutive requests hit different endpoints"""
+    return [endpoint.format(job_id=job_id) for job_id in job_ids for endpoint in endpoints]
+
+
+def fetch(url, timeout=30):
+    """(status code or None on connection errors, seconds) of a GET request"""
+    started = time.perf_counter()
+    try:
+        with urlopen(url, timeout=timeout) as response:
+            response.read()
+            status_code = response.status
+    except HTTPError as e:
+        status_code = e.code
+    except (URLError, OSError):
+        status_code = None
+    return status_code, time.perf_counter() - started
+
+
+def run_level(base_url, paths, concurrency, num_requests, fetch=fetch):
+    """send num_requests requests from concurrency clients and summarize them"""
+    urls = [base_url.rstrip('/') + paths[i % len(paths)] for i in range(num_requests)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        results = list(clients.map(fetch, urls))
+    elapsed = time.perf_counter() - started
+
+    summary = benchmark.summarize([seconds for _, seconds in results])
+    summary["throughput"] = num_requests / elapsed
+    summary["errors"] = sum(status_code is None or status_code >= 400 for status_code, _ in results)
+    return summary
+
+
+def run_load_test(targets, paths, levels, num_requests, progress=None, fetch=fetch):
+    """load test every (name, base url) target at every concurrency level - returns the report
+
+    progress(concurrency, name, summary) is called after every target and level
+    """
+    for _, base_url in targets:
+        for path in paths:
+            fetch(base_url.rstrip('/') + path)
+
+    report = {"created": datetime.datetime.utcnow().isoformat(), "targets": dict(targets), "paths": len(paths),
+              "requests": num_requests, "levels": {}}
+    for concurrency in levels:
+        level = {}
+        for name, base_url in targets:
+            level[name] = run_level(base_url, paths, concurrency, num_requests, fetch)
+            if progress is not None:
+                progress(concurrency, name, level[name])
+        baseline = level[targets[0][0]]["throughput"]
+        for summary in level.values():
+            summary["speedup"] = summary["throughput"] / baseline if baseline else None
+        report["levels"][str(concurrency)] = level
+    return report
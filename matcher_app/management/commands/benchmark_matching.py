@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from matcher_app import benchmark
+import json
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the endpoints and the matching stages on synthetic data in a throwaway test database '
+            'and write a JSON report')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000', help='comma separated numbers of candidates')
+        parser.add_argument('--requests', type=int, default=100, help='requests per endpoint and size')
+        parser.add_argument('--jobs', type=int, default=50, help='number of jobs')
+        parser.add_argument('--skills', type=int, default=200, help='number of distinct skills')
+        parser.add_argument('--titles', type=int, default=100, help='number of distinct candidate titles')
+        parser.add_argument('--zipf', type=float, default=1.1, help='exponent of the skill / title popularity')
+        parser.add_argument('--opinion-density', type=float, default=0.01,
+                            help='share of the candidates that get an opinion for every job')
+        parser.add_argument('--note-density', type=float, default=0.5, help='share of the likes that get a note')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='benchmark_report.json', help='where to write the JSON report')
+        parser.add_argument('--compare', help='an earlier report to compare the median latencies with')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes must be a comma separated list of numbers of candidates')
+
+        def report_size(size_report):
+            self.stdout.write(f'{size_report["num_candidates"]} candidates '
+                              f'(populated in {size_report["populate_seconds"]:.1f}s, '
+                              f'index built in {size_report["index_build_seconds"]:.2f}s)')
+            for name, summary in size_report["endpoints"].items():
+                self.stdout.write(f'  {name:<20} p50 {summary["p50"] * 1000:8.2f}ms  p99 {summary["p99"] * 1000:8.2f}ms'
+                                  f'  {summary["throughput"]:8.1f} req/s  {summary["queries_per_request"]:5.1f} '
+                                  f'queries')
+            for stage, summary in size_report["stages"].items():
+                self.stdout.write(f'  stage {stage:<14} mean {summary["mean"] * 1000:8.2f}ms')
+
+        # the benchmark flushes its database - always run it in a test database, never the configured one
+        setup_test_environment(debug=False)
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            report = benchmark.run_benchmark(
+                sizes, options['requests'], report_size, num_jobs=options['jobs'], num_skills=options['skills'],
+                num_titles=options['titles'], zipf_a=options['zipf'], opinion_density=options['opinion_density'],
+                note_density=options['note_density'], seed=options['seed'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Report written to {options["output"]}'))
+
+        if options['compare']:
+            with open(options['compare']) as previous:
+                rows = benchmark.compare_reports(json.load(previous), report)
+            for num_candidates, name, old_latency, new_latency, ratio in rows:
+                line = (f'{num_candidates:>8} {name:<20} {old_latency * 1000:8.2f}ms -> {new_latency * 1000:8.2f}ms '
+                        f'({ratio:.2f}x)')
+                self.stdout.write(self.style.WARNING(line) if ratio > 1.1 else line)
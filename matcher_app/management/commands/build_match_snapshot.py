@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from matcher_app import match_index
+import os
+
+
+class Command(BaseCommand):
+    help = 'Write a snapshot of the candidate index that workers memory-map at startup instead of loading the tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', help='snapshot directory (default: MATCHER_SNAPSHOT_DIR)')
+
+    def handle(self, *args, **options):
+        directory = options['directory'] or settings.MATCHER_SNAPSHOT_DIR
+        if not directory:
+            raise CommandError('No snapshot directory - pass --directory or set MATCHER_SNAPSHOT_DIR')
+        os.makedirs(directory, exist_ok=True)
+        version = match_index.write_snapshot(directory)
+        self.stdout.write(self.style.SUCCESS(f'Wrote match index snapshot {version} to {directory}'))
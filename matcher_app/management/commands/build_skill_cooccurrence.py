@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from matcher_app import cooccurrence
+
+
+class Command(BaseCommand):
+    help = 'Compute the skill co-occurrence model used by the ranking from the database and save it as a .npz file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='file to write (default: MATCHER_COOCCURRENCE_PATH)')
+
+    def handle(self, *args, **options):
+        path = options['output'] or settings.MATCHER_COOCCURRENCE_PATH
+        if not path:
+            raise CommandError('No output file - pass --output or set MATCHER_COOCCURRENCE_PATH')
+        model = cooccurrence.SkillCooccurrence.build()
+        model.save(path)
+        self.stdout.write(self.style.SUCCESS(f'Saved the co-occurrence of {len(model.keys)} skill pairs over '
+                                             f'{model.num_candidates} candidates to {path}'))
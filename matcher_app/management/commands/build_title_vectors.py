@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from matcher_app import models, title_similarity
+
+
+class Command(BaseCommand):
+    help = 'Train the TF-IDF title vectors over the distinct candidate titles and save them as a .npz file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='file to write (default: MATCHER_TITLE_VECTORS_PATH)')
+        parser.add_argument('--synonyms', help='JSON list of synonym groups (default: MATCHER_TITLE_SYNONYMS_PATH)')
+
+    def handle(self, *args, **options):
+        path = options['output'] or settings.MATCHER_TITLE_VECTORS_PATH
+        if not path:
+            raise CommandError('No output file - pass --output or set MATCHER_TITLE_VECTORS_PATH')
+        titles = models.Candidate.objects.order_by().values_list('title', flat=True).distinct()
+        vectors = title_similarity.TitleVectors.train(titles.iterator(),
+                                                      title_similarity.load_synonyms(options['synonyms']))
+        vectors.save(path)
+        self.stdout.write(self.style.SUCCESS(f'Saved the vectors of {len(vectors.titles)} titles over '
+                                             f'{len(vectors.features)} features to {path}'))
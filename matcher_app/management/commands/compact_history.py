@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from matcher_app import history
+import signal
+
+
+class Command(BaseCommand):
+    help = ('Roll up, archive and delete the likes, dislikes and matches of closed jobs older than the retention '
+            'period - once, or every --every seconds until stopped (SIGTERM / SIGINT)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', action='append', choices=sorted(history.HISTORY_MODELS),
+                            help='table to compact, may be repeated (default: all of them)')
+        parser.add_argument('--retention-days', type=float, default=settings.MATCHER_HISTORY_RETENTION_DAYS,
+                            help='rows older than this many days are compacted')
+        parser.add_argument('--archive-dir', default=settings.MATCHER_HISTORY_ARCHIVE_DIR,
+                            help='directory the raw rows are archived to')
+        parser.add_argument('--batch-size', type=int, default=settings.MATCHER_HISTORY_BATCH_SIZE,
+                            help='rows compacted in one transaction')
+        parser.add_argument('--pause', type=float, default=0.0, help='seconds to wait between batches')
+        parser.add_argument('--every', type=float, help='keep running and compact every this many seconds')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        compact_options = {"kinds": options['kind'] or tuple(history.HISTORY_MODELS),
+                           "retention_days": options['retention_days'], "directory": options['archive_dir'],
+                           "batch_size": options['batch_size'], "pause": options['pause']}
+        if options['every'] is None:
+            compacted = history.compact(**compact_options)
+        else:
+            stopping = []
+            for signal_number in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(signal_number, lambda *args: stopping.append(True))
+            compacted = history.run_scheduler(options['every'], lambda: bool(stopping), **compact_options)
+        summary = ', '.join(f'{count} {kind} rows' for kind, count in compacted.items())
+        self.stdout.write(self.style.SUCCESS(f'Compacted {summary} into {options["archive_dir"]}'))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from matcher_app import models, indexes
+import json
+
+
+class Command(BaseCommand):
+    help = ('Show the query plans of the hot lookups without and with the matcher indexes - the indexes are dropped '
+            'in a transaction that is rolled back, which locks the tables meanwhile, so run it on a copy of the '
+            'production database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job-id', type=int, help='job of the lookups (default: the job of the latest like)')
+        parser.add_argument('--candidate-id', type=int,
+                            help='candidate of the lookups (default: the candidate of the latest like)')
+        parser.add_argument('--title', default='developer', help='text searched for in candidate titles')
+        parser.add_argument('--database', default='default', help='alias of the database to explain the queries on')
+        parser.add_argument('--output', help='also write the plans to this JSON file')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        like = models.Like.objects.using(using).values_list('job_id_id', 'candidate_id_id').first()
+        job_id = options['job_id'] or (like[0] if like else None)
+        candidate_id = options['candidate_id'] or (like[1] if like else None)
+        if job_id is None or candidate_id is None:
+            raise CommandError('No likes to take the job and the candidate from - pass --job-id and --candidate-id')
+
+        report = indexes.explain_report(job_id, candidate_id, options['title'], using)
+        for name, plans in report.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(plans["sql"])
+            self.stdout.write('-- before:')
+            self.stdout.write(plans["before"])
+            self.stdout.write('-- after:')
+            self.stdout.write(plans["after"] + '\n')
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({"database": using, "job_id": job_id, "candidate_id": candidate_id, "title": options['title'],
+                           "queries": report}, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Report written to {options["output"]}'))
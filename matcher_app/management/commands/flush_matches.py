@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from matcher_app import match_writer
+import signal
+
+
+class Command(BaseCommand):
+    help = 'Write the match results queued by candidates requests to the Match table until stopped (SIGTERM / SIGINT)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=settings.MATCHER_MATCH_FLUSH_INTERVAL,
+                            help='seconds between flushes while the backlog is small')
+        parser.add_argument('--batch-size', type=int, default=settings.MATCHER_MATCH_FLUSH_BATCH_SIZE,
+                            help='most queued requests written in one transaction')
+        parser.add_argument('--once', action='store_true', help='drain the current backlog and exit')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            flushed = match_writer.drain(options['batch_size'])
+        else:
+            stopping = []
+            for signal_number in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(signal_number, lambda *args: stopping.append(True))
+            flushed = match_writer.run_worker(options['interval'], options['batch_size'], lambda: bool(stopping))
+        self.stdout.write(self.style.SUCCESS(f'Flushed {flushed} queued match results'))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from matcher_app import importer
+import time
+import os
+
+# invalid lines listed at the end of an import - the others are only counted
+MAX_REPORTED_ERRORS = 20
+
+
+class Command(BaseCommand):
+    help = 'Import candidates and their skills from a JSONL or CSV file, creating unknown skills'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSONL ({"title": ..., "skills": [...]}) or CSV (title,skills) file')
+        parser.add_argument('--format', choices=sorted(importer.READERS),
+                            help='file format (default: from the file extension)')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='number of candidates saved per transaction')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if file_format not in importer.READERS:
+            raise CommandError(f'Unknown file format "{file_format}" - use --format')
+        started = time.monotonic()
+
+        def report(result):
+            elapsed = max(time.monotonic() - started, 1e-6)
+            self.stdout.write(f'Imported {result.imported} candidates ({result.imported / elapsed:.0f} rows/s)')
+
+        errors = importer.InvalidLines(MAX_REPORTED_ERRORS)
+        with open(options['path'], newline='', encoding='utf-8') as lines:
+            rows = importer.READERS[file_format](lines, errors)
+            result = importer.import_candidates(rows, options['chunk_size'], report)
+
+        for line_number, message in errors.lines:
+            self.stderr.write(f'Line {line_number}: {message}')
+        if errors.count > len(errors.lines):
+            self.stderr.write(f'... and {errors.count - len(errors.lines)} more invalid lines')
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.imported} candidates with {result.links} skills in {elapsed:.1f}s '
+            f'({result.imported / elapsed:.0f} rows/s) - {errors.count} invalid lines and {result.skipped} rows '
+            f'skipped, {result.skills_created} new skills'))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from matcher_app import models, load_test
+import json
+
+
+class Command(BaseCommand):
+    help = ('Send concurrent requests to the read endpoints of running servers (e.g. the WSGI and the ASGI '
+            'deployment) and compare their throughput')
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='+', help='name=base url of every server - the first one is the baseline')
+        parser.add_argument('--concurrency', default='1,8,32', help='comma separated numbers of concurrent clients')
+        parser.add_argument('--requests', type=int, default=500, help='requests per target and concurrency level')
+        parser.add_argument('--jobs', type=int, default=20,
+                            help='number of open jobs whose endpoints are requested, unless --job-ids is given')
+        parser.add_argument('--job-ids', help='comma separated ids of the jobs whose endpoints are requested')
+        parser.add_argument('--output', default='load_test_report.json', help='where to write the JSON report')
+
+    def handle(self, *args, **options):
+        try:
+            targets = [tuple(target.split('=', 1)) for target in options['targets']]
+            levels = [int(level) for level in options['concurrency'].split(',')]
+            job_ids = [int(job_id) for job_id in options['job_ids'].split(',')] if options['job_ids'] else None
+        except ValueError:
+            raise CommandError('targets are name=url pairs, --concurrency and --job-ids comma separated numbers')
+        if any(len(target) != 2 for target in targets):
+            raise CommandError('targets are name=url pairs, e.g. wsgi=http://localhost:8000')
+        if job_ids is None:  # the servers are expected to use the configured database
+            job_ids = list(models.Job.objects.filter(status=models.OPENED).order_by('job_id')
+                           .values_list('job_id', flat=True)[:options['jobs']])
+        if not job_ids:
+            raise CommandError('No open jobs to request - pass --job-ids')
+
+        def report_level(concurrency, name, summary):
+            self.stdout.write(f'{concurrency:>4} clients  {name:<10} {summary["throughput"]:8.1f} req/s  '
+                              f'p50 {summary["p50"] * 1000:8.2f}ms  p99 {summary["p99"] * 1000:8.2f}ms  '
+                              f'{summary["errors"]} errors')
+
+        report = load_test.run_load_test(targets, load_test.get_paths(job_ids), levels, options['requests'],
+                                         report_level)
+        for concurrency, level in report["levels"].items():
+            speedups = ', '.join(f'{name} {summary["speedup"]:.2f}x' for name, summary in level.items()
+                                 if summary["speedup"] is not None)
+            self.stdout.write(f'{concurrency:>4} clients  throughput relative to {targets[0][0]}: {speedups}')
+
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Report written to {options["output"]}'))
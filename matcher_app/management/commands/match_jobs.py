@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from matcher_app import models, batch
+import time
+
+
+class Command(BaseCommand):
+    help = 'Match candidates for many jobs at once (all open jobs by default) and save the matches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('job_ids', nargs='*', type=int, help='ids of the jobs to match (default: all open jobs)')
+        parser.add_argument('--workers', type=int, default=1, help='number of processes to match jobs with')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='number of jobs matched and saved together')
+        parser.add_argument('--dry-run', action='store_true', help='match the jobs without saving the matches')
+
+    def handle(self, *args, **options):
+        job_ids = options['job_ids'] or list(
+            models.Job.objects.filter(status=models.OPENED).order_by('job_id').values_list('job_id', flat=True))
+        chunk_size = options['chunk_size']
+        started = time.monotonic()
+        num_matches = 0
+        for start in range(0, len(job_ids), chunk_size):
+            results, missing_job_ids = batch.match_jobs(job_ids[start:start + chunk_size], workers=options['workers'],
+                                                        persist=not options['dry_run'])
+            num_matches += sum(len(ranked_candidates) for ranked_candidates in results.values())
+            for job_id in missing_job_ids:
+                self.stderr.write(f'Job {job_id} does not exist')
+            self.stdout.write(f'Matched {min(start + chunk_size, len(job_ids))}/{len(job_ids)} jobs')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Matched {len(job_ids)} jobs with {num_matches} candidate matches in {time.monotonic() - started:.1f}s'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from matcher_app import models, job_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-job stats counters from the like, dislike, note and match tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('job_ids', nargs='*', type=int, help='ids of the jobs to rebuild (default: all jobs)')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='number of jobs rebuilt together')
+
+    def handle(self, *args, **options):
+        job_ids = options['job_ids'] or list(models.Job.objects.order_by('job_id').values_list('job_id', flat=True))
+        chunk_size = options['chunk_size']
+        for start in range(0, len(job_ids), chunk_size):
+            job_stats.rebuild_job_stats(job_ids[start:start + chunk_size])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {len(job_ids)} jobs'))
@@ -0,0 +1,206 @@
+"""
+Cache of match results in front of candidate_finder.candidate_finder.
+
+Results are stored per job under a version made of a global candidates version and a per-job version. Writes bump
+the versions (see matcher_app.signals) instead of deleting entries, so a result computed while a write was in flight
+is stored under the old version and never served:
+    * the job's version is bumped when the job is saved (title / skill / status), gets a like or dislike, or when a
+      candidate write may change its matches (a candidate matching its title, or gaining or losing one of its skills)
+    * the global version is bumped by bulk candidate writes (imports)
+
+Both backends available through MATCHER_MATCH_CACHE_BACKEND key the results on the build of the worker's candidate
+index as well: a worker only learns of other workers' candidate writes when it rebuilds its index
+(MATCHER_INDEX_MAX_AGE), so results it computed before are never served once it has:
+    * 'local' (the default) - an in-process LRU dict. Writes made by other workers never reach it, so the whole cache
+      is dropped whenever the index is rebuilt, which bounds how stale a result can get
+    * 'django' - the Django cache framework (settings.CACHES), so that the versions are shared by every gunicorn worker
+      and each worker sees the other workers' invalidations - only once CACHES points at memcached / redis, the
+      default LocMemCache is private to each process. Results expire after MATCHER_MATCH_CACHE_TIMEOUT seconds
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from matcher_app import match_index
+from collections import OrderedDict
+import threading
+
+
+def get_index_build():
+    """the build of the worker's candidate index, building it if it was never built (results need it anyway)"""
+    index = match_index.get_loaded_index() or match_index.get_index()
+    return index.built_at
+
+
+class LocalBackend:
+    """in-process LRU cache of match results"""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # job id -> (version, result), least recently used first
+        self.global_version = 0
+        self.job_versions = {}
+
+    def get_version(self, job_id):
+        return self.global_version, self.job_versions.get(job_id, 0), get_index_build()
+
+    def get(self, job_id, version):
+        with self.lock:
+            entry = self.entries.get(job_id)
+            if entry is None or entry[0] != version:
+                return None
+            self.entries.move_to_end(job_id)
+            return entry[1]
+
+    def set(self, job_id, version, result):
+        with self.lock:
+            if version != self.get_version(job_id):  # invalidated while the result was being computed
+                return
+            self.entries[job_id] = (version, result)
+            self.entries.move_to_end(job_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def bump_job(self, job_id):
+        with self.lock:
+            self.job_versions[job_id] = self.job_versions.get(job_id, 0) + 1
+            self.entries.pop(job_id, None)
+
+    def bump_all(self):
+        with self.lock:
+            self.global_version += 1
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class DjangoCacheBackend:
+    """match results and versions kept in a Django cache, shared by every worker using the same cache"""
+    key_prefix = 'matcher:matches'
+
+    def __init__(self, alias='default', timeout=300):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def _version_key(self, job_id=None):
+        return f'{self.key_prefix}:version' if job_id is None else f'{self.key_prefix}:version:{job_id}'
+
+    def _increment(self, key):
+        self.cache.add(key, 0, timeout=None)
+        try:
+            self.cache.incr(key)
+        except ValueError:  # evicted between add and incr
+            self.cache.set(key, 1, timeout=None)
+
+    def get_version(self, job_id):
+        keys = [self._version_key(), self._version_key(job_id)]
+        versions = self.cache.get_many(keys)
+        return versions.get(keys[0], 0), versions.get(keys[1], 0), get_index_build()
+
+    def _result_key(self, job_id, version):
+        return f'{self.key_prefix}:{job_id}:{version[0]}:{version[1]}:{version[2]}'
+
+    def get(self, job_id, version):
+        return self.cache.get(self._result_key(job_id, version))
+
+    def set(self, job_id, version, result):
+        self.cache.set(self._result_key(job_id, version), result, timeout=self.timeout)
+
+    def bump_job(self, job_id):
+        self._increment(self._version_key(job_id))
+
+    def bump_all(self):
+        self._increment(self._version_key())
+
+    def __len__(self):
+        return 0  # not known for shared caches
+
+
+BACKENDS = {
+    'local': LocalBackend,
+    'django': DjangoCacheBackend,
+}
+
+
+class MatchCache:
+    """caches candidate_finder results per job and counts hits and misses"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_or_compute(self, job_obj, compute):
+        """return the cached result for the job, calling compute(job_obj) and caching its result on a miss"""
+        version = self.backend.get_version(job_obj.job_id)
+        result = self.get(job_obj.job_id, version)
+        if result is None:
+            result = compute(job_obj)
+            self.backend.set(job_obj.job_id, version, result)
+        return result
+
+    def get(self, job_id, version):
+        """the result cached for the job under version, or None - counted as a hit or a miss"""
+        result = self.backend.get(job_id, version)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def get_version(self, job_id):
+        return self.backend.get_version(job_id)
+
+    def set(self, job_id, version, result):
+        """store a result computed outside get_or_compute, under the version read before computing it"""
+        self.backend.set(job_id, version, result)
+
+    def invalidate_job(self, job_id):
+        self.invalidations += 1
+        self.backend.bump_job(job_id)
+
+    def invalidate_all(self):
+        self.invalidations += 1
+        self.backend.bump_all()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"backend": type(self.backend).__name__, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0, "invalidations": self.invalidations,
+                "entries": len(self.backend)}
+
+
+def create_backend():
+    backend_name = getattr(settings, 'MATCHER_MATCH_CACHE_BACKEND', 'local')
+    backend_class = BACKENDS.get(backend_name) or import_string(backend_name)
+    if backend_class is DjangoCacheBackend:
+        return DjangoCacheBackend(getattr(settings, 'MATCHER_MATCH_CACHE_ALIAS', 'default'),
+                                  getattr(settings, 'MATCHER_MATCH_CACHE_TIMEOUT', 300))
+    if backend_class is LocalBackend:
+        return LocalBackend(getattr(settings, 'MATCHER_MATCH_CACHE_MAX_ENTRIES', 1000))
+    return backend_class()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """return the process-wide match cache, creating it from the settings on first use"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = MatchCache(create_backend())
+    return _cache
+
+
+def reset_cache():
+    """drop the process-wide match cache and its counters, and the results and versions it kept in a Django cache
+    (used by tests)"""
+    global _cache
+    if _cache is not None and isinstance(_cache.backend, DjangoCacheBackend):
+        _cache.backend.cache.clear()
+    _cache = None
@@ -0,0 +1,723 @@
+"""
+Process-local inverted index over the Candidate table, used by candidate_finder instead of scanning the
+table on every request.
+
+Every candidate id is stored in compact sorted int32 arrays:
+    * title code -> candidate ids (a title code is the position of a distinct title in `titles`)
+    * title token -> title codes (titles repeat heavily, so this map stays small)
+    * a BK-tree over the distinct title tokens, for typo tolerant title matching (see matcher_app.fuzzy)
+    * skill id -> candidate ids, and a bounded LRU of the same as packed bitsets (see matcher_app.bitsets)
+    * candidate id -> title code + skill ids (CSR rows, used for ranking and to keep the postings in sync)
+    * skill id -> number of candidates with the skill (the frequency statistics used by matcher_app.ranking)
+
+The arrays are built once per process - at worker start (gunicorn.conf.py) or on first use - and kept in sync with
+the database through the signal handlers in matcher_app.signals. Periodic rebuilds run in a background thread and
+swap the new index in, so requests never wait for them - the updates applied while it was built are replayed on it
+first. Updates never mutate the base arrays - a changed posting list is
+copied into an override dict, which keeps writes cheap and leaves the base arrays read-only.
+
+With MATCHER_SNAPSHOT_DIR set, the base arrays are memory-mapped from the snapshot written by
+`manage.py build_match_snapshot` (see matcher_app.snapshot) instead of being loaded from the database, and the
+candidate writes logged since the snapshot (CandidateChange) are replayed over them as overrides.
+"""
+from matcher_app import models, fuzzy, bitsets, snapshot
+from collections import OrderedDict
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.dispatch import Signal
+from contextlib import contextmanager
+import numpy as np
+import threading
+import logging
+import time
+import re
+
+logger = logging.getLogger(__name__)
+
+ID_DTYPE = np.int32
+EMPTY_IDS = np.empty(0, dtype=ID_DTYPE)
+NO_TITLE = -1
+# a required skill list this many times shorter than the bitsets is intersected by probing its ids into the
+# bitsets of the other skills instead of ANDing whole bitsets (the array / bitmap split of roaring bitmaps)
+SPARSE_FACTOR = 64
+CHANGE_CHUNK_SIZE = 500  # changed candidates read back per query when replaying the changes made since a snapshot
+
+# sent with the new index by the thread building it, before it is swapped in - the models derived from the candidates
+# (matcher_app.title_similarity, matcher_app.cooccurrence) are built for it there while the current ones keep serving
+index_built = Signal()
+
+
+def tokenize_title(title):
+    """split a title into lower case word tokens"""
+    return re.findall(r'\w+', title.lower())
+
+
+def _as_ids(values):
+    return np.asarray(values, dtype=ID_DTYPE)
+
+
+class Postings:
+    """maps integer keys to sorted arrays of candidate ids - a flat CSR base plus copy-on-write overrides"""
+
+    def __init__(self, keys=None, indptr=None, ids=None):
+        self.keys = keys if keys is not None else EMPTY_IDS
+        self.indptr = indptr if indptr is not None else np.zeros(1, dtype=np.int64)
+        self.ids = ids if ids is not None else EMPTY_IDS
+        self.overrides = {}
+
+    @classmethod
+    def from_pairs(cls, keys, ids):
+        """build the postings from two parallel arrays of (key, candidate id) pairs"""
+        order = np.lexsort((ids, keys))
+        keys, ids = keys[order], ids[order]
+        unique_keys, starts = np.unique(keys, return_index=True)
+        indptr = np.append(starts, len(keys)).astype(np.int64)
+        return cls(_as_ids(unique_keys), indptr, _as_ids(ids))
+
+    def get(self, key):
+        """sorted candidate ids stored under key (empty array if the key is unknown)"""
+        if key in self.overrides:
+            return self.overrides[key]
+        pos = np.searchsorted(self.keys, key)
+        if pos < len(self.keys) and self.keys[pos] == key:
+            return self.ids[self.indptr[pos]:self.indptr[pos + 1]]
+        return EMPTY_IDS
+
+    def add(self, key, candidate_id):
+        current = self.get(key)
+        pos = np.searchsorted(current, candidate_id)
+        if pos == len(current) or current[pos] != candidate_id:
+            self.overrides[key] = np.insert(current, pos, candidate_id).astype(ID_DTYPE)
+
+    def discard(self, key, candidate_id):
+        current = self.get(key)
+        pos = np.searchsorted(current, candidate_id)
+        if pos < len(current) and current[pos] == candidate_id:
+            self.overrides[key] = np.delete(current, pos)
+
+    def drop(self, key):
+        self.overrides[key] = EMPTY_IDS
+
+    def merged_with(self, keys, ids):
+        """new postings holding these postings (overrides included) plus the given (key, candidate id) pairs"""
+        base_keys = np.repeat(self.keys, np.diff(self.indptr))
+        base_ids = self.ids
+        if self.overrides:
+            overridden = np.fromiter(self.overrides, dtype=ID_DTYPE, count=len(self.overrides))
+            kept = ~np.isin(base_keys, overridden)
+            base_keys, base_ids = base_keys[kept], base_ids[kept]
+            override_keys = np.repeat(overridden, [len(self.overrides[key]) for key in self.overrides])
+            override_ids = np.concatenate([EMPTY_IDS] + list(self.overrides.values()))
+            base_keys = np.concatenate((base_keys, override_keys))
+            base_ids = np.concatenate((base_ids, override_ids))
+        return Postings.from_pairs(_as_ids(np.concatenate((base_keys, keys))), _as_ids(np.concatenate((base_ids, ids))))
+
+
+class CandidateRows:
+    """candidate id -> (title code, sorted skill ids) stored as CSR rows plus copy-on-write overrides"""
+
+    def __init__(self, candidate_ids=None, title_codes=None, indptr=None, skill_ids=None):
+        self.candidate_ids = candidate_ids if candidate_ids is not None else EMPTY_IDS
+        self.title_codes = title_codes if title_codes is not None else EMPTY_IDS
+        self.indptr = indptr if indptr is not None else np.zeros(1, dtype=np.int64)
+        self.skill_ids = skill_ids if skill_ids is not None else EMPTY_IDS
+        self.overrides = {}  # candidate id -> (title code, skill ids), or None once deleted
+
+    def _position(self, candidate_id):
+        pos = np.searchsorted(self.candidate_ids, candidate_id)
+        if pos < len(self.candidate_ids) and self.candidate_ids[pos] == candidate_id:
+            return pos
+        return None
+
+    def get(self, candidate_id):
+        """(title code, skill ids) for the candidate, or None if the candidate is not indexed"""
+        if candidate_id in self.overrides:
+            return self.overrides[candidate_id]
+        pos = self._position(candidate_id)
+        if pos is None:
+            return None
+        return int(self.title_codes[pos]), self.skill_ids[self.indptr[pos]:self.indptr[pos + 1]]
+
+    def get_skill_matrix(self, candidate_ids):
+        """CSR (indptr, skill ids) holding the skill rows of the given candidates, in the given order"""
+        candidate_ids = _as_ids(candidate_ids)
+        overridden = np.isin(candidate_ids, np.fromiter(self.overrides, dtype=ID_DTYPE, count=len(self.overrides)))
+        positions = np.searchsorted(self.candidate_ids, candidate_ids)
+        positions[overridden] = 0
+        in_base = ~overridden & (positions < len(self.candidate_ids))
+        in_base[in_base] = self.candidate_ids[positions[in_base]] == candidate_ids[in_base]
+
+        starts = np.zeros(len(candidate_ids), dtype=np.int64)
+        lengths = np.zeros(len(candidate_ids), dtype=np.int64)
+        starts[in_base] = self.indptr[positions[in_base]]
+        lengths[in_base] = self.indptr[positions[in_base] + 1] - starts[in_base]
+        override_rows = {}
+        for row in np.flatnonzero(overridden):
+            override = self.overrides[int(candidate_ids[row])]
+            override_rows[row] = override[1] if override is not None else EMPTY_IDS
+            lengths[row] = len(override_rows[row])
+
+        indptr = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        # position of every output entry in self.skill_ids, computed without a python loop over the rows
+        offsets = np.arange(indptr[-1]) - np.repeat(indptr[:-1] - starts, lengths)
+        from_base = np.repeat(in_base, lengths)  # overridden rows may be longer than the base arrays
+        skill_ids = np.empty(indptr[-1], dtype=ID_DTYPE)
+        skill_ids[from_base] = self.skill_ids[offsets[from_base]]
+        for row, override_skills in override_rows.items():
+            skill_ids[indptr[row]:indptr[row + 1]] = override_skills
+        return indptr, skill_ids
+
+    def get_candidate_ids(self):
+        """sorted ids of every indexed candidate"""
+        overridden = np.fromiter(self.overrides, dtype=ID_DTYPE, count=len(self.overrides))
+        present = np.fromiter((candidate_id for candidate_id, row in self.overrides.items() if row is not None),
+                              dtype=ID_DTYPE)
+        return np.union1d(np.setdiff1d(self.candidate_ids, overridden, assume_unique=True), present)
+
+    def set(self, candidate_id, title_code, skill_ids):
+        self.overrides[candidate_id] = (title_code, skill_ids)
+
+    def remove(self, candidate_id):
+        self.overrides[candidate_id] = None
+
+    def can_append(self, candidate_ids):
+        """whether the given sorted ids all come after the base rows and are not overridden"""
+        if not len(candidate_ids):
+            return True
+        if len(self.candidate_ids) and candidate_ids[0] <= self.candidate_ids[-1]:
+            return False
+        return not any(int(candidate_id) in self.overrides for candidate_id in candidate_ids)
+
+    def append(self, candidate_ids, title_codes, indptr, skill_ids):
+        """add new rows after the base rows - see can_append"""
+        self.candidate_ids = np.concatenate((self.candidate_ids, candidate_ids))
+        self.title_codes = np.concatenate((self.title_codes, title_codes))
+        self.indptr = np.concatenate((self.indptr, self.indptr[-1] + indptr[1:])).astype(np.int64)
+        self.skill_ids = np.concatenate((self.skill_ids, skill_ids))
+
+
+class CandidateIndex:
+    """inverted index of candidate titles and skills - see the module docstring"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.titles = []  # distinct candidate titles - the position of a title is its title code
+        self.title_codes = {}
+        self.title_tokens = {}  # token -> set of title codes
+        self.token_tree = fuzzy.BKTree()
+        self.title_members = Postings()  # title code -> candidate ids
+        self.skill_members = Postings()  # skill id -> candidate ids
+        self.rows = CandidateRows()
+        self.skill_counts = np.zeros(0, dtype=np.int64)  # skill id -> number of candidates with the skill
+        self.skill_bitsets = OrderedDict()  # skill id -> bitset of skill_members, least recently used first
+        self.max_bitsets = getattr(settings, 'MATCHER_MAX_SKILL_BITSETS', 256)
+        self.num_candidates = 0
+        self.snapshot_version = None
+        self.built_at = None
+        self.title_vectors = None  # the vectors of the titles (see matcher_app.title_similarity.get_vectors)
+        self.num_vectorized_titles = 0
+
+    def _get_title_code(self, title):
+        code = self.title_codes.get(title)
+        if code is None:
+            code = len(self.titles)
+            self.titles.append(title)
+            self.title_codes[title] = code
+            for token in tokenize_title(title):
+                if token not in self.title_tokens:
+                    self.token_tree.add(token)
+                self.title_tokens.setdefault(token, set()).add(code)
+        return code
+
+    def build(self):
+        """load every candidate and candidate-skill link from the database into the index - both are read in one
+        repeatable read transaction, so no link points at a candidate the index does not have"""
+        started = time.monotonic()
+        with _repeatable_read():
+            candidates = models.Candidate.objects.order_by('candidate_id').values_list('candidate_id', 'title')
+            candidate_ids, title_codes = [], []
+            for candidate_id, title in candidates.iterator():
+                candidate_ids.append(candidate_id)
+                title_codes.append(self._get_title_code(title))
+            candidate_ids, title_codes = _as_ids(candidate_ids), _as_ids(title_codes)
+
+            links = models.Candidate.skills.through.objects.values_list('candidate_id', 'skill_id')
+            link_array = np.fromiter((value for link in links.iterator() for value in link), dtype=ID_DTYPE)
+        link_candidates, link_skills = link_array[0::2], link_array[1::2]
+
+        order = np.lexsort((link_skills, link_candidates))
+        link_candidates, link_skills = link_candidates[order], link_skills[order]
+        rows_per_candidate = np.bincount(np.searchsorted(candidate_ids, link_candidates),
+                                         minlength=len(candidate_ids))
+        indptr = np.concatenate(([0], np.cumsum(rows_per_candidate))).astype(np.int64)
+
+        self.rows = CandidateRows(candidate_ids, title_codes, indptr, link_skills)
+        self.title_members = Postings.from_pairs(title_codes, candidate_ids)
+        self.skill_members = Postings.from_pairs(link_skills, link_candidates)
+        self.skill_counts = np.bincount(link_skills).astype(np.int64)
+        self.num_candidates = len(candidate_ids)
+        self.built_at = time.monotonic()
+        logger.info(f'Built candidate index for {len(candidate_ids)} candidates '
+                    f'in {self.built_at - started:.2f}s')
+        return self
+
+    # -- snapshots (see matcher_app.snapshot) --
+
+    def get_snapshot_arrays(self):
+        """the base arrays of the index by name - only an index without updates can be written to a snapshot"""
+        with self.lock:
+            if self.rows.overrides or self.title_members.overrides or self.skill_members.overrides:
+                raise ValueError('The index holds updates that are not part of its base arrays')
+            arrays = {'rows_candidate_ids': self.rows.candidate_ids, 'rows_title_codes': self.rows.title_codes,
+                      'rows_indptr': self.rows.indptr, 'rows_skill_ids': self.rows.skill_ids,
+                      'skill_counts': self.skill_counts}
+            for name, postings in (('title', self.title_members), ('skill', self.skill_members)):
+                arrays.update({f'{name}_keys': postings.keys, f'{name}_indptr': postings.indptr,
+                               f'{name}_ids': postings.ids})
+            return arrays
+
+    @classmethod
+    def from_snapshot(cls, loaded):
+        """index over the memory-mapped arrays of a snapshot.Snapshot, with the changes made since it replayed"""
+        started = time.monotonic()
+        index = cls()
+        for title in loaded.titles:
+            index._get_title_code(title)
+        arrays = loaded.arrays
+        index.rows = CandidateRows(arrays['rows_candidate_ids'], arrays['rows_title_codes'], arrays['rows_indptr'],
+                                   arrays['rows_skill_ids'])
+        index.title_members = Postings(arrays['title_keys'], arrays['title_indptr'], arrays['title_ids'])
+        index.skill_members = Postings(arrays['skill_keys'], arrays['skill_indptr'], arrays['skill_ids'])
+        index.skill_counts = np.array(arrays['skill_counts'])  # a copy - the counts are updated in place
+        index.num_candidates = loaded.manifest['num_candidates']
+        index.snapshot_version = loaded.version
+        num_changes = index.apply_changes(loaded.manifest['last_change_id'], loaded.manifest['max_candidate_id'])
+        index.built_at = time.monotonic()
+        logger.info(f'Loaded candidate index snapshot {loaded.version} of {len(index.rows.candidate_ids)} candidates '
+                    f'and replayed {num_changes} changes in {index.built_at - started:.2f}s')
+        return index
+
+    def apply_changes(self, last_change_id, max_candidate_id):
+        """replay the candidate writes made after a snapshot - the candidates created after max_candidate_id and the
+        ones logged in CandidateChange after last_change_id are read back from the database. Returns the number of
+        changed candidates and skills.
+        """
+        changes = models.CandidateChange.objects.filter(id__gt=last_change_id).values_list('candidate_id', 'skill_id')
+        changed_ids, deleted_skills = set(), set()
+        for candidate_id, skill_id in changes.iterator():
+            if skill_id is not None:
+                deleted_skills.add(skill_id)
+            elif candidate_id <= max_candidate_id:
+                changed_ids.add(candidate_id)
+        for skill_id in sorted(deleted_skills):
+            self.remove_skill(skill_id)
+
+        new_ids, titles, skill_lists = _read_candidates(
+            models.Candidate.objects.filter(candidate_id__gt=max_candidate_id))
+        if len(new_ids) > CHANGE_CHUNK_SIZE:
+            # merged into copies of the postings, which are no longer shared - time to write a new snapshot
+            logger.warning(f'{len(new_ids)} candidates were created since the snapshot')
+            self.add_candidates(new_ids, titles, skill_lists)
+        else:
+            for candidate_id, title, skill_ids in zip(new_ids, titles, skill_lists):
+                self.set_title(candidate_id, title)
+                self.set_skills(candidate_id, skill_ids)
+
+        changed_ids = sorted(changed_ids)
+        for start in range(0, len(changed_ids), CHANGE_CHUNK_SIZE):
+            chunk = changed_ids[start:start + CHANGE_CHUNK_SIZE]
+            rows = dict((candidate_id, (title, skill_ids)) for candidate_id, title, skill_ids in
+                        zip(*_read_candidates(models.Candidate.objects.filter(candidate_id__in=chunk))))
+            for candidate_id in chunk:
+                if candidate_id in rows:
+                    title, skill_ids = rows[candidate_id]
+                    self.set_title(candidate_id, title)
+                    self.set_skills(candidate_id, skill_ids)
+                else:
+                    self.remove_candidate(candidate_id)
+        return len(new_ids) + len(changed_ids) + len(deleted_skills)
+
+    # -- queries --
+
+    def get_title_token_matches(self, tokens):
+        """ids of candidates whose title contains any of the given tokens"""
+        with self.lock:
+            codes = set()
+            for token in tokens:
+                codes |= self.title_tokens.get(token.lower(), set())
+            members = [self.title_members.get(code) for code in codes]
+        if not members:
+            return EMPTY_IDS
+        return np.unique(np.concatenate(members))
+
+    def get_similar_titles(self, title, max_distance):
+        """codes of the candidate titles that share a (possibly misspelled) token with title, with their similarity
+
+        Every token of the title is looked up in the BK-tree with up to max_distance edits - fewer for short
+        tokens, where a couple of edits turn one word into another. A matched token contributes
+        1 - distance / token length, and a candidate title's similarity is the average over the title's tokens of
+        the best contribution it got. Returns (title codes, similarities) ordered by similarity, best first.
+        """
+        tokens = tokenize_title(title)
+        similarities = {}
+        with self.lock:
+            for token in tokens:
+                best_for_token = {}
+                allowed_distance = min(max_distance, max(len(token) - 1, 0) // 3)
+                for word, distance in self.token_tree.search(token, allowed_distance):
+                    token_similarity = 1.0 - distance / max(len(token), len(word))
+                    for code in self.title_tokens[word]:
+                        best_for_token[code] = max(best_for_token.get(code, 0.0), token_similarity)
+                for code, token_similarity in best_for_token.items():
+                    similarities[code] = similarities.get(code, 0.0) + token_similarity / len(tokens)
+        ranked = sorted(similarities.items(), key=lambda item: (-item[1], item[0]))
+        return [code for code, _ in ranked], [similarity for _, similarity in ranked]
+
+    def get_fuzzy_title_matches(self, title, max_distance):
+        """ids of candidates whose title is similar to the given title and their similarity, best matches first"""
+        codes, similarities = self.get_similar_titles(title, max_distance)
+        with self.lock:
+            members = [self.title_members.get(code) for code in codes]
+        if not members:
+            return EMPTY_IDS, np.empty(0)
+        candidate_similarities = np.repeat(similarities, [len(ids) for ids in members])
+        return np.concatenate(members), candidate_similarities
+
+    def get_candidate(self, candidate_id):
+        """(title, skill ids) of an indexed candidate, or None - the title is None for a candidate without one"""
+        with self.lock:
+            row = self.rows.get(candidate_id)
+            if row is None:
+                return None
+            code, skill_ids = row
+            return (self.titles[code] if code != NO_TITLE else None), skill_ids
+
+    def get_exact_title_matches(self, title):
+        """ids of candidates whose title is exactly the given title"""
+        with self.lock:
+            code = self.title_codes.get(title)
+            return EMPTY_IDS if code is None else self.title_members.get(code)
+
+    def get_skill_matches(self, skill_id):
+        """ids of candidates who have the given skill"""
+        with self.lock:
+            return self.skill_members.get(skill_id)
+
+    def _get_bitset_size(self):
+        last_id = int(self.rows.candidate_ids[-1]) if len(self.rows.candidate_ids) else -1
+        return max([last_id] + list(self.rows.overrides)) + 1
+
+    def get_skill_bitset(self, skill_id):
+        """bitset of the candidates who have the given skill, built on first use and kept until the skill changes"""
+        with self.lock:
+            bitset = self.skill_bitsets.get(skill_id)
+            if bitset is None:
+                bitset = bitsets.from_ids(self.skill_members.get(skill_id), self._get_bitset_size())
+                self.skill_bitsets[skill_id] = bitset
+                while len(self.skill_bitsets) > self.max_bitsets:
+                    self.skill_bitsets.popitem(last=False)
+            self.skill_bitsets.move_to_end(skill_id)
+            return bitset
+
+    def get_requirement_matches(self, required, optional=()):
+        """ids of candidates who have every required skill - or any of the optional skills when none is required
+
+        Required skills are intersected starting with the rarest one: when its candidate list is short compared to
+        the bitsets, its ids are probed into the bitsets of the other skills, otherwise the bitsets are ANDed.
+        """
+        with self.lock:
+            if not required:
+                if not optional:
+                    return EMPTY_IDS
+                return bitsets.to_ids(bitsets.union([self.get_skill_bitset(skill_id) for skill_id in optional]))
+
+            required = sorted(required, key=lambda skill_id: len(self.skill_members.get(skill_id)))
+            rarest = self.skill_members.get(required[0])
+            if len(rarest) * SPARSE_FACTOR < self._get_bitset_size():
+                candidate_ids = rarest
+                for skill_id in required[1:]:
+                    if not len(candidate_ids):
+                        break
+                    candidate_ids = candidate_ids[bitsets.contains(self.get_skill_bitset(skill_id), candidate_ids)]
+                return candidate_ids
+            return bitsets.to_ids(bitsets.intersect([self.get_skill_bitset(skill_id) for skill_id in required]))
+
+    def get_skill_matrix(self, candidate_ids):
+        """candidate x skill matrix of the given candidates as CSR arrays (indptr, skill ids)"""
+        with self.lock:
+            return self.rows.get_skill_matrix(candidate_ids)
+
+    def get_skill_statistics(self, num_skills):
+        """(number of candidates per skill id as an array of length num_skills, total number of candidates)"""
+        with self.lock:
+            counts = np.zeros(num_skills, dtype=np.int64)
+            known = min(num_skills, len(self.skill_counts))
+            counts[:known] = self.skill_counts[:known]
+            return counts, self.num_candidates
+
+    # -- updates (called from matcher_app.signals) --
+
+    def _count_skills(self, skill_ids, delta):
+        if not len(skill_ids):
+            return
+        if skill_ids.max() >= len(self.skill_counts):
+            self.skill_counts = np.concatenate(
+                (self.skill_counts, np.zeros(skill_ids.max() + 1 - len(self.skill_counts), dtype=np.int64)))
+        self.skill_counts[skill_ids] += delta
+
+    def _add_row(self, candidate_id, title_code, skill_ids):
+        """set a candidate's row, counting the candidate if it was not indexed yet"""
+        if self.rows.get(candidate_id) is None:
+            self.num_candidates += 1
+        self.rows.set(candidate_id, title_code, skill_ids)
+
+    def set_title(self, candidate_id, title):
+        with self.lock:
+            row = self.rows.get(candidate_id)
+            old_code, skill_ids = row if row is not None else (NO_TITLE, EMPTY_IDS)
+            code = self._get_title_code(title)
+            if code != old_code:
+                if old_code != NO_TITLE:
+                    self.title_members.discard(old_code, candidate_id)
+                self.title_members.add(code, candidate_id)
+                self._add_row(candidate_id, code, skill_ids)
+
+    def set_skills(self, candidate_id, skill_ids):
+        with self.lock:
+            row = self.rows.get(candidate_id)
+            code, old_skill_ids = row if row is not None else (NO_TITLE, EMPTY_IDS)
+            skill_ids = np.unique(_as_ids(list(skill_ids)))
+            removed = np.setdiff1d(old_skill_ids, skill_ids, assume_unique=True)
+            added = np.setdiff1d(skill_ids, old_skill_ids, assume_unique=True)
+            for skill_id in removed:
+                self.skill_members.discard(int(skill_id), candidate_id)
+                self.skill_bitsets.pop(int(skill_id), None)
+            for skill_id in added:
+                self.skill_members.add(int(skill_id), candidate_id)
+                self.skill_bitsets.pop(int(skill_id), None)
+            self._count_skills(removed, -1)
+            self._count_skills(added, 1)
+            self._add_row(candidate_id, code, skill_ids)
+
+    def add_skills(self, candidate_id, skill_ids):
+        with self.lock:
+            row = self.rows.get(candidate_id)
+            current = row[1] if row is not None else EMPTY_IDS
+            self.set_skills(candidate_id, np.union1d(current, _as_ids(list(skill_ids))))
+
+    def remove_skills(self, candidate_id, skill_ids):
+        with self.lock:
+            row = self.rows.get(candidate_id)
+            if row is not None:
+                self.set_skills(candidate_id, np.setdiff1d(row[1], _as_ids(list(skill_ids))))
+
+    def remove_candidate(self, candidate_id):
+        with self.lock:
+            row = self.rows.get(candidate_id)
+            if row is None:
+                return
+            code, skill_ids = row
+            if code != NO_TITLE:
+                self.title_members.discard(code, candidate_id)
+            for skill_id in skill_ids:
+                self.skill_members.discard(int(skill_id), candidate_id)
+                self.skill_bitsets.pop(int(skill_id), None)
+            self._count_skills(skill_ids, -1)
+            self.rows.remove(candidate_id)
+            self.num_candidates -= 1
+
+    def remove_skill(self, skill_id):
+        with self.lock:
+            for candidate_id in self.skill_members.get(skill_id):
+                self.remove_skills(int(candidate_id), [skill_id])
+            self.skill_members.drop(skill_id)
+            self.skill_bitsets.pop(skill_id, None)
+
+    def add_candidates(self, candidate_ids, titles, skill_lists):
+        """index many new candidates at once (used by bulk imports, which send no signals)
+
+        New ids past the last indexed id are appended to the base arrays and merged into the postings in one
+        vectorized pass, any other id falls back to the per-candidate updates.
+        """
+        with self.lock:
+            order = np.argsort(_as_ids(candidate_ids), kind='stable')
+            candidate_ids = _as_ids(candidate_ids)[order]
+            titles = [titles[i] for i in order]
+            skill_lists = [np.unique(_as_ids(list(skill_lists[i]))) for i in order]
+            if not self.rows.can_append(candidate_ids) or len(np.unique(candidate_ids)) != len(candidate_ids):
+                for candidate_id, title, skill_ids in zip(candidate_ids.tolist(), titles, skill_lists):
+                    self.set_title(candidate_id, title)
+                    self.set_skills(candidate_id, skill_ids)
+                return
+
+            title_codes = _as_ids([self._get_title_code(title) for title in titles])
+            lengths = [len(skill_ids) for skill_ids in skill_lists]
+            indptr = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+            skill_ids = _as_ids(np.concatenate([EMPTY_IDS] + skill_lists))
+            link_candidates = np.repeat(candidate_ids, lengths)
+
+            self.rows.append(candidate_ids, title_codes, indptr, skill_ids)
+            self.title_members = self.title_members.merged_with(title_codes, candidate_ids)
+            self.skill_members = self.skill_members.merged_with(skill_ids, link_candidates)
+            for skill_id in np.unique(skill_ids).tolist():
+                self.skill_bitsets.pop(skill_id, None)
+            if len(skill_ids):
+                added_counts = np.bincount(skill_ids)
+                skill_counts = np.zeros(max(len(added_counts), len(self.skill_counts)), dtype=np.int64)
+                skill_counts[:len(self.skill_counts)] = self.skill_counts
+                skill_counts[:len(added_counts)] += added_counts
+                self.skill_counts = skill_counts
+            self.num_candidates += len(candidate_ids)
+
+
+def _read_candidates(candidates):
+    """(ids, titles, skill id lists) of the candidates of a queryset, in two queries"""
+    titles = dict(candidates.values_list('candidate_id', 'title'))
+    skill_lists = {candidate_id: [] for candidate_id in titles}
+    links = models.Candidate.skills.through.objects.filter(candidate_id__in=candidates.values('candidate_id'))
+    for candidate_id, skill_id in links.values_list('candidate_id', 'skill_id').iterator():
+        if candidate_id in skill_lists:  # not a candidate created between the two queries
+            skill_lists[candidate_id].append(skill_id)
+    candidate_ids = sorted(titles)
+    return candidate_ids, [titles[i] for i in candidate_ids], [skill_lists[i] for i in candidate_ids]
+
+
+@contextmanager
+def _repeatable_read():
+    """a transaction whose queries all read the same snapshot of the database - on Postgres its isolation level is
+    raised to REPEATABLE READ, SQLite transactions read a single snapshot already"""
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        if outermost and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        yield
+
+
+def write_snapshot(directory):
+    """build the index from the database and write it as the current snapshot in directory - returns its version
+
+    The last logged change and the candidate tables are read in one repeatable read transaction, so a candidate write
+    committed while the index is built is either part of the snapshot or logged after it - never lost. Changes logged
+    before the previous snapshot are deleted, they are part of both snapshots.
+    """
+    previous = snapshot.read(directory)
+    with _repeatable_read():
+        last_change_id = models.CandidateChange.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        index = CandidateIndex().build()
+    candidate_ids = index.rows.candidate_ids
+    version = snapshot.write(directory, index.get_snapshot_arrays(), index.titles,
+                             num_candidates=index.num_candidates, last_change_id=last_change_id,
+                             max_candidate_id=int(candidate_ids[-1]) if len(candidate_ids) else 0)
+    if previous is not None:
+        models.CandidateChange.objects.filter(id__lte=previous.manifest['last_change_id']).delete()
+    return version
+
+
+def _load_index():
+    directory = snapshot.get_directory()
+    if directory is not None:
+        loaded = snapshot.read(directory)
+        if loaded is not None:
+            return CandidateIndex.from_snapshot(loaded)
+    return CandidateIndex().build()
+
+
+_index = None
+_index_lock = threading.Lock()  # held while the index is built - readers only wait for it when there is no index yet
+_rebuild_thread = None
+_rebuild_thread_lock = threading.Lock()
+_pending_updates = None  # the updates applied while an index is being built, replayed on it before it is swapped in
+_updates_lock = threading.Lock()
+
+
+def apply_update(method_name, *args):
+    """apply an update (a CandidateIndex method) to the loaded index - an index that was never built will read the
+    change from the database. While an index is being built the update is queued for it too, as it may have read the
+    database before the change was committed (updates can be applied twice, they set rather than add)."""
+    with _updates_lock:
+        index = _index
+        if _pending_updates is not None:
+            _pending_updates.append((method_name, args))
+    if index is not None:
+        getattr(index, method_name)(*args)
+
+
+def _rebuild(index):
+    """replace index by a new build, unless another thread replaced it while we were waiting for the lock
+
+    the receivers of index_built prepare for the new index, and the updates applied to the serving index meanwhile are
+    replayed on it, before it is swapped in
+    """
+    global _index, _pending_updates
+    with _index_lock:
+        if _index is not index:
+            return _index
+        with _updates_lock:
+            _pending_updates = []
+        try:
+            new_index = _load_index()
+            for receiver, error in index_built.send_robust(sender=CandidateIndex, index=new_index):
+                if isinstance(error, Exception):
+                    logger.error(f'{receiver.__module__} failed to prepare for the new candidate index',
+                                 exc_info=(type(error), error, error.__traceback__))
+            replayed = 0
+            while True:
+                with _updates_lock:
+                    updates = _pending_updates[replayed:]
+                    if not updates:  # no update can slip in between the last replay and the swap
+                        _index, _pending_updates = new_index, None
+                        break
+                for method_name, args in updates:
+                    getattr(new_index, method_name)(*args)
+                replayed += len(updates)
+        finally:
+            _pending_updates = None
+    return _index
+
+
+def _rebuild_in_background(index):
+    try:
+        _rebuild(index)
+    except Exception:
+        logger.exception('Rebuilding the candidate index failed - the previous index keeps serving')
+    finally:
+        connections.close_all()  # the connections of this thread, which is done
+
+
+def start_rebuild(index=None):
+    """rebuild the index in a background thread and swap it in once built - readers keep using the current index
+    meanwhile. Called with no index at worker start (see gunicorn.conf.py). Returns the thread."""
+    global _rebuild_thread
+    with _rebuild_thread_lock:
+        if _rebuild_thread is None or not _rebuild_thread.is_alive():
+            _rebuild_thread = threading.Thread(target=_rebuild_in_background, args=(index,),
+                                               name='match-index-rebuild', daemon=True)
+            _rebuild_thread.start()
+        return _rebuild_thread
+
+
+def get_index():
+    """return the process-wide index, building it (or loading the snapshot) on first use
+
+    once it is older than MATCHER_INDEX_MAX_AGE it is rebuilt in the background while it keeps serving
+    """
+    index = _index
+    if index is None:
+        return _rebuild(None)  # or waits for the build started at worker start
+    max_age = getattr(settings, 'MATCHER_INDEX_MAX_AGE', None)
+    if max_age is not None and time.monotonic() - index.built_at > max_age:
+        start_rebuild(index)
+    return index
+
+
+def get_loaded_index():
+    """return the process-wide index if it has already been built, without building it"""
+    return _index
+
+
+def reset_index():
+    """drop the process-wide index - it is rebuilt from the database on next use"""
+    global _index
+    _index = None
@@ -0,0 +1,133 @@
+"""
+Write-behind persistence of match results, so a candidates request does not wait for the Match table upserts.
+
+With MATCHER_MATCH_WRITE_BEHIND enabled, the request path only appends one PendingMatch row - the job id, its
+candidate ids packed as int32 bytes and the time of the match - and `manage.py flush_matches` (the `worker` process
+of the Procfile) writes them to the Match table in the background: every MATCHER_MATCH_FLUSH_INTERVAL seconds it
+takes up to MATCHER_MATCH_FLUSH_BATCH_SIZE pending rows, coalesces the rows of the same job (a candidate matched
+several times is written once, with the time of its latest match) and upserts them in one transaction together with
+the deletion of the rows. On SIGTERM / SIGINT the worker finishes its batch and drains the rows queued until then
+before exiting - for at most MATCHER_MATCH_DRAIN_TIMEOUT seconds, rows left over are written by the next worker - and
+several workers can run side by side on Postgres (the rows of a batch are locked with SKIP LOCKED).
+
+The Match table, and the num_matches of the job stats, are therefore eventually consistent with the returned
+matches. The backlog (pending rows and age of the oldest one) is exported by the metrics endpoint - estimated from the
+first and last pending row ids, so that scraping it costs two primary key lookups however long the backlog grows.
+"""
+from matcher_app import models, utils, metrics
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Subquery
+from django.utils import timezone
+import numpy as np
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+ID_BYTES_DTYPE = np.dtype('<i4')
+
+
+def save_matches(job_id, candidate_ids):
+    """save the matched candidates of a job - queued for the write-behind worker when MATCHER_MATCH_WRITE_BEHIND is
+    enabled, written to the Match table right away otherwise"""
+    if not settings.MATCHER_MATCH_WRITE_BEHIND:
+        utils.add_ranked_candidates_to_table(candidate_ids, job_id)
+        return
+    packed = np.asarray(candidate_ids, dtype=ID_BYTES_DTYPE).tobytes()
+    models.PendingMatch.objects.create(job_id=job_id, candidate_ids=packed)
+    metrics.registry.increment('matcher_match_writes_enqueued_total')
+
+
+def _coalesce(pending):
+    """{job id: [(time matched, candidate ids)]} from pending (job id, packed ids, time matched) rows - every candidate
+    of a job appears once, with the time of its latest match"""
+    rows_per_job = {}
+    for job_id, packed, time_matched in pending:
+        rows_per_job.setdefault(job_id, []).append((time_matched, np.frombuffer(bytes(packed), ID_BYTES_DTYPE)))
+    writes = {}
+    for job_id, rows in rows_per_job.items():
+        seen = np.empty(0, dtype=ID_BYTES_DTYPE)
+        for time_matched, candidate_ids in sorted(rows, key=lambda row: row[0], reverse=True):
+            candidate_ids = np.setdiff1d(candidate_ids, seen)
+            if len(candidate_ids):
+                writes.setdefault(job_id, []).append((time_matched, candidate_ids))
+                seen = np.union1d(seen, candidate_ids)
+    return writes
+
+
+def flush(batch_size=None, max_id=None):
+    """write up to batch_size pending rows (all of them by default) to the Match table in one transaction - only the
+    rows with ids up to max_id when given. Returns the number of rows written."""
+    batch_size = batch_size or settings.MATCHER_MATCH_FLUSH_BATCH_SIZE
+    with transaction.atomic():
+        pending = models.PendingMatch.objects.order_by('id')
+        if max_id is not None:
+            pending = pending.filter(id__lte=max_id)
+        if connection.features.has_select_for_update_skip_locked:
+            pending = pending.select_for_update(skip_locked=True)
+        pending = list(pending.values_list('id', 'job_id', 'candidate_ids', 'time_matched')[:batch_size])
+        if not pending:
+            return 0
+        existing_job_ids = set(models.Job.objects.filter(job_id__in={row[1] for row in pending})
+                               .values_list('job_id', flat=True))
+        for job_id, writes in _coalesce([row[1:] for row in pending if row[1] in existing_job_ids]).items():
+            for time_matched, candidate_ids in writes:
+                utils.add_ranked_candidates_to_table(candidate_ids.tolist(), job_id, time_matched)
+        models.PendingMatch.objects.filter(id__in=[row[0] for row in pending]).delete()
+    return len(pending)
+
+
+def drain(batch_size=None, timeout=None):
+    """flush the rows pending when called, batch after batch, until none is left or timeout seconds have passed -
+    rows queued in the meantime are left to the next flush. Returns the number of rows written."""
+    max_id = models.PendingMatch.objects.aggregate(max_id=Max('id'))['max_id']
+    deadline = None if timeout is None else time.monotonic() + timeout
+    flushed = 0
+    while max_id is not None and (deadline is None or time.monotonic() < deadline):
+        batch = flush(batch_size, max_id)
+        if not batch:
+            break
+        flushed += batch
+    return flushed
+
+
+def get_backlog():
+    """(number of pending rows, age in seconds of the oldest one) - recorded in the metrics as well
+
+    the rows are counted as the span between the first and last pending ids, which is exact while the rows are written
+    in id order and an upper bound otherwise
+    """
+    last_id = models.PendingMatch.objects.order_by('-id').values('id')[:1]
+    oldest = (models.PendingMatch.objects.order_by('id').annotate(last_id=Subquery(last_id))
+              .values_list('id', 'last_id', 'time_matched').first())
+    rows, age = 0, 0.0
+    if oldest is not None:
+        first_id, last_id, time_matched = oldest
+        rows, age = last_id - first_id + 1, max((timezone.now() - time_matched).total_seconds(), 0.0)
+    metrics.registry.set_gauge('matcher_match_backlog_rows', rows)
+    metrics.registry.set_gauge('matcher_match_backlog_age_seconds', age)
+    return rows, age
+
+
+def run_worker(interval=None, batch_size=None, should_stop=lambda: False, drain_timeout=None):
+    """flush pending matches until should_stop() is true, then drain the backlog for up to drain_timeout seconds - a
+    full batch is followed by the next one right away, otherwise the worker sleeps for interval seconds. Returns the
+    number of rows written."""
+    interval = settings.MATCHER_MATCH_FLUSH_INTERVAL if interval is None else interval
+    drain_timeout = settings.MATCHER_MATCH_DRAIN_TIMEOUT if drain_timeout is None else drain_timeout
+    batch_size = batch_size or settings.MATCHER_MATCH_FLUSH_BATCH_SIZE
+    flushed = 0
+    while not should_stop():
+        started = time.monotonic()
+        batch = flush(batch_size)
+        if batch:
+            flushed += batch
+            logger.info(f'Flushed {batch} pending match results in {time.monotonic() - started:.3f}s')
+        if batch < batch_size:
+            deadline = time.monotonic() + interval
+            while not should_stop() and time.monotonic() < deadline:
+                time.sleep(min(0.1, interval))
+    drained = drain(batch_size, drain_timeout)
+    logger.info(f'Drained {drained} pending match results on shutdown')
+    return flushed + drained
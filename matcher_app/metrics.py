@@ -0,0 +1,169 @@
+"""
+Process-local metrics of the matching pipeline and the views, exported by the metrics endpoint.
+
+    * matcher_stage_seconds{stage} - wall clock time of every stage of candidate_finder
+    * matcher_view_seconds{view}, matcher_view_queries{view}, matcher_view_sql_seconds{view} - time, number of SQL
+      queries and SQL time of every request (recorded by matcher_app.middleware.QueryMetricsMiddleware)
+    * matcher_view_query_budget_exceeded_total{view} - requests that ran more queries than their view's budget
+    * matcher_match_writes_enqueued_total, matcher_match_backlog_rows, matcher_match_backlog_age_seconds - matches
+      queued for the write-behind worker and its backlog (see matcher_app.match_writer)
+
+All metrics are histograms with fixed buckets, counters or gauges, rendered either in the Prometheus text format or
+as JSON. Every process keeps its own metrics, so with several gunicorn workers each worker is scraped separately.
+"""
+from contextlib import contextmanager
+import threading
+import bisect
+import time
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+HELP = {
+    'matcher_stage_seconds': 'Time spent in each stage of candidate matching',
+    'matcher_view_seconds': 'Time spent handling requests per view',
+    'matcher_view_queries': 'Number of SQL queries per request per view',
+    'matcher_view_sql_seconds': 'Time spent in SQL queries per request per view',
+    'matcher_view_query_budget_exceeded_total': 'Requests that ran more SQL queries than the query budget of the view',
+    'matcher_match_writes_enqueued_total': 'Match results queued for the write-behind worker',
+    'matcher_match_backlog_rows': 'Match results waiting to be written by the write-behind worker',
+    'matcher_match_backlog_age_seconds': 'Age of the oldest match result waiting to be written',
+}
+
+
+class Histogram:
+    """cumulative histogram with fixed upper bounds, like a Prometheus histogram"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self):
+        total, cumulative = 0, []
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+    def quantile(self, q):
+        """estimate of the q quantile, interpolated inside its bucket like Prometheus' histogram_quantile"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = self.cumulative_counts()
+        position = bisect.bisect_left(cumulative, rank)
+        if position == len(self.buckets):  # above the largest bound
+            return self.buckets[-1]
+        lower = self.buckets[position - 1] if position else 0.0
+        below = cumulative[position - 1] if position else 0
+        in_bucket = cumulative[position] - below
+        if not in_bucket:
+            return lower
+        return lower + (self.buckets[position] - lower) * (rank - below) / in_bucket
+
+
+class Registry:
+    """histograms, counters and gauges by (name, labels)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}  # name -> {labels: Histogram}
+        self.counters = {}  # name -> {labels: value}
+        self.gauges = {}  # name -> {labels: value}
+
+    def observe(self, name, value, buckets=TIME_BUCKETS, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    def increment(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.gauges.setdefault(name, {})[key] = value
+
+    def snapshot(self):
+        """all metrics as JSON serializable dicts"""
+        with self.lock:
+            histograms = {
+                name: [{"labels": dict(key), "count": histogram.count, "sum": histogram.sum,
+                        "buckets": dict(zip([str(bound) for bound in histogram.buckets] + ['+Inf'],
+                                            histogram.cumulative_counts()))}
+                       for key, histogram in sorted(series.items())]
+                for name, series in self.histograms.items()}
+            counters, gauges = [{name: [{"labels": dict(key), "value": value} for key, value in sorted(series.items())]
+                                 for name, series in values.items()} for values in (self.counters, self.gauges)]
+        return {"histograms": histograms, "counters": counters, "gauges": gauges}
+
+    def render_prometheus(self):
+        """all metrics in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            for name, series in sorted(self.histograms.items()):
+                lines += [f'# HELP {name} {HELP.get(name, name)}', f'# TYPE {name} histogram']
+                for key, histogram in sorted(series.items()):
+                    bounds = [str(bound) for bound in histogram.buckets] + ['+Inf']
+                    for bound, count in zip(bounds, histogram.cumulative_counts()):
+                        lines.append(f'{name}_bucket{_format_labels(key + (("le", bound),))} {count}')
+                    lines.append(f'{name}_sum{_format_labels(key)} {histogram.sum}')
+                    lines.append(f'{name}_count{_format_labels(key)} {histogram.count}')
+            for metric_type, values in (('counter', self.counters), ('gauge', self.gauges)):
+                for name, series in sorted(values.items()):
+                    lines += [f'# HELP {name} {HELP.get(name, name)}', f'# TYPE {name} {metric_type}']
+                    for key, value in sorted(series.items()):
+                        lines.append(f'{name}{_format_labels(key)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(key):
+    if not key:
+        return ''
+    labels = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                      for name, value in key)
+    return '{' + labels + '}'
+
+
+registry = Registry()
+
+
+@contextmanager
+def stage_timer(stage):
+    """record the wall clock time of a matching stage in matcher_stage_seconds"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe('matcher_stage_seconds', time.perf_counter() - started, stage=stage)
+
+
+def query_budget(max_queries):
+    """declare the most SQL queries a view may run per request
+
+    checked by QueryMetricsMiddleware in production and by matcher_app.tests.query_budget in the tests - put it
+    above the other view decorators
+    """
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def reset_metrics():
+    """drop all recorded metrics (used by tests)"""
+    global registry
+    registry = Registry()
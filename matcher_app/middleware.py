@@ -0,0 +1,91 @@
+from asgiref.sync import sync_to_async
+from django.db import connections
+from matcher_app import metrics
+from contextlib import ExitStack
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRecorder:
+    """connection.execute_wrapper that counts and times the SQL queries run through it
+
+    the queries of an async view run in pool threads, so the recorder of an async request is kept on the request
+    (request.query_recorder) and installed on those threads by matcher_app.async_views.run_in_pool
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_seconds += time.perf_counter() - started
+
+
+def _add_execute_wrapper(wrapper):
+    for connection in connections.all():
+        connection.execute_wrappers.append(wrapper)
+
+
+def _remove_execute_wrapper(wrapper):
+    for connection in connections.all():
+        connection.execute_wrappers.remove(wrapper)
+
+
+class QueryMetricsMiddleware:
+    """records the time, number of SQL queries and SQL time of every request per view (see matcher_app.metrics)
+
+    requests running more queries than the @metrics.query_budget declared on their view are logged and counted.
+    Works in both sync (WSGI) and async (ASGI) middleware chains.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine  # marks the middleware as async for Django
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        return self.record(request, response, recorder, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        request.query_recorder = recorder = QueryRecorder()
+        started = time.perf_counter()
+        # sync views run in the thread sensitive thread of the request - record the queries made there as well
+        await sync_to_async(_add_execute_wrapper, thread_sensitive=True)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_remove_execute_wrapper, thread_sensitive=True)(recorder)
+        return self.record(request, response, recorder, time.perf_counter() - started)
+
+    def record(self, request, response, recorder, elapsed):
+        match = request.resolver_match
+        if match is None:  # unknown urls are not recorded, so the view label stays bounded
+            return response
+        view = match.view_name  # the dotted path of the view function for unnamed urls
+        registry = metrics.registry
+        registry.observe('matcher_view_seconds', elapsed, view=view)
+        registry.observe('matcher_view_queries', recorder.queries, buckets=metrics.QUERY_BUCKETS, view=view)
+        registry.observe('matcher_view_sql_seconds', recorder.sql_seconds, view=view)
+        budget = getattr(match.func, 'query_budget', None)
+        if budget is not None and recorder.queries > budget:
+            registry.increment('matcher_view_query_budget_exceeded_total', view=view)
+            logger.warning(f'{view} ran {recorder.queries} queries (budget {budget}) for {request.path}')
+        return response
@@ -37,11 +37,25 @@ class Job(models.Model):
         return self.title
 
 
+class JobSkill(models.Model):
+    """a skill a job asks for - a candidate must have every required skill, optional skills only add to the score"""
+    job_id = models.ForeignKey(Job, on_delete=models.CASCADE)
+    skill_id = models.ForeignKey(Skill, on_delete=models.CASCADE)
+    weight = models.FloatField(default=1.0)
+    required = models.BooleanField(default=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['job_id', 'skill_id'], name='unique_job_skill')]
+
+
 class Note(models.Model):
     candidate_id = models.ForeignKey(Candidate, on_delete=models.CASCADE)
     job_id = models.ForeignKey(Job, on_delete=models.CASCADE)
     note = models.TextField()
 
+    class Meta:
+        indexes = [models.Index(fields=['job_id', 'candidate_id'], name='note_job_candidate_idx')]
+
     def __str__(self):
         return self.note
 
@@ -53,6 +67,9 @@ class Like(models.Model):
 
     class Meta:
         ordering = ['-time_liked']
+        # the opinion of a candidate for a job, and the liked candidates of a job newest first
+        indexes = [models.Index(fields=['job_id', 'candidate_id'], name='like_job_candidate_idx'),
+                   models.Index(fields=['job_id', '-time_liked'], name='like_job_time_idx')]
 
 
 class Dislike(models.Model):
@@ -62,6 +79,7 @@ class Dislike(models.Model):
 
     class Meta:
         ordering = ['-time_disliked']
+        indexes = [models.Index(fields=['job_id', 'candidate_id'], name='dislike_job_candidate_idx')]
 
 
 class Match(models.Model):
@@ -71,3 +89,49 @@ class Match(models.Model):
 
     class Meta:
         ordering = ['-time_matched']
+        # a candidate is matched at most once per job - rematching only refreshes time_matched. The constraint's
+        # index also serves the (job_id, candidate_id) lookups.
+        constraints = [models.UniqueConstraint(fields=['job_id', 'candidate_id'], name='unique_match')]
+
+
+class JobStats(models.Model):
+    """counters behind the job stats endpoint - maintained on every write (see matcher_app.job_stats)"""
+    job_id = models.OneToOneField(Job, on_delete=models.CASCADE, primary_key=True)
+    num_likes = models.PositiveIntegerField(default=0)
+    num_dislikes = models.PositiveIntegerField(default=0)
+    num_notes = models.PositiveIntegerField(default=0)
+    num_matches = models.PositiveIntegerField(default=0)
+
+
+class CandidateChange(models.Model):
+    """log of candidate writes replayed over the match index snapshot (see matcher_app.snapshot) - skill_id is set
+    when a skill was deleted, candidate_id otherwise (no foreign keys, the rows outlive deleted candidates)"""
+    candidate_id = models.IntegerField(null=True)
+    skill_id = models.IntegerField(null=True)
+
+
+class PendingMatch(models.Model):
+    """matches waiting to be written to the Match table by `manage.py flush_matches` (see matcher_app.match_writer)"""
+    job_id = models.IntegerField()
+    candidate_ids = models.BinaryField()  # little endian int32 candidate ids
+    time_matched = models.DateTimeField(default=timezone.now)
+
+
+class Version(models.Model):
+    """change counter behind the ETags of the read endpoints (see matcher_app.versions)"""
+    key = models.CharField(max_length=100, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+
+class HistoryRollup(models.Model):
+    """like, dislike or match rows of a closed job and a candidate, rolled up by `manage.py compact_history` (see
+    matcher_app.history) - no foreign keys, the rows outlive deleted jobs and candidates"""
+    kind = models.CharField(max_length=10, choices=[('like', 'like'), ('dislike', 'dislike'), ('match', 'match')])
+    job_id = models.IntegerField()
+    candidate_id = models.IntegerField()
+    count = models.PositiveIntegerField(default=0)
+    first_time = models.DateTimeField()
+    last_time = models.DateTimeField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['job_id', 'kind', 'candidate_id'], name='unique_history_rollup')]
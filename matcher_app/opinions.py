@@ -0,0 +1,79 @@
+"""
+Bulk opinion (like / dislike) submission - used by the bulk opinion endpoint.
+
+Every entry follows the rules of the single opinion endpoint (the job and the candidate must exist, and likes are
+only accepted for open jobs). The referenced jobs and candidates are loaded with one query each, the valid entries
+are saved with one bulk_create per table in a single transaction, and since bulk_create sends no signals the job
+counters and the cached matches of the affected jobs are updated here, once per job.
+"""
+from matcher_app import models, job_stats, signals
+from django.db import transaction
+import logging
+
+logger = logging.getLogger(__name__)
+
+OPINION_FIELDS = {True: 'num_likes', False: 'num_dislikes'}
+
+
+def _validate_entry(entry):
+    """(candidate id, job id, is_liked) of a raw entry, or an error message"""
+    if not isinstance(entry, dict):
+        return 'Entry must be an object with candidate_id, job_id and is_liked'
+    candidate_id, job_id, is_liked = entry.get('candidate_id'), entry.get('job_id'), entry.get('is_liked')
+    if not isinstance(candidate_id, int) or isinstance(candidate_id, bool):
+        return 'Invalid candidate_id'
+    if not isinstance(job_id, int) or isinstance(job_id, bool):
+        return 'Invalid job_id'
+    if not isinstance(is_liked, bool):
+        return 'Invalid option for is_liked field'
+    return candidate_id, job_id, is_liked
+
+
+def add_opinions(entries):
+    """save a list of {candidate_id, job_id, is_liked} entries
+
+    returns one result per entry, in the given order: {"candidate_id", "job_id", "is_liked", "created", "error"}
+    """
+    parsed = [_validate_entry(entry) for entry in entries]
+    valid = [entry for entry in parsed if isinstance(entry, tuple)]
+    job_statuses = dict(models.Job.objects.filter(job_id__in={job_id for _, job_id, _ in valid})
+                        .values_list('job_id', 'status'))
+    candidate_ids = set(models.Candidate.objects.filter(candidate_id__in={candidate_id for candidate_id, _, _ in valid})
+                        .values_list('candidate_id', flat=True))
+
+    results, likes, dislikes, deltas = [], [], [], {}
+    for raw, entry in zip(entries, parsed):
+        if not isinstance(entry, tuple):
+            raw = raw if isinstance(raw, dict) else {}
+            results.append({"candidate_id": raw.get('candidate_id'), "job_id": raw.get('job_id'),
+                            "is_liked": raw.get('is_liked'), "created": False, "error": entry})
+            continue
+        candidate_id, job_id, is_liked = entry
+        result = {"candidate_id": candidate_id, "job_id": job_id, "is_liked": is_liked, "created": False,
+                  "error": None}
+        if job_id not in job_statuses:
+            result["error"] = 'Job does not exist'
+        elif candidate_id not in candidate_ids:
+            result["error"] = 'Candidate does not exist'
+        elif is_liked and job_statuses[job_id] != models.OPENED:
+            result["error"] = 'Job is not open - cannot add like'
+        else:
+            if is_liked:
+                likes.append(models.Like(candidate_id_id=candidate_id, job_id_id=job_id))
+            else:
+                dislikes.append(models.Dislike(candidate_id_id=candidate_id, job_id_id=job_id))
+            job_deltas = deltas.setdefault(job_id, {})
+            job_deltas[OPINION_FIELDS[is_liked]] = job_deltas.get(OPINION_FIELDS[is_liked], 0) + 1
+            result["created"] = True
+        results.append(result)
+
+    with transaction.atomic():
+        models.Like.objects.bulk_create(likes)
+        models.Dislike.objects.bulk_create(dislikes)
+        job_stats.increment_many(deltas)
+        for job_id in deltas:
+            signals.invalidate_job_on_commit(job_id)
+
+    logger.info(f'Added {len(likes)} likes and {len(dislikes)} dislikes ({len(entries) - len(likes) - len(dislikes)}'
+                f' rejected)')
+    return results
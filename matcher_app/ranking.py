@@ -0,0 +1,134 @@
+"""
+Skill rarity ranking of matched candidates.
+
+We assign every skill a weight based on the share of candidates who have it - for example, if 70% of
+candidates know python while only 1% know cobol, cobol is worth far more points than python. Instead of the
+linear points described in the README (70% --> 30 points, 1% --> 99 points), the weight follows an IDF-style
+curve, log((1 + N) / (1 + df)) + 1, so the points grow quickly as a skill becomes rarer.
+
+A candidate's score is the sum of the weights of the job's skills they have, plus the similarity of their title
+to the job title and a small bonus for the rarity of their other skills which mostly serves as a tie breaker.
+The per-skill candidate counts are maintained incrementally by the candidate index (matcher_app.match_index),
+so nothing is recomputed per request: scoring one job's candidates is a single gather over the candidate x skill
+CSR matrix followed by a bincount.
+
+Skills that are implied by another skill of the candidate are discounted: a skill's points shrink by
+REDUNDANCY_FACTOR x the largest P(skill | other skill) over the candidate's more valuable skills, read from the skill
+co-occurrence model (matcher_app.cooccurrence). A candidate with django and python gets less for python than one
+with python alone, while django, which python does not imply, keeps its points.
+"""
+from matcher_app import match_index, cooccurrence
+import numpy as np
+
+OTHER_SKILL_FACTOR = 0.1  # share of a skill's weight a candidate gets for a rare skill the job does not ask for
+TITLE_FACTOR = 1.0  # points for an exact title match - about the weight of a skill every candidate has
+REDUNDANCY_FACTOR = 0.5  # share of a skill's points lost when another skill of the candidate always comes with it
+
+
+def get_skill_weights(index, num_skills):
+    """IDF-style weight of every skill id below num_skills"""
+    counts, num_candidates = index.get_skill_statistics(num_skills)
+    return np.log((1.0 + num_candidates) / (1.0 + counts)) + 1.0
+
+
+def get_title_similarities(candidate_ids, title_matches):
+    """similarity of every candidate's title to the job title, given title_matches = (sorted ids, similarities)"""
+    matched_ids, similarities = title_matches
+    candidate_ids = np.asarray(candidate_ids)
+    if not len(matched_ids):
+        return np.zeros(len(candidate_ids))
+    positions = np.minimum(np.searchsorted(matched_ids, candidate_ids), len(matched_ids) - 1)
+    return np.where(matched_ids[positions] == candidate_ids, similarities[positions], 0.0)
+
+
+def score_candidates(candidate_ids, job_skills, title_matches=None, index=None, skill_cooccurrence=None):
+    """score the given candidates against job_skills ({skill id: importance}) - returns an array of scores
+
+    title_matches optionally holds the (sorted candidate ids, title similarities) of the title match, and
+    skill_cooccurrence the co-occurrence model (the process-wide one by default)
+    """
+    index = index or match_index.get_index()
+    indptr, skill_ids = index.get_skill_matrix(candidate_ids)
+    num_skills = max(int(skill_ids.max()) + 1 if len(skill_ids) else 0, max(job_skills, default=-1) + 1)
+
+    weights = get_skill_weights(index, num_skills)
+    entry_weights = weights * OTHER_SKILL_FACTOR
+    for skill_id, importance in job_skills.items():
+        entry_weights[skill_id] = weights[skill_id] * importance
+
+    entry_points = entry_weights[skill_ids]
+    if len(skill_ids) and REDUNDANCY_FACTOR:
+        skill_cooccurrence = skill_cooccurrence or cooccurrence.get_model()
+        entry_points *= 1.0 - REDUNDANCY_FACTOR * skill_cooccurrence.get_redundancy(indptr, skill_ids, entry_weights)
+
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    scores = np.bincount(rows, weights=entry_points, minlength=len(indptr) - 1).astype(np.float64)  # int if empty
+    if title_matches is not None:
+        scores += TITLE_FACTOR * get_title_similarities(candidate_ids, title_matches)
+    return scores
+
+
+def _top_positions(candidate_ids, scores, k=None):
+    """positions of the k best scoring candidates, best first - ties are broken by candidate id, also at the cut off
+
+    Only the k best candidates are sorted: the k-th best score is found with a partial sort (np.partition).
+    """
+    if k is None or k >= len(candidate_ids):
+        return np.lexsort((candidate_ids, -scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    threshold = -np.partition(-scores, k - 1)[k - 1]
+    above = np.flatnonzero(scores > threshold)
+    ties = np.flatnonzero(scores == threshold)
+    ties = ties[np.argsort(candidate_ids[ties], kind='stable')][:k - len(above)]
+    chosen = np.concatenate((above, ties))
+    return chosen[np.lexsort((candidate_ids[chosen], -scores[chosen]))]
+
+
+def top_k(candidate_ids, scores, k=None):
+    """ids of the k best scoring candidates, best first (ties broken by candidate id) - all candidates if k is None"""
+    candidate_ids = np.asarray(candidate_ids)
+    return candidate_ids[_top_positions(candidate_ids, scores, k)]
+
+
+class RankedCandidates:
+    """the scored candidates of a job - ranks them lazily, so a page of the best k candidates needs no full sort
+
+    Pages are addressed by a cursor, the (score, candidate id) of the last candidate of the previous page. Since
+    the order is strictly by score and then candidate id, a cursor stays valid when candidates are added or removed.
+    """
+
+    def __init__(self, candidate_ids, scores):
+        self.candidate_ids = np.asarray(candidate_ids, dtype=match_index.ID_DTYPE)
+        self.scores = np.asarray(scores, dtype=float)
+        self._ranked_ids = None
+
+    @classmethod
+    def from_ranked(cls, candidate_ids, scores):
+        """candidates that are already ranked best first"""
+        ranked_candidates = cls(candidate_ids, scores)
+        ranked_candidates._ranked_ids = ranked_candidates.candidate_ids
+        return ranked_candidates
+
+    def __len__(self):
+        return len(self.candidate_ids)
+
+    def ranked_ids(self):
+        """ids of all candidates, best first"""
+        if self._ranked_ids is None:
+            self._ranked_ids = top_k(self.candidate_ids, self.scores)
+        return self._ranked_ids
+
+    def page(self, limit, after=None):
+        """(ids of the best `limit` candidates ranked after the `after` cursor, cursor of the next page or None)"""
+        candidate_ids, scores = self.candidate_ids, self.scores
+        if after is not None:
+            after_score, after_id = after
+            remaining = (scores < after_score) | ((scores == after_score) & (candidate_ids > after_id))
+            candidate_ids, scores = candidate_ids[remaining], scores[remaining]
+        positions = _top_positions(candidate_ids, scores, limit)
+        next_cursor = None
+        if len(positions) and len(positions) < len(candidate_ids):
+            last = positions[-1]
+            next_cursor = (float(scores[last]), int(candidate_ids[last]))
+        return candidate_ids[positions], next_cursor
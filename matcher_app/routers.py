@@ -0,0 +1,70 @@
+"""
+Database router sending the reads of the read-only endpoints to a replica.
+
+Views decorated with replica_reads run the reads of their GET requests on the MATCHER_REPLICA_DATABASE alias (a
+streaming replica of the primary), everything else - writes, the reads of write requests, and reads inside a
+transaction on the primary - stays on the primary. Endpoints whose GET requests also write (e.g.
+/candidates/<job_id>/, which stores the matches it computes) are left on the primary, so they never compute results
+from a replica lagging behind their own writes.
+"""
+from contextlib import contextmanager
+from functools import wraps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+import threading
+
+READ_METHODS = ('GET', 'HEAD')
+
+_state = threading.local()
+
+
+@contextmanager
+def read_only():
+    """route the reads of the block in this thread to the replica"""
+    previous = getattr(_state, 'read_only', False)
+    _state.read_only = True
+    try:
+        yield
+    finally:
+        _state.read_only = previous
+
+
+def is_read_only():
+    return getattr(_state, 'read_only', False)
+
+
+def reads_from_replica():
+    """whether reads in this thread go to the replica - in a read_only block, outside a transaction on the primary,
+    with a replica configured"""
+    return (settings.MATCHER_REPLICA_DATABASE is not None and is_read_only()
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block)
+
+
+def replica_reads(view):
+    """decorator running the reads of a view's GET requests on the replica - put it below query_budget, so that the
+    ETag lookups of the view are routed too"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in READ_METHODS:
+            return view(request, *args, **kwargs)
+        with read_only():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    """reads in read_only blocks go to MATCHER_REPLICA_DATABASE when it is set, everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        return settings.MATCHER_REPLICA_DATABASE if reads_from_replica() else None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # the replica holds the same rows as the primary
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == settings.MATCHER_REPLICA_DATABASE:  # the replica receives its schema from the primary
+            return False
+        return None
@@ -0,0 +1,123 @@
+"""
+Matching one broad job on several cores.
+
+For the broadest jobs most of a request goes into filtering the hundreds of thousands of candidates matched by title
+and skill and into scoring them. With MATCHER_SHARD_WORKERS > 1, jobs whose title and skill matches hold at least
+MATCHER_SHARD_MIN_CANDIDATES candidates are split by candidate id range into one shard per worker - the boundaries
+are quantiles of the matched ids, so the shards are about the same size. Every shard is filtered (title / skill
+intersection, opinions) and scored in a pool of forked processes. The workers inherit the candidate index, the
+skill co-occurrence model and the matches of the job rather than receiving copies: their arrays are shared with the
+request process copy-on-write, or through the page cache when the index is memory-mapped from a snapshot.
+
+Each shard comes back ranked best first. Since the shards hold increasing id ranges, a stable merge of the shards
+by score keeps ties ordered by candidate id, so the job's ranking is the same as without sharding.
+
+The pool is forked for the job at hand, since that is how its workers see the index and the job's arrays of this
+very moment without copying them. Forking is only safe from a process running a single thread - a lock held by
+another thread at the time of the fork (logging, the index lock, a database driver) would stay held forever in the
+children - so jobs are only sharded by the main thread of a single threaded worker (e.g. a sync gunicorn worker or a
+management command), one job at a time. Smaller jobs, jobs matched by threaded or async workers or inside a pool
+worker (matcher_app.batch) and platforms without fork are matched in the calling process.
+"""
+from matcher_app import ranking
+from django.conf import settings
+import multiprocessing
+import numpy as np
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+_job = None  # what the workers need to filter and score the shards of the job being matched - set before forking
+_job_lock = threading.Lock()  # held while _job is set and the pool of its job runs
+
+
+def get_fork_context():
+    """multiprocessing context forking the current process, or None on platforms without fork"""
+    try:
+        return multiprocessing.get_context('fork')
+    except ValueError:
+        return None
+
+
+def can_fork():
+    """whether this process can fork a pool - it has fork, is not a pool worker itself and runs a single thread"""
+    return (get_fork_context() is not None and not multiprocessing.current_process().daemon
+            and threading.current_thread() is threading.main_thread() and threading.active_count() == 1)
+
+
+def should_shard(num_candidates, workers=None):
+    """whether a job with num_candidates title and skill matches is matched in shards"""
+    workers = settings.MATCHER_SHARD_WORKERS if workers is None else workers
+    return workers > 1 and num_candidates >= settings.MATCHER_SHARD_MIN_CANDIDATES and can_fork()
+
+
+def get_shard_bounds(candidate_ids, num_shards):
+    """[start, stop) id ranges splitting the sorted candidate_ids into up to num_shards shards of about the same size"""
+    if not len(candidate_ids):
+        return []
+    positions = np.linspace(0, len(candidate_ids), num_shards + 1).astype(np.int64)[1:-1]
+    bounds = np.unique(np.concatenate(([candidate_ids[0]], candidate_ids[positions], [candidate_ids[-1] + 1])))
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+
+def _in_range(sorted_ids, start, stop):
+    return slice(np.searchsorted(sorted_ids, start), np.searchsorted(sorted_ids, stop))
+
+
+def filter_shard(start, stop, title_ids, skill_ids, opinionated_candidates, use_union=False):
+    """ids in [start, stop) of the candidates matched by title and skill (by either with use_union) who received no
+    opinion - every given array is sorted"""
+    title_ids, skill_ids = title_ids[_in_range(title_ids, start, stop)], skill_ids[_in_range(skill_ids, start, stop)]
+    if use_union:
+        candidate_ids = np.union1d(title_ids, skill_ids)
+    else:
+        candidate_ids = np.intersect1d(title_ids, skill_ids, assume_unique=True)
+    return np.setdiff1d(candidate_ids, opinionated_candidates[_in_range(opinionated_candidates, start, stop)],
+                        assume_unique=True)
+
+
+def score_shard(task):
+    """pool task - (candidate ids, scores) of one shard, best first"""
+    start, stop, use_union = task
+    title_matches, skill_ids, opinionated_candidates, job_skills, index, skill_cooccurrence = _job
+    title_ids, title_similarities = title_matches
+    candidate_ids = filter_shard(start, stop, title_ids, skill_ids, opinionated_candidates, use_union)
+    title_range = _in_range(title_ids, start, stop)
+    scores = ranking.score_candidates(candidate_ids, job_skills.weights,
+                                      (title_ids[title_range], title_similarities[title_range]), index,
+                                      skill_cooccurrence)
+    order = np.lexsort((candidate_ids, -scores))
+    return candidate_ids[order], scores[order]
+
+
+def merge_shards(shards):
+    """ranking.RankedCandidates of the ranked shards, which hold increasing id ranges"""
+    candidate_ids = np.concatenate([candidate_ids for candidate_ids, _ in shards])
+    scores = np.concatenate([scores for _, scores in shards])
+    order = np.argsort(-scores, kind='stable')  # merges the ranked shards, ties stay ordered by id
+    return ranking.RankedCandidates.from_ranked(candidate_ids[order], scores[order])
+
+
+def match_in_shards(title_matches, skill_ids, opinionated_candidates, job_skills, index, skill_cooccurrence,
+                    workers=None):
+    """filter and rank the candidates of a job in a pool of workers - returns the ranking.RankedCandidates
+
+    candidates matched by both title and skill are ranked, or by either of them when no candidate matches both
+    (like matcher_app.candidate_finder.match_job)
+    """
+    global _job
+    workers = workers or settings.MATCHER_SHARD_WORKERS
+    bounds = get_shard_bounds(np.union1d(title_matches[0], skill_ids), workers)
+    with _job_lock:
+        _job = (title_matches, skill_ids, opinionated_candidates, job_skills, index, skill_cooccurrence)
+        try:
+            # workers never touch the database, so the connections of the request process are left alone
+            with get_fork_context().Pool(min(workers, max(len(bounds), 1))) as pool:
+                shards = pool.map(score_shard, [(start, stop, False) for start, stop in bounds])
+                if not any(len(candidate_ids) for candidate_ids, _ in shards):
+                    shards = pool.map(score_shard, [(start, stop, True) for start, stop in bounds])
+        finally:
+            _job = None
+    logger.info(f'Ranked {sum(len(candidate_ids) for candidate_ids, _ in shards)} candidates in {len(bounds)} shards')
+    return merge_shards(shards) if shards else ranking.RankedCandidates([], [])
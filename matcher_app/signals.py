@@ -0,0 +1,240 @@
+"""
+keeps the in-memory candidate index (matcher_app.match_index) in sync with writes to the database,
+invalidates the cached match results (matcher_app.match_cache) that the writes affect - a candidate write only those
+of the jobs matching the candidate's title or asking for the skills it changes - and maintains the
+per-job counters (matcher_app.job_stats), the change counters behind the ETags (matcher_app.versions) and the
+skill registry (matcher_app.skill_registry). With match index snapshots enabled, candidate writes are also logged
+as CandidateChange rows, so indexes loaded from a snapshot can replay them (matcher_app.snapshot).
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from matcher_app import models, match_index, match_cache, job_stats, snapshot, versions, skill_registry, \
+    candidate_finder, title_similarity
+
+
+def _update_index_on_commit(method_name, *args):
+    """apply an update to the loaded index once the surrounding transaction commits (rolled back writes are ignored)"""
+    transaction.on_commit(lambda: match_index.apply_update(method_name, *args))
+
+
+def log_candidate_changes(candidate_ids=(), skill_id=None):
+    """log changed candidates (or a deleted skill) for the indexes that will be loaded from the current snapshot"""
+    if snapshot.get_directory() is None:
+        return
+    changes = [models.CandidateChange(candidate_id=candidate_id) for candidate_id in candidate_ids]
+    if skill_id is not None:
+        changes.append(models.CandidateChange(skill_id=skill_id))
+    models.CandidateChange.objects.bulk_create(changes)
+
+
+def invalidate_job_on_commit(job_id):
+    """drop the cached matches of a job and bump its version once the surrounding transaction commits"""
+    transaction.on_commit(lambda: match_cache.get_cache().invalidate_job(job_id))
+    versions.bump_on_commit(versions.job_key(job_id))
+
+
+def invalidate_all_on_commit():
+    """drop the cached matches of every job and bump the candidates version once the surrounding transaction commits"""
+    transaction.on_commit(lambda: match_cache.get_cache().invalidate_all())
+    versions.bump_on_commit(versions.CANDIDATES)
+
+
+def invalidate_jobs_on_commit(job_ids):
+    """drop the cached matches of the given jobs and bump their candidates versions once the surrounding transaction
+    commits"""
+    job_ids = sorted(job_ids)
+    if not job_ids:
+        return
+
+    def invalidate():
+        cache = match_cache.get_cache()
+        for job_id in job_ids:
+            cache.invalidate_job(job_id)
+
+    transaction.on_commit(invalidate)
+    versions.bump_on_commit(*[versions.candidates_key(job_id) for job_id in job_ids])
+
+
+class CandidateJobsInvalidation:
+    """the titles and skills touched by the candidate writes of a transaction - once it commits, the jobs whose
+    matches they may change are looked up and invalidated, once for all the writes:
+        * the open jobs matching one of the titles by spelling, or by meaning with the title vectors the worker has
+          loaded (a worker without them has no results computed with them) - every job when there are more than
+          MATCHER_INVALIDATION_MAX_JOBS open jobs to go through, or when no candidate index is loaded
+        * the open jobs asking for one of the skills
+    """
+
+    def __init__(self):
+        self.titles = set()
+        self.skill_ids = set()
+
+    def __call__(self):
+        if self.titles and match_index.get_loaded_index() is None:
+            invalidate_all_on_commit()
+            return
+        job_ids = candidate_finder.get_jobs_with_skills(self.skill_ids)
+        if self.titles:
+            title_job_ids = candidate_finder.get_jobs_matching_titles(
+                self.titles, title_similarity.get_loaded_vectors(), settings.MATCHER_INVALIDATION_MAX_JOBS)
+            if title_job_ids is None:
+                invalidate_all_on_commit()
+                return
+            job_ids |= title_job_ids
+        invalidate_jobs_on_commit(job_ids)
+
+
+def invalidate_candidate_jobs_on_commit(titles=(), skill_ids=()):
+    """invalidate the jobs whose matches a candidate write may change once the surrounding transaction commits - the
+    jobs matching one of the candidate's titles before or after the write, and those asking for one of the skills it
+    gained or lost (see CandidateJobsInvalidation)"""
+    connection = transaction.get_connection()
+    pending = None
+    if connection.in_atomic_block:  # add to the lookup of an earlier write of the transaction
+        pending = next((entry[1] for entry in connection.run_on_commit
+                        if isinstance(entry[1], CandidateJobsInvalidation)), None)
+    invalidation = pending or CandidateJobsInvalidation()
+    invalidation.titles.update(title for title in titles if title)
+    invalidation.skill_ids.update(skill_ids)
+    if pending is None:
+        transaction.on_commit(invalidation)
+
+
+def _get_indexed_candidate(candidate_id):
+    """(title, skill ids) of a candidate in the loaded index - its state before the write, since the index is only
+    updated once the write commits. None when no index is loaded or the candidate is not indexed yet."""
+    index = match_index.get_loaded_index()
+    return index.get_candidate(candidate_id) if index is not None else None
+
+
+@receiver(post_save, sender=models.Candidate)
+def candidate_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:  # loaddata - fixtures are loaded before the index is built
+        return
+    indexed = _get_indexed_candidate(instance.candidate_id)
+    _update_index_on_commit('set_title', instance.candidate_id, instance.title)
+    log_candidate_changes([instance.candidate_id])
+    if created:  # skills are added afterwards, and invalidate the jobs asking for them
+        invalidate_candidate_jobs_on_commit([instance.title])
+    elif indexed is None:  # the title it had is not known
+        invalidate_all_on_commit()
+    elif indexed[0] != instance.title:
+        invalidate_candidate_jobs_on_commit([indexed[0], instance.title])
+
+
+@receiver(post_delete, sender=models.Candidate)
+def candidate_deleted(sender, instance, **kwargs):
+    indexed = _get_indexed_candidate(instance.candidate_id)
+    _update_index_on_commit('remove_candidate', instance.candidate_id)
+    log_candidate_changes([instance.candidate_id])
+    if indexed is None:
+        invalidate_all_on_commit()
+    else:
+        invalidate_candidate_jobs_on_commit([instance.title], indexed[1])
+
+
+def _update_skill_registry_on_commit(method_name, *args):
+    """apply an update to the loaded skill registry once the surrounding transaction commits"""
+    def apply_update():
+        registry = skill_registry.get_loaded_registry()
+        if registry is not None:
+            getattr(registry, method_name)(*args)
+
+    transaction.on_commit(apply_update)
+
+
+@receiver(post_save, sender=models.Skill)
+def skill_saved(sender, instance, **kwargs):
+    _update_skill_registry_on_commit('add', instance.id, instance.skill_name)
+
+
+@receiver(post_delete, sender=models.Skill)
+def skill_deleted(sender, instance, **kwargs):
+    _update_skill_registry_on_commit('remove', instance.id)
+    _update_index_on_commit('remove_skill', instance.id)
+    log_candidate_changes(skill_id=instance.id)
+    invalidate_candidate_jobs_on_commit(skill_ids=[instance.id])
+
+
+@receiver(m2m_changed, sender=models.Candidate.skills.through)
+def candidate_skills_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and not reverse:
+        # the skills about to be cleared are only known now, from the index (updated once the write commits)
+        indexed = _get_indexed_candidate(instance.candidate_id)
+        if indexed is None:
+            invalidate_all_on_commit()
+        else:
+            invalidate_candidate_jobs_on_commit(skill_ids=indexed[1])
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        if reverse:  # skill.candidate_set.clear() - nobody has the skill anymore
+            invalidate_candidate_jobs_on_commit(skill_ids=[instance.id])
+            _update_index_on_commit('remove_skill', instance.id)
+            log_candidate_changes(skill_id=instance.id)
+        else:
+            _update_index_on_commit('set_skills', instance.candidate_id, [])
+            log_candidate_changes([instance.candidate_id])
+        return
+
+    method_name = 'add_skills' if action == 'post_add' else 'remove_skills'
+    if reverse:  # instance is a Skill and pk_set holds candidate ids
+        invalidate_candidate_jobs_on_commit(skill_ids=[instance.id])
+        for candidate_id in pk_set:
+            _update_index_on_commit(method_name, candidate_id, [instance.id])
+        log_candidate_changes(sorted(pk_set))
+    else:
+        invalidate_candidate_jobs_on_commit(skill_ids=pk_set)
+        _update_index_on_commit(method_name, instance.candidate_id, set(pk_set))
+        log_candidate_changes([instance.candidate_id])
+
+
+@receiver(post_save, sender=models.Job)
+@receiver(post_delete, sender=models.Job)
+def job_changed(sender, instance, **kwargs):
+    invalidate_job_on_commit(instance.job_id)
+
+
+@receiver(post_save, sender=models.Job)
+def job_created(sender, instance, created, **kwargs):
+    if created:
+        job_stats.create_empty(instance.job_id)
+
+
+@receiver(post_save, sender=models.JobSkill)
+@receiver(post_delete, sender=models.JobSkill)
+def job_skill_changed(sender, instance, **kwargs):
+    invalidate_job_on_commit(instance.job_id_id)
+
+
+@receiver(post_save, sender=models.Like)
+@receiver(post_delete, sender=models.Like)
+@receiver(post_save, sender=models.Dislike)
+@receiver(post_delete, sender=models.Dislike)
+def opinion_changed(sender, instance, **kwargs):
+    invalidate_job_on_commit(instance.job_id_id)
+
+
+@receiver(post_save, sender=models.Note)
+@receiver(post_delete, sender=models.Note)
+def note_changed(sender, instance, **kwargs):
+    versions.bump_on_commit(versions.job_key(instance.job_id_id))  # notes are returned with the liked candidates
+
+
+COUNTED_MODELS = {models.Like: 'num_likes', models.Dislike: 'num_dislikes', models.Note: 'num_notes'}
+
+
+@receiver(post_save, sender=models.Like)
+@receiver(post_save, sender=models.Dislike)
+@receiver(post_save, sender=models.Note)
+def counted_row_saved(sender, instance, created, **kwargs):
+    if created:
+        job_stats.increment(instance.job_id_id, COUNTED_MODELS[sender])
+
+
+@receiver(post_delete, sender=models.Like)
+@receiver(post_delete, sender=models.Dislike)
+@receiver(post_delete, sender=models.Note)
+def counted_row_deleted(sender, instance, **kwargs):
+    job_stats.increment(instance.job_id_id, COUNTED_MODELS[sender], -1)
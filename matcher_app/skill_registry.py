@@ -0,0 +1,156 @@
+"""
+Skill names resolved to skill ids in memory, the same way for job requests, job skill updates and imports.
+
+Names are compared by their normalized form - single spaced and lowercased, so "javascript ", "JavaScript" and
+"Javascript" are the same skill - after mapping aliases to their skill: the alias table (MATCHER_SKILL_ALIASES_PATH,
+a JSON list of groups whose first name is the skill) turns "JS" into Javascript and "PostgreSQL" into Postgres.
+
+The registry of a process is loaded with one query on first use and kept in sync with the Skill writes of the
+process by signals (matcher_app.signals). Skills created by other processes are picked up on a miss, which looks the
+single name up in the database, and every registry is reloaded once it is older than MATCHER_INDEX_MAX_AGE. Prefix
+lookups for autocomplete go through the sorted normalized names, where the names starting with a prefix are one
+contiguous range found by bisection.
+"""
+from matcher_app import models
+from django.conf import settings
+from bisect import bisect_left, insort
+import threading
+import logging
+import json
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(name):
+    """the form skill names are compared in - single spaced and lowercased"""
+    return ' '.join(str(name).split()).lower()
+
+
+def load_aliases(path=None):
+    """{normalized alias: normalized skill name} read from a JSON list of alias groups - the first name is the skill"""
+    path = path or settings.MATCHER_SKILL_ALIASES_PATH
+    if not path:
+        return {}
+    with open(path) as aliases_file:
+        groups = json.load(aliases_file)
+    return {normalize(alias): normalize(group[0]) for group in groups for alias in group[1:]}
+
+
+class SkillRegistry:
+    """normalized skill name -> skill id, and the stored name of every skill id"""
+
+    def __init__(self, skills, aliases):
+        self.aliases = aliases
+        self.lock = threading.Lock()
+        self.ids = {}
+        self.names = {}
+        for skill_id, name in sorted(skills):
+            if normalize(name) not in self.ids:  # the oldest of skills differing only in case or spacing wins
+                self.ids[normalize(name)] = skill_id
+            self.names[skill_id] = name
+        self.sorted_names = sorted(self.ids)
+        self.loaded_at = time.monotonic()
+
+    @classmethod
+    def load(cls):
+        return cls(models.Skill.objects.values_list('id', 'skill_name'), load_aliases())
+
+    def canonical(self, name):
+        """the normalized name of the skill a name stands for, after resolving aliases"""
+        name = normalize(name)
+        return self.aliases.get(name, name)
+
+    def lookup(self, name):
+        """id of the skill with the given name or alias known to the registry, or None - never reads the database"""
+        return self.ids.get(self.canonical(name))
+
+    def resolve(self, name):
+        """id of the skill with the given name or alias, or None if there is none - a miss reads the database once"""
+        name = self.canonical(name)
+        skill_id = self.ids.get(name)
+        if skill_id is None and name:
+            skill = models.Skill.objects.filter(skill_name__iexact=name).order_by('id').values_list('id', 'skill_name')
+            for skill_id, stored_name in skill[:1]:
+                self.add(skill_id, stored_name)
+        return skill_id
+
+    def resolve_many(self, names):
+        """{name: skill id} of the given names - unknown names are left out"""
+        skill_ids = {name: self.resolve(name) for name in names}
+        return {name: skill_id for name, skill_id in skill_ids.items() if skill_id is not None}
+
+    def get_name(self, skill_id):
+        return self.names.get(skill_id)
+
+    def complete(self, prefix, limit=10):
+        """[(skill id, name)] of up to limit skills whose name or alias starts with prefix, in name order"""
+        prefix = normalize(prefix)
+        matches = {}
+        for name in self._names_starting_with(self.sorted_names, prefix):
+            matches.setdefault(self.ids[name], name)
+        for alias, name in self.aliases.items():
+            if alias.startswith(prefix) and name in self.ids:
+                matches.setdefault(self.ids[name], name)
+        ordered = sorted(matches.items(), key=lambda match: match[1])[:limit]
+        return [(skill_id, self.names[skill_id]) for skill_id, _ in ordered]
+
+    @staticmethod
+    def _names_starting_with(sorted_names, prefix):
+        for position in range(bisect_left(sorted_names, prefix), len(sorted_names)):
+            if not sorted_names[position].startswith(prefix):
+                return
+            yield sorted_names[position]
+
+    def add(self, skill_id, name):
+        """register a new or renamed skill"""
+        with self.lock:
+            self._remove(skill_id)
+            self.names[skill_id] = name
+            if self.ids.setdefault(normalize(name), skill_id) == skill_id:
+                insort(self.sorted_names, normalize(name))
+
+    def remove(self, skill_id):
+        """forget a deleted skill"""
+        with self.lock:
+            self._remove(skill_id)
+
+    def _remove(self, skill_id):
+        name = self.names.pop(skill_id, None)
+        if name is not None and self.ids.get(normalize(name)) == skill_id:
+            del self.ids[normalize(name)]
+            self.sorted_names.remove(normalize(name))
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """return the process-wide registry, loading it on first use and once it is older than MATCHER_INDEX_MAX_AGE"""
+    global _registry
+    registry = _registry
+    max_age = getattr(settings, 'MATCHER_INDEX_MAX_AGE', None)
+    if registry is None or (max_age is not None and time.monotonic() - registry.loaded_at > max_age):
+        with _registry_lock:
+            if _registry is registry:
+                started = time.monotonic()
+                _registry = SkillRegistry.load()
+                logger.info(f'Loaded {len(_registry.names)} skills in {time.monotonic() - started:.3f}s')
+    return _registry
+
+
+def get_loaded_registry():
+    """return the process-wide registry if it has already been loaded, without loading it"""
+    return _registry
+
+
+def reset_registry():
+    """drop the process-wide registry (used by tests)"""
+    global _registry
+    _registry = None
+
+
+def resolve(name):
+    """id of the skill with the given name or alias, or None"""
+    return get_registry().resolve(name)
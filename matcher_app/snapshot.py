@@ -0,0 +1,108 @@
+"""
+On-disk snapshots of the candidate index (matcher_app.match_index), written by `manage.py build_match_snapshot`.
+
+A snapshot is a directory of flat .npy arrays - the CSR candidate rows, the title and skill postings and the
+per-skill candidate counts - plus the distinct titles and a manifest. Workers memory-map the arrays read-only, so
+loading a snapshot reads no table and the pages are shared by every worker on the machine through the page cache.
+The index never mutates its base arrays (updates go to copy-on-write overrides), which is what makes read-only
+mappings possible.
+
+Every snapshot gets a version stamp and lives in its own directory under MATCHER_SNAPSHOT_DIR, next to a CURRENT
+file naming the latest version. The manifest also records the format version - snapshots of another format are
+ignored and the index is built from the database - and how far the snapshot reaches (the last candidate id and the
+last CandidateChange id), so the writes made since the snapshot can be replayed over it as a delta overlay.
+"""
+from django.conf import settings
+from datetime import datetime
+import numpy as np
+import logging
+import shutil
+import json
+import os
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+CURRENT_FILE = 'CURRENT'
+MANIFEST_FILE = 'manifest.json'
+TITLES_FILE = 'titles.json'
+KEPT_VERSIONS = 2  # the current snapshot and the one before it, which workers may still have mapped
+
+
+class Snapshot:
+    """a loaded snapshot - memory-mapped arrays by name, the distinct titles and the manifest"""
+
+    def __init__(self, version, manifest, arrays, titles):
+        self.version = version
+        self.manifest = manifest
+        self.arrays = arrays
+        self.titles = titles
+
+
+def get_directory():
+    return getattr(settings, 'MATCHER_SNAPSHOT_DIR', None)
+
+
+def _write_json(path, data):
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'w') as output:
+        json.dump(data, output)
+    os.replace(temporary_path, path)
+
+
+def get_current_version(directory):
+    """version stamp of the latest snapshot in directory, or None if there is none"""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as current:
+            return current.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def write(directory, arrays, titles, **metadata):
+    """write a new snapshot of the given arrays ({name: array}) and titles and make it current - returns its version
+
+    metadata is stored in the manifest
+    """
+    version = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S%f')}-{os.getpid()}"
+    version_directory = os.path.join(directory, version)
+    os.makedirs(version_directory)
+    for name, array in arrays.items():
+        np.save(os.path.join(version_directory, f'{name}.npy'), np.ascontiguousarray(array))
+    _write_json(os.path.join(version_directory, TITLES_FILE), titles)
+    _write_json(os.path.join(version_directory, MANIFEST_FILE),
+                dict(metadata, format=FORMAT_VERSION, version=version, arrays=sorted(arrays)))
+
+    temporary_path = os.path.join(directory, f'{CURRENT_FILE}.{os.getpid()}.tmp')
+    with open(temporary_path, 'w') as current:
+        current.write(version)
+    os.replace(temporary_path, os.path.join(directory, CURRENT_FILE))
+    _remove_old_versions(directory, version)
+    return version
+
+
+def _remove_old_versions(directory, current_version):
+    versions = sorted(name for name in os.listdir(directory)
+                      if os.path.isfile(os.path.join(directory, name, MANIFEST_FILE)) and name != current_version)
+    for version in versions[:max(len(versions) - (KEPT_VERSIONS - 1), 0)]:
+        # processes that mapped the arrays keep them readable after the files are unlinked
+        shutil.rmtree(os.path.join(directory, version), ignore_errors=True)
+
+
+def read(directory):
+    """memory-map the current snapshot in directory - None if there is none or it has another format"""
+    version = get_current_version(directory)
+    if version is None:
+        return None
+    version_directory = os.path.join(directory, version)
+    with open(os.path.join(version_directory, MANIFEST_FILE)) as manifest_file:
+        manifest = json.load(manifest_file)
+    if manifest.get('format') != FORMAT_VERSION:
+        logger.warning(f'Ignoring match index snapshot {version} of format {manifest.get("format")} '
+                       f'(expected {FORMAT_VERSION})')
+        return None
+    arrays = {name: np.load(os.path.join(version_directory, f'{name}.npy'), mmap_mode='r')
+              for name in manifest['arrays']}
+    with open(os.path.join(version_directory, TITLES_FILE)) as titles_file:
+        titles = json.load(titles_file)
+    return Snapshot(version, manifest, arrays, titles)
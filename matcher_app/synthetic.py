@@ -0,0 +1,108 @@
+"""
+Deterministic synthetic data for benchmarks (see matcher_app.benchmark).
+
+The same parameters and seed always produce the same rows:
+    * skills with Zipf distributed popularity - skill k is picked with a probability proportional to 1 / k^zipf_a,
+      so a few skills are held by most candidates and most skills are rare, like real skill data
+    * titles built from a vocabulary of seniorities, areas and roles, also picked with Zipf popularity
+    * jobs asking for a title and a skill drawn from the same distributions
+    * likes / dislikes for a share of the candidates of every job, and notes for a share of the likes
+"""
+from matcher_app import models, importer, job_stats
+import numpy as np
+
+SENIORITIES = ('', 'Junior', 'Senior', 'Lead', 'Principal', 'Staff')
+AREAS = ('Software', 'Backend', 'Frontend', 'Data', 'Mobile', 'Cloud', 'Security', 'Embedded', 'Game', 'Web')
+ROLES = ('Developer', 'Engineer', 'Scientist', 'Analyst', 'Architect', 'Manager', 'Designer', 'Consultant')
+
+
+class SyntheticDataConfig:
+    """parameters of the generated data"""
+
+    def __init__(self, num_candidates=1000, num_skills=200, num_titles=100, num_jobs=50, skills_per_candidate=5,
+                 zipf_a=1.1, opinion_density=0.01, like_ratio=0.5, note_density=0.5, seed=0):
+        self.num_candidates = num_candidates
+        self.num_skills = num_skills
+        self.num_titles = min(num_titles, len(SENIORITIES) * len(AREAS) * len(ROLES))
+        self.num_jobs = num_jobs
+        self.skills_per_candidate = skills_per_candidate  # average number of skills of a candidate
+        self.zipf_a = zipf_a
+        self.opinion_density = opinion_density  # share of all candidates that get an opinion for every job
+        self.like_ratio = like_ratio  # share of the opinions that are likes
+        self.note_density = note_density  # share of the likes that get a note
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def zipf_probabilities(size, a):
+    """probabilities of picking each of size items when item k is picked proportionally to 1 / k^a"""
+    weights = 1.0 / np.arange(1, size + 1) ** a
+    return weights / weights.sum()
+
+
+def skill_names(config):
+    return [f'Skill{rank:05d}' for rank in range(config.num_skills)]
+
+
+def title_vocabulary(config):
+    """the num_titles distinct titles, spread over the whole vocabulary (most popular first)"""
+    titles = [' '.join(word for word in (seniority, area, role) if word)
+              for role in ROLES for area in AREAS for seniority in SENIORITIES]
+    order = np.random.RandomState(config.seed).permutation(len(titles))[:config.num_titles]
+    return [titles[i] for i in order]
+
+
+def generate_candidates(config, chunk_size=10000):
+    """yield (title, skill names) rows for config.num_candidates candidates, generated chunk by chunk"""
+    rng = np.random.RandomState(config.seed)
+    skills = skill_names(config)
+    titles = title_vocabulary(config)
+    skill_probabilities = zipf_probabilities(len(skills), config.zipf_a)
+    title_probabilities = zipf_probabilities(len(titles), config.zipf_a)
+    for start in range(0, config.num_candidates, chunk_size):
+        size = min(chunk_size, config.num_candidates - start)
+        title_picks = rng.choice(len(titles), size=size, p=title_probabilities)
+        counts = 1 + rng.poisson(max(config.skills_per_candidate - 1, 0), size=size)
+        skill_picks = rng.choice(len(skills), size=counts.sum(), p=skill_probabilities)
+        bounds = np.concatenate(([0], np.cumsum(counts)))
+        for row in range(size):
+            row_skills = np.unique(skill_picks[bounds[row]:bounds[row + 1]])
+            yield titles[title_picks[row]], [skills[pick] for pick in row_skills]
+
+
+def populate(config, chunk_size=5000):
+    """fill the database with the synthetic data - returns the ids of the created jobs"""
+    importer.import_candidates(generate_candidates(config), chunk_size=chunk_size)
+
+    rng = np.random.RandomState(config.seed + 1)
+    skills = skill_names(config)
+    titles = title_vocabulary(config)
+    skill_picks = rng.choice(len(skills), size=config.num_jobs, p=zipf_probabilities(len(skills), config.zipf_a))
+    title_picks = rng.choice(len(titles), size=config.num_jobs, p=zipf_probabilities(len(titles), config.zipf_a))
+    models.Job.objects.bulk_create(
+        [models.Job(title=titles[title_pick], skill=skills[skill_pick], status=models.OPENED)
+         for title_pick, skill_pick in zip(title_picks, skill_picks)], batch_size=chunk_size)
+    job_ids = list(models.Job.objects.order_by('job_id').values_list('job_id', flat=True))
+    candidate_ids = np.array(models.Candidate.objects.order_by('candidate_id').values_list('candidate_id', flat=True))
+
+    num_opinions = min(int(round(config.opinion_density * len(candidate_ids))), len(candidate_ids))
+    likes, dislikes, notes = [], [], []
+    for job_id in job_ids:
+        opinionated = rng.choice(candidate_ids, size=num_opinions, replace=False)
+        is_liked = rng.random_sample(num_opinions) < config.like_ratio
+        has_note = rng.random_sample(num_opinions) < config.note_density
+        for candidate_id, liked, noted in zip(opinionated.tolist(), is_liked, has_note):
+            if liked:
+                likes.append(models.Like(candidate_id_id=candidate_id, job_id_id=job_id))
+                if noted:
+                    notes.append(models.Note(candidate_id_id=candidate_id, job_id_id=job_id,
+                                             note=f'Synthetic note for candidate {candidate_id}'))
+            else:
+                dislikes.append(models.Dislike(candidate_id_id=candidate_id, job_id_id=job_id))
+    for model, rows in ((models.Like, likes), (models.Dislike, dislikes), (models.Note, notes)):
+        model.objects.bulk_create(rows, batch_size=chunk_size)
+    for start in range(0, len(job_ids), 500):  # stays below the sqlite limit of query parameters
+        job_stats.rebuild_job_stats(job_ids[start:start + 500])
+    return job_ids
@@ -1,2 +1,24 @@
 from .models import *
 from .views import *
+from .match_index import *
+from .candidate_finder import *
+from .match_cache import *
+from .utils import *
+from .batch import *
+from .job_stats import *
+from .importer import *
+from .opinions import *
+from .query_budget import *
+from .benchmark import *
+from .job_skills import *
+from .cooccurrence import *
+from .snapshot import *
+from .title_similarity import *
+from .match_writer import *
+from .conditional_get import *
+from .sharding import *
+from .skill_registry import *
+from .async_views import *
+from .routers import *
+from .indexes import *
+from .history import *
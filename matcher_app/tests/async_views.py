@@ -0,0 +1,108 @@
+from asgiref.sync import sync_to_async
+from django.test import TransactionTestCase, override_settings
+from django.urls import path
+from matcher_app import async_views, load_test, match_cache, match_index, metrics, skill_registry, urls
+from matcher_app.models import Candidate, Skill, Job, Like, Note
+
+# this module is the urlconf of the tests - the sync urls with the read endpoints served by the async views
+urlpatterns = [
+    path('candidates/<int:job_id>/', async_views.get_all_candidates_for_job),
+    path('candidates/liked/<int:job_id>/', async_views.get_data_for_liked_candidates),
+    path('job/', async_views.handle_given_job),
+    path('job/<int:job_id>/', async_views.handle_given_job),
+] + urls.urlpatterns
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class TestAsyncViews(TransactionTestCase):
+    """the ORM work of async views runs in pool threads, so the tests need committed data"""
+
+    def setUp(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+        metrics.reset_metrics()
+        python = Skill.objects.create(skill_name="Python")
+        self.candidates = [Candidate.objects.create(title="Software Developer") for _ in range(5)]
+        for candidate in self.candidates:
+            candidate.skills.set([python.pk])
+        self.job = Job.objects.create(title="Software Developer", status="opened", skill="Python")
+        self.closed_job = Job.objects.create(title="Software Developer", status="closed", skill="Python")
+        Like.objects.create(candidate_id=self.candidates[0], job_id=self.job)
+        Note.objects.create(candidate_id=self.candidates[0], job_id=self.job, note="Good")
+
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+        metrics.reset_metrics()
+
+    @staticmethod
+    async def get_content(response):
+        if response.streaming:  # the sync views stream from the database
+            return await sync_to_async(b''.join)(response.streaming_content)
+        return response.content
+
+    async def test_responses_equal_sync_views(self):
+        job_id = self.job.job_id
+        for url in (f"/candidates/{job_id}/", f"/candidates/{job_id}/?limit=2", f"/candidates/{job_id}/?stream=1",
+                    f"/candidates/{job_id}/?limit=x", f"/candidates/liked/{job_id}/",
+                    f"/candidates/liked/{job_id}/?stream=1", f"/job/{job_id}/",
+                    f"/candidates/{self.closed_job.job_id}/", "/candidates/999/", "/candidates/liked/999/"):
+            match_cache.reset_cache()
+            with override_settings(ROOT_URLCONF='matcher.urls'):
+                expected = await self.async_client.get(url)
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, expected.status_code, url)
+            if response.status_code != 404:
+                self.assertEqual(response['ETag'], expected['ETag'], url)
+            self.assertEqual(await self.get_content(response), await self.get_content(expected), url)
+
+    async def test_not_modified(self):
+        for url in (f"/candidates/{self.job.job_id}/", f"/candidates/liked/{self.job.job_id}/",
+                    f"/job/{self.job.job_id}/"):
+            await self.async_client.get(url)  # writes the matches of the job, which changes its ETags
+            etag = (await self.async_client.get(url))['ETag']
+            response = await self.async_client.get(url, **{'if-none-match': etag})  # ASGI header names
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+
+    async def test_writes_go_to_the_sync_view(self):
+        response = await self.async_client.put("/job/", content_type='application/json',
+                                               data={"job_id": self.job.job_id, "status": "closed"})
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(f"/candidates/{self.job.job_id}/")
+        self.assertEqual(response.status_code, 204)
+        response = await self.async_client.post(f"/candidates/{self.job.job_id}/")
+        self.assertEqual(response.status_code, 405)
+
+    async def test_queries_are_recorded(self):
+        """queries run in the pool count towards the request, whose budget they stay within"""
+        await self.async_client.get(f"/candidates/{self.job.job_id}/")
+        await self.async_client.get(f"/job/{self.job.job_id}/")
+        with metrics.registry.lock:
+            queries = dict(metrics.registry.histograms['matcher_view_queries'])
+        for view, budget in (('get_all_candidates_for_job', 24), ('handle_given_job', 11)):
+            histogram = queries[(('view', f'matcher_app.async_views.{view}'),)]
+            self.assertEqual(histogram.count, 1)
+            self.assertGreater(histogram.sum, 0)
+            self.assertLessEqual(histogram.sum, budget)
+
+    def test_load_test(self):
+        """levels are run for every target and compared with the first one"""
+        requested = []
+
+        def fetch(url):
+            requested.append(url)
+            return (200 if url.startswith('http://fast') else 500), (0.001 if url.startswith('http://fast') else 0.002)
+
+        paths = load_test.get_paths([1, 2])
+        self.assertEqual(paths[:3], ['/candidates/1/', '/candidates/liked/1/', '/job/1/'])
+        report = load_test.run_load_test([('wsgi', 'http://slow/'), ('asgi', 'http://fast')], paths, [1, 4], 12,
+                                         fetch=fetch)
+        self.assertEqual(len(requested), 2 * len(paths) + 2 * 2 * 12)
+        self.assertEqual(sorted(report["levels"]), ['1', '4'])
+        level = report["levels"]['4']
+        self.assertEqual(level['wsgi']["speedup"], 1.0)
+        self.assertEqual((level['wsgi']["errors"], level['asgi']["errors"]), (12, 0))
+        self.assertEqual(level['asgi']["count"], 12)
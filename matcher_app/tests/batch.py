@@ -0,0 +1,62 @@
+from django.core.management import call_command
+from django.test import TransactionTestCase
+from matcher_app import batch, match_cache, match_index, skill_registry
+from matcher_app.models import Candidate, Skill, Job, Match, Like
+from io import StringIO
+
+
+class TestBatchMatching(TransactionTestCase):
+    def setUp(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+        python = Skill.objects.create(skill_name="Python")
+        law = Skill.objects.create(skill_name="Law")
+        self.developers = [Candidate.objects.create(title="Software Developer") for _ in range(3)]
+        for candidate in self.developers:
+            candidate.skills.set([python.pk])
+        self.lawyer = Candidate.objects.create(title="Lawyer")
+        self.lawyer.skills.set([law.pk])
+        self.developer_job = Job.objects.create(title="Software Developer", status="opened", skill="Python")
+        self.lawyer_job = Job.objects.create(title="Lawyer", status="opened", skill="Law")
+        self.closed_job = Job.objects.create(title="Lawyer", status="closed", skill="Law")
+        Like.objects.create(candidate_id=self.developers[0], job_id=self.developer_job)
+
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+
+    def test_batch_matches_equal_single_job_matches(self):
+        """the batch endpoint returns the same candidates as one request per job"""
+        job_ids = [self.developer_job.job_id, self.lawyer_job.job_id, self.closed_job.job_id, 999]
+        response = self.client.post("/candidates/batch/", data={"job_ids": job_ids}, content_type='application/json')
+        results = response.json()["results"]
+        match_cache.reset_cache()
+        for job in (self.developer_job, self.lawyer_job):
+            single = self.client.get(f"/candidates/{job.job_id}/").json()
+            self.assertEqual(results[str(job.job_id)], single)
+        self.assertEqual(results[str(self.closed_job.job_id)], [])
+        self.assertEqual(response.json()["missing_job_ids"], [999])
+        self.assertEqual(Match.objects.count(), 3)
+
+    def test_invalid_job_ids(self):
+        """job_ids must be a list"""
+        response = self.client.post("/candidates/batch/", data={"job_ids": "1"}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_process_pool(self):
+        """jobs matched in forked worker processes give the same results"""
+        job_ids = [self.developer_job.job_id, self.lawyer_job.job_id]
+        serial, _ = batch.match_jobs(job_ids, persist=False)
+        parallel, _ = batch.match_jobs(job_ids, workers=2, persist=False)
+        self.assertEqual({job_id: ranked.ranked_ids().tolist() for job_id, ranked in serial.items()},
+                         {job_id: ranked.ranked_ids().tolist() for job_id, ranked in parallel.items()})
+        self.assertEqual(Match.objects.count(), 0)
+
+    def test_match_jobs_command(self):
+        """match_jobs matches all open jobs by default"""
+        out = StringIO()
+        call_command("match_jobs", stdout=out)
+        self.assertIn("Matched 2 jobs with 3 candidate matches", out.getvalue())
+        self.assertEqual(Match.objects.filter(job_id=self.lawyer_job).count(), 1)
@@ -0,0 +1,58 @@
+from django.test import TestCase, TransactionTestCase
+from matcher_app import benchmark, synthetic, match_cache, match_index, metrics, skill_registry
+from matcher_app.models import Candidate, Job, Like, Dislike, Note, JobStats
+from collections import Counter
+
+
+class TestSyntheticData(TestCase):
+    def test_generator_is_deterministic(self):
+        config = synthetic.SyntheticDataConfig(num_candidates=300, seed=3)
+        rows = list(synthetic.generate_candidates(config, chunk_size=100))
+        self.assertEqual(rows, list(synthetic.generate_candidates(config, chunk_size=100)))
+        self.assertNotEqual(rows, list(synthetic.generate_candidates(synthetic.SyntheticDataConfig(300, seed=4))))
+        self.assertEqual(len(rows), 300)
+
+    def test_skill_popularity_is_skewed(self):
+        """the most popular skill is held by many more candidates than the median skill"""
+        config = synthetic.SyntheticDataConfig(num_candidates=2000, num_skills=100)
+        counts = Counter(skill for _, skills in synthetic.generate_candidates(config) for skill in skills)
+        ranked = [count for _, count in counts.most_common()]
+        self.assertGreater(ranked[0], 10 * ranked[len(ranked) // 2])
+        self.assertEqual(counts.most_common(1)[0][0], synthetic.skill_names(config)[0])
+
+    def test_populate(self):
+        config = synthetic.SyntheticDataConfig(num_candidates=200, num_jobs=5, opinion_density=0.1, note_density=1.0)
+        job_ids = synthetic.populate(config)
+        self.assertEqual(Candidate.objects.count(), 200)
+        self.assertEqual(len(job_ids), Job.objects.count())
+        self.assertEqual(Like.objects.count() + Dislike.objects.count(), 5 * 20)
+        self.assertEqual(Note.objects.count(), Like.objects.count())
+        self.assertEqual(JobStats.objects.count(), 5)
+
+
+class TestBenchmark(TransactionTestCase):
+    def setUp(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+        metrics.reset_metrics()
+
+    def test_report(self):
+        report = benchmark.run_benchmark([100, 200], num_requests=3, num_jobs=3)
+        self.assertEqual([size["num_candidates"] for size in report["sizes"]], [100, 200])
+        endpoints = report["sizes"][0]["endpoints"]
+        self.assertEqual(set(endpoints), {name for name, _, _ in benchmark.ENDPOINTS})
+        for summary in endpoints.values():
+            self.assertEqual(summary["count"], 3)
+            self.assertEqual(summary["errors"], 0)
+            self.assertLessEqual(summary["p50"], summary["p99"])
+        self.assertIn('rank', report["sizes"][0]["stages"])
+
+        rows = benchmark.compare_reports(report, report)
+        self.assertEqual(len(rows), 2 * len(benchmark.ENDPOINTS))
+        self.assertTrue(all(ratio == 1.0 for *_, ratio in rows))
@@ -0,0 +1,88 @@
+import numpy as np
+from django.test import TestCase
+from matcher_app import candidate_finder, match_index, ranking, skill_registry
+from matcher_app.models import Candidate, Skill, Job, Like, Dislike
+
+
+class TestOpinionExclusion(TestCase):
+    def setUp(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        skill = Skill.objects.create(skill_name="Python")
+        self.job = Job.objects.create(title="Software Developer", status="opened", skill="Python")
+        self.other_job = Job.objects.create(title="Software Engineer", status="opened", skill="Python")
+        self.candidates = [Candidate.objects.create(title="Software Developer") for _ in range(4)]
+        for candidate in self.candidates:
+            candidate.skills.set([skill.pk])
+
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+
+    def test_opinions_are_scoped_to_job(self):
+        """a like or dislike only hides the candidate from the job it was given for"""
+        Like.objects.create(candidate_id=self.candidates[0], job_id=self.job)
+        Dislike.objects.create(candidate_id=self.candidates[1], job_id=self.job)
+        Like.objects.create(candidate_id=self.candidates[2], job_id=self.other_job)
+        all_ids = [candidate.candidate_id for candidate in self.candidates]
+
+        remaining = candidate_finder.check_if_opinions_exist_for_candidates(all_ids, self.job.job_id)
+        self.assertEqual(remaining.tolist(), all_ids[2:])
+        remaining = candidate_finder.check_if_opinions_exist_for_candidates(all_ids, self.other_job.job_id)
+        self.assertEqual(remaining.tolist(), [all_ids[0], all_ids[1], all_ids[3]])
+
+    def test_exclusion_is_a_single_query(self):
+        """the number of queries does not grow with the number of potential candidates"""
+        for candidate in self.candidates:
+            Dislike.objects.create(candidate_id=candidate, job_id=self.other_job)
+        all_ids = [candidate.candidate_id for candidate in self.candidates]
+        with self.assertNumQueries(1):
+            candidate_finder.check_if_opinions_exist_for_candidates(all_ids, self.job.job_id)
+
+
+class TestRanking(TestCase):
+    def setUp(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        self.python = Skill.objects.create(skill_name="Python")
+        self.cobol = Skill.objects.create(skill_name="Cobol")
+        self.common = [Candidate.objects.create(title="Software Developer") for _ in range(3)]
+        for candidate in self.common:
+            candidate.skills.set([self.python.pk])
+        self.rare = Candidate.objects.create(title="Software Developer")
+        self.rare.skills.set([self.python.pk, self.cobol.pk])
+
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+
+    def test_rare_skills_are_worth_more(self):
+        """a skill fewer candidates have gets a higher weight"""
+        weights = ranking.get_skill_weights(match_index.get_index(), self.cobol.pk + 1)
+        self.assertGreater(weights[self.cobol.pk], weights[self.python.pk])
+
+    def test_candidates_ranked_by_score(self):
+        """the candidate with the extra rare skill comes first, ties are ordered by candidate id"""
+        job = Job.objects.create(title="Software Developer", status="opened", skill="Python")
+        ranked = candidate_finder.candidate_finder(job).ranked_ids().tolist()
+        self.assertEqual(ranked, [self.rare.candidate_id] + [candidate.candidate_id for candidate in self.common])
+
+    def test_top_k(self):
+        """top_k returns only the k best candidates, best first"""
+        ids = np.array([10, 11, 12, 13])
+        scores = np.array([1.0, 4.0, 2.0, 4.0])
+        self.assertEqual(ranking.top_k(ids, scores, 3).tolist(), [11, 13, 12])
+        self.assertEqual(ranking.top_k(ids, scores).tolist(), [11, 13, 12, 10])
+        self.assertEqual(ranking.top_k(np.array([13, 12, 11, 10]), np.ones(4), 2).tolist(), [10, 11])
+
+    def test_pages_cover_the_full_ranking(self):
+        """walking the pages with their cursors returns every candidate exactly once, in ranked order"""
+        rng = np.random.RandomState(0)
+        ranked = ranking.RankedCandidates(np.arange(100), rng.randint(0, 5, 100).astype(float))
+        page_ids, cursor = ranked.page(7)
+        pages = [page_ids]
+        while cursor is not None:
+            page_ids, cursor = ranked.page(7, cursor)
+            pages.append(page_ids)
+        self.assertEqual(np.concatenate(pages).tolist(), ranked.ranked_ids().tolist())
+        self.assertEqual(len(pages), 15)
@@ -0,0 +1,109 @@
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from matcher_app import match_cache, match_index, match_writer, metrics, versions, skill_registry
+from matcher_app.models import Candidate, Job, Like, Skill
+
+
+class TestConditionalGet(TransactionTestCase):
+    """version counters are bumped on commit, so the tests need real transactions"""
+
+    def setUp(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+        metrics.reset_metrics()
+        self.python = Skill.objects.create(skill_name="Python")
+        self.candidates = [Candidate.objects.create(title="Software Developer") for _ in range(3)]
+        for candidate in self.candidates:
+            candidate.skills.set([self.python.pk])
+        self.job = Job.objects.create(title="Software Developer", status="opened", skill="Python")
+        self.urls = [f"/candidates/{self.job.job_id}/", f"/candidates/liked/{self.job.job_id}/",
+                     f"/job/{self.job.job_id}/"]
+
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+        metrics.reset_metrics()
+
+    def get_etags(self):
+        return [self.client.get(url)['ETag'] for url in self.urls]
+
+    def test_not_modified(self):
+        """a matching If-None-Match is answered with 304 after one query"""
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response['ETag'].startswith('W/"'))
+            with CaptureQueriesContext(connection) as queries:
+                not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertEqual(not_modified.content, b'')
+            self.assertEqual(len(queries), 1)
+
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='W/"stale"').status_code, 200)
+
+    def test_opinions_and_notes_change_the_etags(self):
+        candidate_id = self.candidates[0].candidate_id
+        before = self.get_etags()
+        self.client.post("/candidate/opinion/", content_type='application/json',
+                         data={"job_id": self.job.job_id, "candidate_id": candidate_id, "is_liked": True})
+        after_like = self.get_etags()
+        self.assertTrue(all(etag != old for etag, old in zip(after_like, before)))
+
+        self.client.post("/candidate/note/", content_type='application/json',
+                         data={"job_id": self.job.job_id, "candidate_id": candidate_id, "note": "Good"})
+        self.assertNotEqual(self.get_etags()[1], after_like[1])
+        self.assertEqual(Like.objects.count(), 1)
+
+    def test_status_change_changes_the_etags(self):
+        before = self.get_etags()
+        self.client.put("/job/", content_type='application/json', data={"job_id": self.job.job_id, "status": "closed"})
+        self.assertTrue(all(etag != old for etag, old in zip(self.get_etags(), before)))
+
+    def test_candidate_changes_change_the_candidates_etag(self):
+        """of the jobs the candidate may match only"""
+        other_url = f"/candidates/{Job.objects.create(title='Lawyer', status='opened', skill='Python').job_id}/"
+        before, other_before = self.get_etags(), self.client.get(other_url)['ETag']
+        Candidate.objects.create(title="Software Developer")
+        after = self.get_etags()
+        self.assertNotEqual(after[0], before[0])
+        self.assertEqual(after[1:], before[1:])
+        self.assertEqual(self.client.get(other_url)['ETag'], other_before)
+
+    def test_written_matches_change_the_stats_etag(self):
+        self.client.get(self.urls[0])
+        before = self.get_etags()
+        match_writer.flush()
+        after = self.get_etags()
+        self.assertNotEqual(after[2], before[2])
+        self.assertEqual(after[:2], before[:2])
+
+    @override_settings(MATCHER_MATCH_WRITE_BEHIND=False)
+    def test_other_jobs_are_unaffected(self):
+        other_job = Job.objects.create(title="Lawyer", status="opened", skill="Law")
+        before = self.get_etags()
+        self.client.put("/job/", content_type='application/json', data={"job_id": other_job.job_id, "status": "closed"})
+        self.assertEqual(self.get_etags(), before)
+
+    def test_missing_counters_count_as_zero(self):
+        self.assertEqual(versions.get_etag('job:0', 'matches:0'), 'W/"0.0"')
+        versions.bump('job:0', 'matches:0')
+        job_etag, matches_etag = versions.get_etag('job:0'), versions.get_etag('matches:0')
+        self.assertNotIn('W/"0"', (job_etag, matches_etag))
+        versions.bump('job:0')
+        self.assertNotEqual(versions.get_etag('job:0'), job_etag)
+        self.assertEqual(versions.get_etag('matches:0'), matches_etag)
+
+    def test_missing_jobs_have_no_etag(self):
+        """a conditional request for a job that does not exist gets its 404, not a 304"""
+        self.assertEqual(versions.get_job_etag(self.job.job_id, 'job:0'), 'W/"0"')
+        self.assertIsNone(versions.get_job_etag(999, 'job:999'))
+        for url in ("/candidates/999/", "/candidates/liked/999/"):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH='W/"0.0", W/"0"')
+            self.assertEqual(response.status_code, 404, url)
+            self.assertFalse(response.has_header('ETag'))
+        response = self.client.get("/job/999/", HTTP_IF_NONE_MATCH='W/"0.0"')
+        self.assertEqual(response.status_code, 200)  # stats of unknown jobs are zeros
+        self.assertFalse(response.has_header('ETag'))
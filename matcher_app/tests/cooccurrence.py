@@ -0,0 +1,129 @@
+from django.test import TestCase, override_settings
+from matcher_app import cooccurrence, importer, match_index, ranking, skill_registry
+from matcher_app.models import Candidate, Skill
+from unittest import mock
+import numpy as np
+import tempfile
+import shutil
+import os
+
+
+class TestSkillCooccurrence(TestCase):
+    def setUp(self):
+        cooccurrence.reset_model()
+        rng = np.random.RandomState(2)
+        self.rows = [sorted(set(rng.randint(1, 9, rng.randint(0, 5)).tolist())) for _ in range(60)]
+
+    def tearDown(self):
+        cooccurrence.reset_model()
+
+    def make_model(self, rows):
+        indptr = np.cumsum([0] + [len(row) for row in rows])
+        return cooccurrence.SkillCooccurrence().add(indptr, [skill for row in rows for skill in row])
+
+    def test_conditional_probabilities(self):
+        """P(B | A) is the share of the candidates with A who also have B, added in one go or chunk by chunk"""
+        model = self.make_model(self.rows[:25]).add(*self.csr(self.rows[25:]))
+        given, skills = np.repeat(np.arange(1, 10), 9), np.tile(np.arange(1, 10), 9)
+        expected = []
+        for a, b in zip(given, skills):
+            with_a = [row for row in self.rows if a in row]
+            supported = a != b and len(with_a) >= cooccurrence.MIN_SUPPORT
+            expected.append(sum(b in row for row in with_a) / len(with_a) if supported else 0.0)
+        np.testing.assert_allclose(model.conditional_probabilities(given, skills), expected)
+        self.assertEqual(model.num_candidates, len(self.rows))
+
+    def test_pairs_are_counted_chunk_by_chunk(self):
+        """counting a few pairs at a time gives the counts of counting them all at once"""
+        rows = self.rows + [list(range(1, 9))]  # a row of more pairs than a chunk
+        expected = self.make_model(rows)
+        with mock.patch.object(cooccurrence, 'PAIR_CHUNK_SIZE', 7):
+            chunked = self.make_model(rows)
+        self.assertEqual(chunked.keys.tolist(), expected.keys.tolist())
+        self.assertEqual(chunked.counts.tolist(), expected.counts.tolist())
+
+    def csr(self, rows):
+        return np.cumsum([0] + [len(row) for row in rows]), [skill for row in rows for skill in row]
+
+    def test_redundancy_is_explained_by_more_valuable_skills(self):
+        rows = [[1, 2]] * 5 + [[1]] * 5  # skill 2 (django) always comes with skill 1 (python)
+        model = self.make_model(rows)
+        weights = np.array([0.0, 1.0, 3.0])
+        self.assertEqual(model.get_redundancy(*self.csr([[1, 2], [1], [2]]), weights).tolist(), [1.0, 0.0, 0.0, 0.0])
+        weights = np.array([0.0, 3.0, 1.0])
+        self.assertEqual(model.get_redundancy(*self.csr([[1, 2]]), weights).tolist(), [0.0, 0.5])
+
+    def test_saved_model_is_loaded_by_workers(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'cooccurrence.npz')
+        model = self.make_model(self.rows)
+        with override_settings(MATCHER_COOCCURRENCE_PATH=path):
+            cooccurrence.save_model(model)
+            cooccurrence.reset_model()
+            with self.assertNumQueries(0):
+                loaded = cooccurrence.get_model()
+            self.assertEqual(loaded.keys.tolist(), model.keys.tolist())
+            self.assertEqual(loaded.counts.tolist(), model.counts.tolist())
+            self.assertEqual(loaded.skill_counts.tolist(), model.skill_counts.tolist())
+            self.assertEqual(loaded.num_candidates, model.num_candidates)
+
+            self.make_model(self.rows[:10]).save(path)
+            os.utime(path, (0, loaded.loaded_at + 1))
+            self.assertEqual(cooccurrence.get_model().num_candidates, 10)  # another process rewrote the file
+
+
+class TestCooccurrenceRanking(TestCase):
+    def setUp(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        cooccurrence.reset_model()
+        self.python = Skill.objects.create(skill_name="Python")
+        self.django = Skill.objects.create(skill_name="Django")
+        self.both = []
+        for _ in range(cooccurrence.MIN_SUPPORT):
+            candidate = Candidate.objects.create(title="Developer")
+            candidate.skills.set([self.python.pk, self.django.pk])
+            self.both.append(candidate.candidate_id)
+        self.python_only = []
+        for _ in range(cooccurrence.MIN_SUPPORT):
+            candidate = Candidate.objects.create(title="Developer")
+            candidate.skills.set([self.python.pk])
+            self.python_only.append(candidate.candidate_id)
+
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        cooccurrence.reset_model()
+
+    def test_implied_skills_are_discounted(self):
+        """python is worth less to a candidate who also knows django, which always comes with python"""
+        ids = self.both[:1] + self.python_only[:1]
+        job_skills = {self.python.pk: 1.0, self.django.pk: 1.0}
+        with mock.patch.object(ranking, 'REDUNDANCY_FACTOR', 0):
+            plain = ranking.score_candidates(ids, job_skills)
+        scores = ranking.score_candidates(ids, job_skills)
+        python_weight = plain[1]
+        np.testing.assert_allclose(scores, [plain[0] - ranking.REDUNDANCY_FACTOR * python_weight, python_weight])
+
+    def test_model_is_recounted_with_the_index(self):
+        """the thread building the index counts the model over it, without reading the database again"""
+        cooccurrence.get_model()
+        Candidate.objects.get(candidate_id=self.both[0]).skills.remove(self.django)
+        match_index.get_index()
+        model = cooccurrence.get_loaded_model()
+        with self.assertNumQueries(0):
+            self.assertIs(cooccurrence.get_model(), model)
+        built = cooccurrence.SkillCooccurrence.build()
+        self.assertEqual((model.keys.tolist(), model.counts.tolist(), model.num_candidates),
+                         (built.keys.tolist(), built.counts.tolist(), built.num_candidates))
+        self.assertEqual(model.skill_counts.tolist(), built.skill_counts.tolist())
+
+    def test_import_updates_the_model(self):
+        cooccurrence.get_model()
+        importer.import_candidates([("Developer", ["Python", "Django"])] * 3)
+        model = cooccurrence.get_model()
+        built = cooccurrence.SkillCooccurrence.build()
+        self.assertEqual(model.num_candidates, 2 * cooccurrence.MIN_SUPPORT + 3)
+        self.assertEqual(model.keys.tolist(), built.keys.tolist())
+        self.assertEqual(model.counts.tolist(), built.counts.tolist())
@@ -0,0 +1,118 @@
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from matcher_app import candidate_finder, history, job_stats, utils
+from matcher_app.models import Candidate, Job, Like, Dislike, Match, HistoryRollup
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+import tempfile
+import shutil
+import os
+
+
+class TestHistory(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.old = timezone.now() - timedelta(days=400)
+        self.candidates = [Candidate.objects.create(title="Software Developer") for _ in range(3)]
+        self.closed_job = Job.objects.create(title="Software Developer", status="closed", skill="Python")
+        self.open_job = Job.objects.create(title="Software Developer", status="opened", skill="Python")
+        for days in (3, 2, 1):  # the first candidate was liked three times
+            Like.objects.create(candidate_id=self.candidates[0], job_id=self.closed_job,
+                                time_liked=self.old - timedelta(days=days))
+        Like.objects.create(candidate_id=self.candidates[1], job_id=self.closed_job, time_liked=self.old)
+        Dislike.objects.create(candidate_id=self.candidates[2], job_id=self.closed_job, time_disliked=self.old)
+        Match.objects.create(candidate_id=self.candidates[1], job_id=self.closed_job, time_matched=self.old)
+        self.recent_like = Like.objects.create(candidate_id=self.candidates[2], job_id=self.closed_job)
+        self.open_job_like = Like.objects.create(candidate_id=self.candidates[0], job_id=self.open_job,
+                                                 time_liked=self.old)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_compact(self):
+        """old rows of closed jobs are rolled up, archived and deleted - the job stats stay the same"""
+        stats = job_stats.rebuild_job_stats([self.closed_job.job_id])
+        with self.captureOnCommitCallbacks(execute=True):  # the archives are published once their batch commits
+            compacted = history.compact(directory=self.directory, batch_size=2)
+        self.assertEqual(compacted, {'like': 4, 'dislike': 1, 'match': 1})
+        self.assertEqual(list(Like.objects.order_by('id')), [self.recent_like, self.open_job_like])
+        self.assertFalse(Dislike.objects.exists() or Match.objects.exists())
+
+        rollup = HistoryRollup.objects.get(kind='like', job_id=self.closed_job.job_id,
+                                           candidate_id=self.candidates[0].candidate_id)
+        self.assertEqual(rollup.count, 3)  # rolled up over two batches
+        self.assertEqual((rollup.first_time, rollup.last_time), (self.old - timedelta(days=3),
+                                                                 self.old - timedelta(days=1)))
+        self.assertEqual(HistoryRollup.objects.count(), 4)
+        self.assertEqual(len(os.listdir(os.path.join(self.directory, 'like'))), 2)
+        archived = list(history.read_archive('like', self.directory, job_id=self.closed_job.job_id))
+        self.assertEqual([row["candidate_id"] for row in archived],
+                         [candidate.candidate_id for candidate in self.candidates[:1] * 3 + self.candidates[1:2]])
+        self.assertEqual(job_stats.rebuild_job_stats([self.closed_job.job_id]), stats)
+
+        self.assertEqual(history.compact(directory=self.directory), {'like': 0, 'dislike': 0, 'match': 0})
+
+    def test_reopened_job_keeps_its_opinions(self):
+        history.compact(directory=self.directory)
+        Job.objects.filter(job_id=self.closed_job.job_id).update(status="opened")
+        self.assertEqual(candidate_finder.get_opinionated_candidates(self.closed_job.job_id).tolist(),
+                         [candidate.candidate_id for candidate in self.candidates])
+
+    def test_reopened_job_counts_each_match_once(self):
+        """a candidate matched again after its old match was compacted counts once, however the stats are counted"""
+        Match.objects.create(candidate_id=self.candidates[0], job_id=self.closed_job, time_matched=self.old)
+        history.compact(kinds=('match',), directory=self.directory)
+        Job.objects.filter(job_id=self.closed_job.job_id).update(status="opened")
+        job_stats.rebuild_job_stats([self.closed_job.job_id])  # the matches are then counted by set_num_matches
+        utils.add_ranked_candidates_to_table([candidate.candidate_id for candidate in self.candidates[:3]],
+                                             self.closed_job.job_id)
+        self.assertEqual(job_stats.get_stats([self.closed_job.job_id])[self.closed_job.job_id]["num_matches"], 3)
+        self.assertEqual(job_stats.rebuild_job_stats([self.closed_job.job_id])[self.closed_job.job_id]["num_matches"],
+                         3)
+
+    def test_failed_batch_keeps_its_rows(self):
+        with mock.patch.object(history, '_delete_rows', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                history.compact(kinds=('like',), directory=self.directory)
+        self.assertEqual(Like.objects.count(), 6)
+        self.assertFalse(HistoryRollup.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.directory, 'like')), [])
+
+    def test_pending_archives_are_recovered(self):
+        """the archive of a batch that committed is published by the next run, the one of a batch that did not is
+        dropped and its rows archived again"""
+        cutoff = history.get_cutoff()
+        self.assertEqual(len(history.compact_batch('dislike', cutoff, self.directory, 10)), 1)  # not published
+        likes = list(Like.objects.order_by('id').values_list('pk', 'job_id_id', 'candidate_id_id', 'time_liked')[:2])
+        history.write_archive(history.get_archive_path(self.directory, 'like', likes[0][0], likes[-1][0]) +
+                              history.PENDING_SUFFIX, 'like', likes)  # rolled back
+        self.assertEqual(len(os.listdir(os.path.join(self.directory, 'dislike'))), 1)
+
+        with self.assertLogs('matcher_app.history', 'WARNING'):
+            self.assertEqual(history.recover_archives('dislike', self.directory), 1)
+            self.assertEqual(history.recover_archives('like', self.directory), 0)
+        self.assertEqual([row["candidate_id"] for row in history.read_archive('dislike', self.directory)],
+                         [self.candidates[2].candidate_id])
+        self.assertEqual(os.listdir(os.path.join(self.directory, 'like')), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(history.compact(kinds=('like',), directory=self.directory), {'like': 4})
+        self.assertEqual(len(list(history.read_archive('like', self.directory))), 4)
+
+    def test_command(self):
+        stdout = StringIO()
+        call_command('compact_history', kind=['dislike'], archive_dir=self.directory, stdout=stdout)
+        self.assertIn('1 dislike rows', stdout.getvalue())
+        self.assertEqual(Like.objects.count(), 6)
+
+    def test_scheduler_stops(self):
+        checks = []
+
+        def should_stop():
+            checks.append(True)
+            return len(checks) > 10
+
+        compacted = history.run_scheduler(0.01, should_stop, directory=self.directory)
+        self.assertEqual(compacted, {'like': 4, 'dislike': 1, 'match': 1})
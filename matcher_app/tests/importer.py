@@ -0,0 +1,136 @@
+from django.core.management import call_command
+from django.test import TestCase
+from matcher_app import importer, match_cache, match_index, skill_registry
+from matcher_app.models import Candidate, Skill
+from io import StringIO
+import numpy as np
+import tempfile
+import json
+import os
+
+
+class TestImportCandidates(TestCase):
+    def setUp(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+        self.python = Skill.objects.create(skill_name="Python")
+        Candidate.objects.create(title="Lawyer")
+
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+
+    def write_file(self, suffix, content):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'w') as file:
+            file.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_import_jsonl(self):
+        """candidates are created with their skills, new skills are created once and invalid rows are skipped"""
+        rows = [{"title": "Software Developer", "skills": ["python", " machine   learning"]},
+                {"title": "Data Scientist", "skills": ["Machine learning"]},
+                {"title": "", "skills": ["python"]}]
+        path = self.write_file('.jsonl', '\n'.join(json.dumps(row) for row in rows) + '\n\n')
+        out = StringIO()
+        call_command('import_candidates', path, '--chunk-size', '1', stdout=out)
+
+        self.assertIn('rows/s', out.getvalue())
+        self.assertEqual(Skill.objects.count(), 2)
+        developer = Candidate.objects.get(title="Software Developer")
+        self.assertEqual(sorted(developer.skills.values_list('skill_name', flat=True)), ["Machine learning", "Python"])
+        scientist = Candidate.objects.get(title="Data Scientist")
+        self.assertEqual(list(scientist.skills.values_list('skill_name', flat=True)), ["Machine learning"])
+        self.assertEqual(Candidate.objects.count(), 3)
+
+    def test_skills_missing_from_the_registry_are_reused(self):
+        """a skill created since the registry was loaded is found in the database instead of created again"""
+        skill_registry.get_registry()
+        go = Skill.objects.create(skill_name="GO")  # by another worker - this one's registry does not know it
+        importer.import_candidates([("Software Developer", ["go", "Python"])])
+        self.assertEqual(Skill.objects.filter(skill_name__iexact="go").count(), 1)
+        developer = Candidate.objects.get(title="Software Developer")
+        self.assertEqual(sorted(developer.skills.values_list('id', flat=True)), sorted([go.pk, self.python.pk]))
+
+    def test_import_csv(self):
+        path = self.write_file('.csv', 'title,skills\nSoftware Developer,Python;Django\nLawyer,\n')
+        call_command('import_candidates', path, stdout=StringIO())
+        developer = Candidate.objects.get(title="Software Developer")
+        self.assertEqual(sorted(developer.skills.values_list('skill_name', flat=True)), ["Django", "Python"])
+        self.assertEqual(Candidate.objects.filter(title="Lawyer").count(), 2)
+
+    def test_loaded_index_is_updated(self):
+        """importing into a built index gives the same index as building it after the import"""
+        index = match_index.get_index()
+        rows = [("Software Developer", ["Python"]), ("Lawyer", ["Law", "Python"]), ("Designer", [])]
+        result = importer.import_candidates(rows, chunk_size=2)
+        self.assertEqual(result.imported, 3)
+        self.assertEqual(result.skills_created, 1)
+
+        fresh = match_index.CandidateIndex().build()
+        law = Skill.objects.get(skill_name="Law")
+        for skill_id in (self.python.pk, law.pk):
+            np.testing.assert_array_equal(index.get_skill_matches(skill_id), fresh.get_skill_matches(skill_id))
+        for title in ("Software Developer", "Lawyer", "Designer"):
+            np.testing.assert_array_equal(index.get_exact_title_matches(title), fresh.get_exact_title_matches(title))
+        counts, total = index.get_skill_statistics(law.pk + 1)
+        fresh_counts, fresh_total = fresh.get_skill_statistics(law.pk + 1)
+        np.testing.assert_array_equal(counts, fresh_counts)
+        self.assertEqual(total, fresh_total)
+        candidate_ids = Candidate.objects.values_list('candidate_id', flat=True)
+        for matrix, fresh_matrix in zip(index.get_skill_matrix(candidate_ids), fresh.get_skill_matrix(candidate_ids)):
+            np.testing.assert_array_equal(matrix, fresh_matrix)
+
+    def test_add_candidates_out_of_order(self):
+        """ids that cannot be appended fall back to per-candidate updates"""
+        index = match_index.get_index()
+        lawyer_id = Candidate.objects.get().candidate_id
+        index.add_candidates([lawyer_id + 5, lawyer_id - 1], ["Designer", "Lawyer"], [[self.python.pk], []])
+        index.add_candidates([lawyer_id + 2], ["Designer"], [[self.python.pk]])
+        self.assertEqual(index.get_exact_title_matches("Designer").tolist(), [lawyer_id + 2, lawyer_id + 5])
+        self.assertEqual(index.get_skill_matches(self.python.pk).tolist(), [lawyer_id + 2, lawyer_id + 5])
+        self.assertEqual(index.get_exact_title_matches("Lawyer").tolist(), [lawyer_id - 1, lawyer_id])
+        self.assertEqual(index.num_candidates, 4)
+
+    def test_invalid_jsonl_lines_are_skipped(self):
+        """lines that are not a candidate are reported with their line number instead of being imported wrongly"""
+        lines = ['{"title": "Software Developer", "skills": ["Python"]}',
+                 '{"title": "Designer", "skills": "Figma"}',
+                 '["Lawyer"]',
+                 '{"title": 42}',
+                 '{"title": "Tester", "skills": ["Python", null]}',
+                 '{"title": "Broken"',
+                 '',
+                 '{"title": "Data Scientist"}']
+        errors = []
+        rows = list(importer.read_jsonl(lines, errors))
+        self.assertEqual(rows, [("Software Developer", ["Python"]), ("Data Scientist", [])])
+        self.assertEqual([line_number for line_number, _ in errors], [2, 3, 4, 5, 6])
+        self.assertIn('"skills" is not a list of strings', errors[0][1])
+
+        path = self.write_file('.jsonl', '\n'.join(lines) + '\n')
+        out, err = StringIO(), StringIO()
+        call_command('import_candidates', path, stdout=out, stderr=err)
+        self.assertIn('5 invalid lines', out.getvalue())
+        self.assertIn('Line 2: "skills" is not a list of strings', err.getvalue())
+        self.assertFalse(Skill.objects.filter(skill_name="F").exists())
+        self.assertFalse(Candidate.objects.filter(title="Designer").exists())
+
+    def test_only_the_first_invalid_lines_are_kept(self):
+        errors = importer.InvalidLines(3)
+        self.assertEqual(list(importer.read_jsonl(['[]'] * 10, errors)), [])
+        self.assertEqual(([line_number for line_number, _ in errors.lines], errors.count), ([1, 2, 3], 10))
+
+    def test_invalid_csv_lines_are_skipped(self):
+        errors = []
+        rows = list(importer.read_csv(['title,skills\n', 'Software Developer,Python\n', 'Lawyer\n',
+                                       'Designer,Figma,extra\n', 'Tester,\n'], errors))
+        self.assertEqual(rows, [("Software Developer", ["Python"]), ("Tester", [])])
+        self.assertEqual([line_number for line_number, _ in errors], [3, 4])
+
+        errors = []
+        self.assertEqual(list(importer.read_csv(['name,skills\n', 'Lawyer,\n'], errors)), [])
+        self.assertEqual(errors, [(1, 'no title column')])
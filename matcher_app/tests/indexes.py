@@ -0,0 +1,48 @@
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase
+from matcher_app import indexes
+from matcher_app.models import Candidate, Job, Like
+from io import StringIO
+import json
+import os
+import tempfile
+
+
+class TestIndexes(TransactionTestCase):
+    def setUp(self):
+        self.candidate = Candidate.objects.create(title="Software Developer")
+        self.job = Job.objects.create(title="Software Developer", status="opened", skill="Python")
+        Like.objects.create(candidate_id=self.candidate, job_id=self.job)
+
+    def get_index_names(self):
+        with connection.cursor() as cursor:
+            return {name for table in ('matcher_app_like', 'matcher_app_dislike', 'matcher_app_note')
+                    for name in connection.introspection.get_constraints(cursor, table)}
+
+    def test_composite_indexes_exist(self):
+        self.assertTrue(set(indexes.get_index_names()) - set(indexes.TRIGRAM_INDEXES) <= self.get_index_names())
+
+    def test_trigram_indexes_need_postgres(self):
+        if connection.vendor != 'postgresql':
+            self.assertEqual(indexes.create_trigram_indexes(using='default'), [])
+
+    def test_explain_report(self):
+        """the plans with the indexes use them, the plans without them do not - and the indexes are kept"""
+        report = indexes.explain_report(self.job.job_id, self.candidate.candidate_id, 'developer')
+        self.assertEqual(set(report), {"liked_candidates", "notes_of_job", "is_liked", "is_disliked",
+                                       "opinionated_candidates", "match_of_candidate", "title_search"})
+        for name in ("liked_candidates", "is_disliked", "opinionated_candidates"):
+            self.assertTrue(any(index in report[name]["after"] for index in indexes.get_index_names()), name)
+            self.assertFalse(any(index in report[name]["before"] for index in indexes.get_index_names()), name)
+        self.assertIn('matcher_app_like', report["liked_candidates"]["sql"])
+        self.assertTrue(set(indexes.get_index_names()) - set(indexes.TRIGRAM_INDEXES) <= self.get_index_names())
+
+    def test_explain_queries_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'plans.json')
+            call_command('explain_queries', output=path, stdout=StringIO())
+            with open(path) as report_file:
+                report = json.load(report_file)
+        self.assertEqual((report["job_id"], report["candidate_id"]), (self.job.job_id, self.candidate.candidate_id))
+        self.assertIn("before", report["queries"]["is_liked"])
@@ -0,0 +1,115 @@
+import numpy as np
+from unittest import mock
+from django.test import TestCase, TransactionTestCase
+from matcher_app import batch, bitsets, candidate_finder, match_cache, match_index, skill_registry
+from matcher_app.models import Candidate, Skill, Job, JobSkill
+
+
+class TestBitsets(TestCase):
+    def test_set_operations_match_sorted_arrays(self):
+        rng = np.random.RandomState(0)
+        first = np.unique(rng.randint(0, 1000, 300))
+        second = np.unique(rng.randint(0, 700, 200))
+        first_bits, second_bits = bitsets.from_ids(first, 1000), bitsets.from_ids(second, 700)
+        self.assertEqual(bitsets.to_ids(first_bits).tolist(), first.tolist())
+        self.assertEqual(bitsets.popcount(first_bits), len(first))
+        self.assertEqual(bitsets.to_ids(bitsets.intersect([first_bits, second_bits])).tolist(),
+                         np.intersect1d(first, second).tolist())
+        self.assertEqual(bitsets.to_ids(bitsets.union([first_bits, second_bits])).tolist(),
+                         np.union1d(first, second).tolist())
+        probe = np.array([0, 5, 699, 999, 5000])
+        self.assertEqual(bitsets.contains(second_bits, probe).tolist(), np.isin(probe, second).tolist())
+
+
+class TestRequirementMatches(TestCase):
+    def setUp(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        self.skills = [Skill.objects.create(skill_name=f"Skill{i}") for i in range(4)]
+        rng = np.random.RandomState(1)
+        self.candidate_skills = {}
+        for _ in range(150):
+            candidate = Candidate.objects.create(title="Developer")
+            held = [skill.pk for i, skill in enumerate(self.skills) if rng.random_sample() < (0.02 if i == 3 else 0.5)]
+            candidate.skills.set(held)
+            self.candidate_skills[candidate.candidate_id] = set(held)
+
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+
+    def brute_force(self, required, optional):
+        return sorted(candidate_id for candidate_id, held in self.candidate_skills.items()
+                      if set(required) <= held and (required or held & set(optional)))
+
+    def test_matches_brute_force(self):
+        """both the bitset AND and the probing of the rarest skill's ids give the exact matches"""
+        index = match_index.get_index()
+        ids = [skill.pk for skill in self.skills]
+        for sparse_factor in (0, 10 ** 6):
+            with mock.patch.object(match_index, 'SPARSE_FACTOR', sparse_factor):
+                for required, optional in (([ids[0], ids[1]], [ids[2]]), ([ids[3], ids[0]], []),
+                                           ([], [ids[1], ids[3]]), ([ids[0], ids[1], ids[2]], [ids[3]]), ([], [])):
+                    self.assertEqual(index.get_requirement_matches(required, optional).tolist(),
+                                     self.brute_force(required, optional))
+
+    def test_bitsets_follow_updates(self):
+        index = match_index.get_index()
+        first = self.skills[0].pk
+        before = index.get_requirement_matches([first]).tolist()
+        newcomer = max(self.candidate_skills) + 1
+        index.set_title(newcomer, "Developer")
+        index.set_skills(newcomer, [first])
+        index.remove_candidate(before[0])
+        self.assertEqual(index.get_requirement_matches([first]).tolist(), before[1:] + [newcomer])
+
+
+class TestMultiSkillJobs(TransactionTestCase):
+    def setUp(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+        self.python = Skill.objects.create(skill_name="Python")
+        self.django = Skill.objects.create(skill_name="Django")
+        self.docker = Skill.objects.create(skill_name="Docker")
+        self.both = Candidate.objects.create(title="Software Developer")
+        self.both.skills.set([self.python.pk, self.django.pk])
+        self.all = Candidate.objects.create(title="Software Developer")
+        self.all.skills.set([self.python.pk, self.django.pk, self.docker.pk])
+        self.python_only = Candidate.objects.create(title="Software Developer")
+        self.python_only.skills.set([self.python.pk])
+        self.job = Job.objects.create(title="Software Developer", status="opened", skill="Python")
+
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+
+    def put_skills(self, skills):
+        return self.client.put(f"/job/{self.job.job_id}/skills/", data=skills, content_type='application/json')
+
+    def test_required_and_optional_skills(self):
+        """every required skill is needed, and optional skills rank the candidates who have them first"""
+        url = f"/candidates/{self.job.job_id}/"
+        self.assertEqual(len(self.client.get(url).json()), 3)  # the legacy single skill
+        response = self.put_skills([{"skill": "python"}, {"skill": "Django", "weight": 2},
+                                    {"skill": "Docker", "required": False}])
+        self.assertEqual(response.json(), [{"skill": "Django", "weight": 2.0, "required": True},
+                                           {"skill": "Docker", "weight": 1.0, "required": False},
+                                           {"skill": "Python", "weight": 1.0, "required": True}])
+        self.assertEqual(self.client.get(url).json(), [self.all.candidate_id, self.both.candidate_id])
+
+        job_skills = candidate_finder.get_job_skills(self.job)
+        self.assertEqual(job_skills.required, sorted([self.python.pk, self.django.pk]))
+        self.assertEqual(job_skills.optional, [self.docker.pk])
+        self.assertEqual(candidate_finder.get_skills_for_jobs([self.job])[self.job.job_id], job_skills)
+        results, _ = batch.match_jobs([self.job.job_id], persist=False)
+        self.assertEqual(results[self.job.job_id].ranked_ids().tolist(), [self.all.candidate_id,
+                                                                          self.both.candidate_id])
+
+    def test_invalid_skills(self):
+        self.assertEqual(self.put_skills([{"skill": "Cobol"}]).status_code, 400)
+        self.assertEqual(self.put_skills([{"skill": "Python", "weight": 0}]).status_code, 400)
+        self.assertEqual(self.put_skills([{"skill": "Python"}, {"skill": "python"}]).status_code, 400)
+        self.assertEqual(self.put_skills({"skill": "Python"}).status_code, 400)
+        self.assertEqual(JobSkill.objects.count(), 0)
@@ -0,0 +1,88 @@
+from django.core.management import call_command
+from django.test import TestCase
+from matcher_app import job_stats, utils
+from matcher_app.models import Candidate, Job, Like, Dislike, Note, JobStats
+from io import StringIO
+from unittest import mock
+
+
+class TestJobStats(TestCase):
+    def setUp(self):
+        self.job = Job.objects.create(title="Software Developer", status="opened", skill="Python")
+        self.other_job = Job.objects.create(title="Software Engineer", status="opened", skill="Python")
+        self.candidates = [Candidate.objects.create(title="Software Developer") for _ in range(3)]
+
+    def get_stats(self, job):
+        return self.client.get(f"/job/{job.job_id}/").json()
+
+    def test_counters_follow_writes(self):
+        """likes, dislikes, notes and matches are counted as they are written"""
+        for candidate in self.candidates[:2]:
+            opinion_data = {"job_id": self.job.job_id, "candidate_id": candidate.candidate_id, "is_liked": True}
+            self.client.post("/candidate/opinion/", data=opinion_data, content_type='application/json')
+        Dislike.objects.create(candidate_id=self.candidates[2], job_id=self.job)
+        Note.objects.create(candidate_id=self.candidates[0], job_id=self.job, note="great")
+        utils.add_ranked_candidates_to_table([c.candidate_id for c in self.candidates], self.job.job_id)
+        utils.add_ranked_candidates_to_table([c.candidate_id for c in self.candidates], self.job.job_id)
+
+        self.assertEqual(self.get_stats(self.job),
+                         {"num_likes": 2, "num_dislikes": 1, "num_notes": 1, "num_matches": 3})
+        Like.objects.filter(candidate_id=self.candidates[0]).delete()
+        self.assertEqual(self.get_stats(self.job)["num_likes"], 1)
+        self.assertEqual(self.get_stats(self.other_job)["num_likes"], 0)
+
+    def test_stats_read_is_a_single_query(self):
+        """once the counters exist, reading them is one primary key lookup (after the ETag lookup)"""
+        Like.objects.create(candidate_id=self.candidates[0], job_id=self.job)
+        with self.assertNumQueries(2):
+            self.get_stats(self.job)
+
+    def test_bulk_stats(self):
+        """stats of many jobs are returned at once"""
+        Like.objects.create(candidate_id=self.candidates[0], job_id=self.other_job)
+        response = self.client.get("/jobs/stats/", {"job_ids": f"{self.job.job_id},{self.other_job.job_id}"})
+        self.assertEqual(response.json()[str(self.other_job.job_id)]["num_likes"], 1)
+        self.assertEqual(self.client.get("/jobs/stats/", {"job_ids": "1,x"}).status_code, 400)
+
+    def test_rebuild_command(self):
+        """rebuild_job_stats fixes counters that drifted from the source tables"""
+        Like.objects.create(candidate_id=self.candidates[0], job_id=self.job)
+        JobStats.objects.filter(job_id=self.job).update(num_likes=10)
+        call_command("rebuild_job_stats", stdout=StringIO())
+        self.assertEqual(job_stats.get_stats([self.job.job_id])[self.job.job_id]["num_likes"], 1)
+
+    def test_new_jobs_start_with_zero_counters(self):
+        """a new job has its counters from the start, so its first like is a single update"""
+        self.assertEqual(job_stats.get_stats([self.job.job_id])[self.job.job_id], job_stats.EMPTY_STATS)
+        with self.assertNumQueries(1):
+            job_stats.increment(self.job.job_id, 'num_likes')
+
+    def test_missing_counters_are_created_on_the_first_write(self):
+        """a job without counters gets them counted from the source tables, including the write being counted"""
+        JobStats.objects.all().delete()
+        Like.objects.bulk_create([Like(candidate_id=candidate, job_id=self.job) for candidate in self.candidates[:2]])
+        Like.objects.create(candidate_id=self.candidates[2], job_id=self.job)
+        utils.add_ranked_candidates_to_table([self.candidates[0].candidate_id], self.other_job.job_id)
+        self.assertEqual(JobStats.objects.get(job_id=self.job).num_likes, 3)
+        self.assertEqual(JobStats.objects.get(job_id=self.other_job).num_matches, 1)
+
+    def test_concurrent_first_writes_are_all_counted(self):
+        """counters created by another transaction in the meantime are kept, and the write is added to them"""
+        JobStats.objects.all().delete()
+        count_job_stats = job_stats.count_job_stats
+
+        def count_while_other_write_commits(job_ids):
+            stats = count_job_stats(job_ids)
+            JobStats.objects.create(job_id=self.job, num_likes=1)  # the other first like, committed meanwhile
+            return stats
+
+        with mock.patch.object(job_stats, 'count_job_stats', side_effect=count_while_other_write_commits):
+            Like.objects.create(candidate_id=self.candidates[0], job_id=self.job)
+        self.assertEqual(JobStats.objects.get(job_id=self.job).num_likes, 2)
+
+    def test_missing_counters_are_stored_by_reads_from_the_primary(self):
+        """without a replica the stats endpoints read from the primary, so they store the counters they count"""
+        JobStats.objects.all().delete()
+        Like.objects.bulk_create([Like(candidate_id=self.candidates[0], job_id=self.job)])
+        self.assertEqual(self.get_stats(self.job)["num_likes"], 1)
+        self.assertEqual(JobStats.objects.get(job_id=self.job).num_likes, 1)
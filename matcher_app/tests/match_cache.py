@@ -0,0 +1,201 @@
+from django.core.cache import caches
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from unittest import mock
+from matcher_app import candidate_finder, match_cache, match_index, skill_registry, title_similarity
+from matcher_app.models import Candidate, Skill, Job, JobSkill
+
+
+class TestLocalBackend(TestCase):
+    def test_lru_eviction(self):
+        """the least recently used job is evicted once the cache is full"""
+        backend = match_cache.LocalBackend(max_entries=2)
+        for job_id in (1, 2):
+            backend.set(job_id, backend.get_version(job_id), [job_id])
+        backend.get(1, backend.get_version(1))  # job 1 is now more recently used than job 2
+        backend.set(3, backend.get_version(3), [3])
+        self.assertEqual(backend.get(1, backend.get_version(1)), [1])
+        self.assertIsNone(backend.get(2, backend.get_version(2)))
+
+    def test_result_computed_during_invalidation_is_not_stored(self):
+        """a result computed before a version bump is never served"""
+        backend = match_cache.LocalBackend()
+        version = backend.get_version(1)
+        backend.bump_job(1)
+        backend.set(1, version, [10])
+        self.assertIsNone(backend.get(1, backend.get_version(1)))
+
+    def test_rebuilt_index_drops_local_results(self):
+        """results of the local backend do not outlive the index they were computed with"""
+        backend = match_cache.LocalBackend()
+        backend.set(1, backend.get_version(1), [10])
+        index = match_index.CandidateIndex()
+        index.built_at = 1.0
+        with mock.patch.object(match_index, '_index', index):
+            self.assertIsNone(backend.get(1, backend.get_version(1)))
+
+    def test_django_results_are_kept_per_index_build(self):
+        """a worker whose index predates a write never serves its results to workers with a newer index"""
+        caches['default'].clear()
+        backend = match_cache.DjangoCacheBackend()
+        backend.set(1, backend.get_version(1), [10])
+        self.assertEqual(backend.get(1, backend.get_version(1)), [10])
+        index = match_index.CandidateIndex()
+        index.built_at = 1.0
+        with mock.patch.object(match_index, '_index', index):
+            self.assertIsNone(backend.get(1, backend.get_version(1)))
+        caches['default'].clear()
+
+
+class TestAffectedJobs(TestCase):
+    def setUp(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        title_similarity.reset_vectors()
+        self.python = Skill.objects.create(skill_name="Python")
+        self.law = Skill.objects.create(skill_name="Law")
+        self.developer = Job.objects.create(title="Software Developer", status="opened", skill="python")
+        self.lawyer = Job.objects.create(title="Lawyer", status="opened", skill="Cobol")
+        JobSkill.objects.create(job_id=self.lawyer, skill_id=self.law)
+        Job.objects.create(title="Software Developer", status="closed", skill="Python")
+        Candidate.objects.create(title="Attorney")
+
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        title_similarity.reset_vectors()
+
+    def test_jobs_with_skills(self):
+        """open jobs asking for a skill through their skills or their Job.skill"""
+        self.assertEqual(candidate_finder.get_jobs_with_skills([self.python.pk]), {self.developer.job_id})
+        self.assertEqual(candidate_finder.get_jobs_with_skills([self.law.pk, self.python.pk]),
+                         {self.developer.job_id, self.lawyer.job_id})
+        self.assertEqual(candidate_finder.get_jobs_with_skills([]), set())
+
+    def test_jobs_matching_titles(self):
+        """jobs sharing a possibly misspelled word with the title, or similar to it in meaning"""
+        vectors = title_similarity.get_vectors(match_index.get_index())
+        self.assertEqual(candidate_finder.get_jobs_matching_titles(["Sofware Architect"], vectors),
+                         {self.developer.job_id})
+        self.assertEqual(candidate_finder.get_jobs_matching_titles(["Attorney"], vectors), {self.lawyer.job_id})
+        self.assertEqual(candidate_finder.get_jobs_matching_titles(["Attorney"]), set())
+        self.assertEqual(candidate_finder.get_jobs_matching_titles(["Chef"], vectors), set())
+        self.assertIsNone(candidate_finder.get_jobs_matching_titles(["Chef"], vectors, max_jobs=1))
+
+
+class TestMatchCacheInvalidation(TransactionTestCase):
+    def setUp(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+        self.skill = Skill.objects.create(skill_name="Python")
+        self.job = Job.objects.create(title="Software Developer", status="opened", skill="Python")
+        self.candidate = Candidate.objects.create(title="Software Developer")
+        self.candidate.skills.set([self.skill.pk])
+
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+
+    def get_matches(self):
+        return self.client.get(f"/candidates/{self.job.job_id}/").json()
+
+    def test_repeated_requests_hit_the_cache(self):
+        """the second request is served from the cache without writing new matches"""
+        self.assertEqual(self.get_matches(), [self.candidate.candidate_id])
+        with self.assertNumQueries(2):  # only the ETag versions and the job lookup
+            self.assertEqual(self.get_matches(), [self.candidate.candidate_id])
+        stats = self.client.get("/matches/cache/").json()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_writes_invalidate_the_cache(self):
+        """new candidates, opinions and job changes are visible on the next request"""
+        self.get_matches()
+        other = Candidate.objects.create(title="Software Developer")
+        other.skills.add(self.skill)
+        self.assertEqual(self.get_matches(), [self.candidate.candidate_id, other.candidate_id])
+
+        opinion_data = {"job_id": self.job.job_id, "candidate_id": other.candidate_id, "is_liked": False}
+        self.client.post("/candidate/opinion/", data=opinion_data, content_type='application/json')
+        self.assertEqual(self.get_matches(), [self.candidate.candidate_id])
+
+        self.client.put("/job/", data={"job_id": self.job.job_id, "status": "closed"},
+                        content_type='application/json')
+        self.assertEqual(self.client.get(f"/candidates/{self.job.job_id}/").status_code, 204)
+
+    def test_candidate_writes_only_invalidate_their_jobs(self):
+        """a candidate write leaves the cached matches of jobs it cannot match alone"""
+        lawyer_job = Job.objects.create(title="Lawyer", status="opened", skill="Python")
+        self.get_matches()
+        self.client.get(f"/candidates/{lawyer_job.job_id}/")
+        law = Skill.objects.create(skill_name="Law")
+        invalidations = match_cache.get_cache().invalidations
+
+        chef = Candidate.objects.create(title="Chef")  # neither title nor skill of any job
+        chef.skills.add(law)
+        cobol = Skill.objects.create(skill_name="Cobol")
+        chef.skills.add(cobol)
+        chef.title = "Senior Chef"
+        chef.save()
+        self.assertEqual(match_cache.get_cache().invalidations, invalidations)
+
+        chef.title = "Software Chef"  # now matches the title of the developer job
+        chef.save()
+        self.assertEqual(match_cache.get_cache().invalidations, invalidations + 1)
+        self.get_matches()
+        self.client.get(f"/candidates/{lawyer_job.job_id}/")
+        self.assertEqual(match_cache.get_cache().misses, 3)
+
+        self.assertEqual(self.get_matches(), [self.candidate.candidate_id])
+        self.candidate.skills.clear()  # no candidate left with title and skill - the job falls back to either
+        self.assertEqual(match_cache.get_cache().invalidations, invalidations + 3)
+        self.assertEqual(sorted(self.get_matches()), [self.candidate.candidate_id, chef.candidate_id])
+
+    def test_candidate_writes_are_looked_up_once_after_commit(self):
+        """the jobs a transaction's candidate writes affect are looked up once it commits, and not on rollback"""
+        self.get_matches()
+        invalidations = match_cache.get_cache().invalidations
+        with mock.patch.object(candidate_finder, 'get_jobs_matching_titles',
+                               wraps=candidate_finder.get_jobs_matching_titles) as lookup:
+            with transaction.atomic():
+                Candidate.objects.create(title="Chef")
+                Candidate.objects.create(title="Software Developer")
+                self.assertEqual(lookup.call_count, 0)
+            self.assertEqual(lookup.call_count, 1)
+            self.assertEqual(lookup.call_args[0][0], {"Chef", "Software Developer"})
+            self.assertEqual(match_cache.get_cache().invalidations, invalidations + 1)
+
+            with self.assertRaises(ValueError), transaction.atomic():
+                Candidate.objects.create(title="Software Developer")
+                raise ValueError
+            self.assertEqual(lookup.call_count, 1)
+
+    @override_settings(MATCHER_INVALIDATION_MAX_JOBS=0)
+    def test_too_many_jobs_invalidate_all(self):
+        """every job is invalidated when there are too many open jobs to look up"""
+        self.get_matches()
+        version = match_cache.get_cache().backend.global_version
+        Candidate.objects.create(title="Chef")
+        self.assertEqual(match_cache.get_cache().backend.global_version, version + 1)
+
+    def test_raw_saves_are_ignored(self):
+        """fixtures loaded with loaddata leave the index and the cache alone"""
+        self.get_matches()
+        invalidations = match_cache.get_cache().invalidations
+        version = match_cache.get_cache().backend.global_version
+        Candidate(title="Software Developer").save_base(raw=True)
+        self.assertEqual((match_cache.get_cache().invalidations, match_cache.get_cache().backend.global_version),
+                         (invalidations, version))
+
+    @override_settings(MATCHER_MATCH_CACHE_BACKEND='django')
+    def test_django_cache_backend(self):
+        """the django cache backend shares versions through the cache framework"""
+        caches['default'].clear()
+        match_cache.reset_cache()
+        self.get_matches()
+        self.get_matches()
+        match_cache.get_cache().invalidate_job(self.job.job_id)
+        self.get_matches()
+        stats = match_cache.get_cache().stats()
+        self.assertEqual((stats["backend"], stats["hits"], stats["misses"]), ("DjangoCacheBackend", 1, 2))
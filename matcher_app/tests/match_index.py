@@ -0,0 +1,185 @@
+from django.test import TestCase, TransactionTestCase, override_settings
+from matcher_app import match_index, match_cache, fuzzy, skill_registry
+from matcher_app.models import Candidate, Skill, Job
+from unittest import mock
+import threading
+import time
+
+
+class TestCandidateIndex(TestCase):
+    def setUp(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        self.python = Skill.objects.create(skill_name="Python")
+        self.law = Skill.objects.create(skill_name="Law")
+        self.developer = Candidate.objects.create(title="Software Developer")
+        self.developer.skills.set([self.python.pk])
+        self.engineer = Candidate.objects.create(title="Electrical Engineer")
+        self.engineer.skills.set([self.python.pk, self.law.pk])
+        self.lawyer = Candidate.objects.create(title="Lawyer")
+        self.lawyer.skills.set([self.law.pk])
+
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+
+    def test_index_is_built_from_database(self):
+        """title tokens, exact titles and skills all resolve to the right candidate ids"""
+        index = match_index.get_index()
+        self.assertEqual(index.get_title_token_matches(["software", "Engineer"]).tolist(),
+                         [self.developer.candidate_id, self.engineer.candidate_id])
+        self.assertEqual(index.get_exact_title_matches("Lawyer").tolist(), [self.lawyer.candidate_id])
+        self.assertEqual(index.get_skill_matches(self.law.pk).tolist(),
+                         [self.engineer.candidate_id, self.lawyer.candidate_id])
+
+    def test_index_updates(self):
+        """updates move candidates between postings without rebuilding the index"""
+        index = match_index.get_index()
+        index.set_title(self.lawyer.candidate_id, "Software Lawyer")
+        index.add_skills(self.lawyer.candidate_id, [self.python.pk])
+        index.remove_candidate(self.developer.candidate_id)
+        self.assertEqual(index.get_title_token_matches(["software"]).tolist(), [self.lawyer.candidate_id])
+        self.assertEqual(index.get_exact_title_matches("Lawyer").tolist(), [])
+        self.assertEqual(index.get_skill_matches(self.python.pk).tolist(),
+                         [self.engineer.candidate_id, self.lawyer.candidate_id])
+
+        index.remove_skill(self.law.pk)
+        self.assertEqual(index.get_skill_matches(self.law.pk).tolist(), [])
+        self.assertEqual(index.rows.get(self.engineer.candidate_id)[1].tolist(), [self.python.pk])
+
+    def test_candidates_endpoint_uses_index(self):
+        """a job matches candidates on title tokens and skill"""
+        match_cache.reset_cache()
+        job = Job.objects.create(title="Software Engineer", status="opened", skill="python")
+        response = self.client.get(f"/candidates/{job.job_id}/")
+        self.assertEqual(sorted(response.json()), [self.developer.candidate_id, self.engineer.candidate_id])
+
+
+class TestCandidateIndexSignals(TransactionTestCase):
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+
+    def test_index_follows_committed_writes(self):
+        """model signals keep an already built index in sync"""
+        skill = Skill.objects.create(skill_name="Juggling")
+        index = match_index.get_index()
+        candidate = Candidate.objects.create(title="Clown")
+        candidate.skills.add(skill)
+        self.assertEqual(index.get_exact_title_matches("Clown").tolist(), [candidate.candidate_id])
+        self.assertEqual(index.get_skill_matches(skill.pk).tolist(), [candidate.candidate_id])
+
+        candidate.skills.clear()
+        self.assertEqual(index.get_skill_matches(skill.pk).tolist(), [])
+        candidate.delete()
+        self.assertEqual(index.get_exact_title_matches("Clown").tolist(), [])
+
+
+class TestIndexRebuild(TestCase):
+    def tearDown(self):
+        match_index.reset_index()
+
+    @override_settings(MATCHER_INDEX_MAX_AGE=60)
+    def test_stale_index_keeps_serving_while_rebuilt(self):
+        """an old index is rebuilt in the background and swapped in once built, without blocking readers"""
+        building, release = threading.Event(), threading.Event()
+        old, new = match_index.CandidateIndex(), match_index.CandidateIndex()
+        old.built_at = 0  # a long time ago
+
+        def load_index():
+            building.set()
+            release.wait(5)
+            new.built_at = time.monotonic()
+            return new
+
+        with mock.patch.object(match_index, '_load_index', side_effect=load_index) as loads, \
+                mock.patch.object(match_index, '_index', old), mock.patch.object(match_index.connections, 'close_all'):
+            self.assertIs(match_index.get_index(), old)
+            self.assertTrue(building.wait(5))
+            self.assertIs(match_index.get_index(), old)  # served while the build runs, without a second build
+            release.set()
+            match_index.start_rebuild().join(5)
+            self.assertIs(match_index.get_index(), new)
+            self.assertEqual(loads.call_count, 1)
+
+    def test_updates_during_a_rebuild_are_replayed(self):
+        """writes committed while the new index is built reach it before it is swapped in"""
+        old = match_index.CandidateIndex()
+        old.built_at = time.monotonic()
+
+        def load_index():
+            match_index.apply_update('set_title', 7, "Clown")  # committed after the build read the database
+            return match_index.CandidateIndex()
+
+        with mock.patch.object(match_index, '_load_index', side_effect=load_index), \
+                mock.patch.object(match_index, '_index', old), mock.patch.object(match_index.connections, 'close_all'):
+            match_index.start_rebuild(old).join(5)
+            new = match_index.get_loaded_index()
+            self.assertIsNot(new, old)
+            self.assertEqual(old.get_exact_title_matches("Clown").tolist(), [7])
+            self.assertEqual(new.get_exact_title_matches("Clown").tolist(), [7])
+            match_index.apply_update('remove_candidate', 7)  # no longer queued once swapped in
+            self.assertEqual(new.get_exact_title_matches("Clown").tolist(), [])
+            self.assertIsNone(match_index._pending_updates)
+
+    def test_build_started_at_worker_start(self):
+        """requests arriving before the first build is done wait for it instead of starting another one"""
+        built = match_index.CandidateIndex()
+        release = threading.Event()
+
+        def load_index():
+            release.wait(5)
+            return built
+
+        with mock.patch.object(match_index, '_load_index', side_effect=load_index) as loads, \
+                mock.patch.object(match_index.connections, 'close_all'):
+            thread = match_index.start_rebuild()
+            release.set()
+            self.assertIs(match_index.get_index(), built)
+            thread.join(5)
+            self.assertEqual(loads.call_count, 1)
+
+    def test_failed_rebuild_keeps_the_index(self):
+        old = match_index.CandidateIndex()
+        with mock.patch.object(match_index, '_load_index', side_effect=RuntimeError), \
+                mock.patch.object(match_index, '_index', old), mock.patch.object(match_index.connections, 'close_all'):
+            with self.assertLogs('matcher_app.match_index', 'ERROR'):
+                match_index.start_rebuild(old).join(5)
+            self.assertIs(match_index.get_loaded_index(), old)
+
+
+class TestFuzzyTitleMatching(TestCase):
+    def setUp(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        self.developer = Candidate.objects.create(title="Software Developer")
+        self.engineer = Candidate.objects.create(title="Software Engineer")
+        self.senior = Candidate.objects.create(title="Senior Software Engineer")
+        self.driver = Candidate.objects.create(title="Taxi Driver")
+
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+
+    def test_bk_tree_search(self):
+        """the BK-tree finds the same words as comparing the query with every word"""
+        words = ["software", "engineer", "engine", "engineers", "developer", "driver", "diver", "river", "lawyer"]
+        tree = fuzzy.BKTree(words)
+        self.assertEqual(fuzzy.levenshtein("sofware", "software"), 1)
+        for query in ["engneer", "drivers", "lawer", "nurse"]:
+            expected = sorted(((word, fuzzy.levenshtein(query, word)) for word in words
+                               if fuzzy.levenshtein(query, word) <= 2), key=lambda match: (match[1], match[0]))
+            self.assertEqual(tree.search(query, 2), expected)
+
+    def test_typos_are_tolerated(self):
+        """misspelled titles of any length match, ranked by similarity"""
+        ids, similarities = match_index.get_index().get_fuzzy_title_matches("Sofware Engneer", 2)
+        self.assertEqual(ids.tolist()[:2], [self.engineer.candidate_id, self.senior.candidate_id])
+        self.assertEqual(ids.tolist()[2], self.developer.candidate_id)
+        self.assertNotIn(self.driver.candidate_id, ids.tolist())
+        self.assertTrue((similarities[:-1] >= similarities[1:]).all())
+
+    def test_distance_threshold(self):
+        """no typos are tolerated with a max distance of 0"""
+        ids, _ = match_index.get_index().get_fuzzy_title_matches("Sofware Engineer", 0)
+        self.assertEqual(sorted(ids.tolist()), [self.engineer.candidate_id, self.senior.candidate_id])
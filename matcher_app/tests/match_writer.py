@@ -0,0 +1,104 @@
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from matcher_app import match_cache, match_index, match_writer, metrics, skill_registry
+from matcher_app.models import Candidate, Job, JobStats, Match, PendingMatch, Skill
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+
+class TestMatchWriter(TestCase):
+    def setUp(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+        metrics.reset_metrics()
+        python = Skill.objects.create(skill_name="Python")
+        self.candidates = [Candidate.objects.create(title="Software Developer") for _ in range(3)]
+        for candidate in self.candidates:
+            candidate.skills.set([python.pk])
+        self.candidate_ids = [candidate.candidate_id for candidate in self.candidates]
+        self.job = Job.objects.create(title="Software Developer", status="opened", skill="Python")
+
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+        metrics.reset_metrics()
+
+    def test_request_only_queues_the_matches(self):
+        """the candidates request leaves the Match table to the worker"""
+        response = self.client.get(f"/candidates/{self.job.job_id}/")
+        self.assertEqual(sorted(response.json()), self.candidate_ids)
+        self.assertEqual(Match.objects.count(), 0)
+        self.assertEqual(PendingMatch.objects.count(), 1)
+
+        self.assertEqual(match_writer.flush(), 1)
+        self.assertEqual(sorted(Match.objects.values_list('candidate_id', flat=True)), self.candidate_ids)
+        self.assertEqual(JobStats.objects.get(job_id=self.job).num_matches, 3)
+        self.assertEqual(PendingMatch.objects.count(), 0)
+
+    @override_settings(MATCHER_MATCH_WRITE_BEHIND=False)
+    def test_synchronous_writes(self):
+        self.client.get(f"/candidates/{self.job.job_id}/")
+        self.assertEqual(Match.objects.count(), 3)
+        self.assertEqual(PendingMatch.objects.count(), 0)
+
+    def test_rows_of_a_job_are_coalesced(self):
+        """a candidate queued several times is written once, with the time of its latest match"""
+        match_writer.save_matches(self.job.job_id, self.candidate_ids[:2])
+        match_writer.save_matches(self.job.job_id, self.candidate_ids[1:])
+        earlier = timezone.now() - timedelta(minutes=5)
+        PendingMatch.objects.filter(id=PendingMatch.objects.order_by('id').first().id).update(time_matched=earlier)
+        deleted_job = Job.objects.create(title="Lawyer", status="opened", skill="Law")
+        match_writer.save_matches(deleted_job.job_id, self.candidate_ids)
+        deleted_job.delete()
+
+        self.assertEqual(match_writer.flush(), 3)
+        times = dict(Match.objects.values_list('candidate_id', 'time_matched'))
+        self.assertEqual(sorted(times), self.candidate_ids)
+        self.assertEqual(times[self.candidate_ids[0]], earlier)
+        self.assertGreater(times[self.candidate_ids[1]], earlier)
+
+    def test_worker_drains_the_backlog_on_shutdown(self):
+        for _ in range(5):
+            match_writer.save_matches(self.job.job_id, self.candidate_ids)
+        calls = []
+
+        def should_stop():
+            calls.append(True)
+            return len(calls) > 1
+
+        self.assertEqual(match_writer.run_worker(interval=0, batch_size=2, should_stop=should_stop), 5)
+        self.assertEqual(PendingMatch.objects.count(), 0)
+        self.assertEqual(Match.objects.count(), 3)
+
+    def test_drain_is_bounded(self):
+        """drain writes the rows pending when it starts, and stops at its timeout"""
+        match_writer.save_matches(self.job.job_id, self.candidate_ids)
+        self.assertEqual(match_writer.drain(timeout=0), 0)
+        real_flush = match_writer.flush
+
+        def flush_and_queue(*args):
+            match_writer.save_matches(self.job.job_id, self.candidate_ids)  # a request queued during the drain
+            return real_flush(*args)
+
+        with mock.patch.object(match_writer, 'flush', side_effect=flush_and_queue):
+            self.assertEqual(match_writer.drain(batch_size=1), 1)
+        self.assertEqual(PendingMatch.objects.count(), 2)
+
+    def test_backlog_metrics(self):
+        match_writer.save_matches(self.job.job_id, self.candidate_ids)
+        PendingMatch.objects.update(time_matched=timezone.now() - timedelta(seconds=30))
+        gauges = self.client.get("/metrics/?format=json").json()["gauges"]
+        self.assertEqual(gauges["matcher_match_backlog_rows"], [{"labels": {}, "value": 1}])
+        match_writer.save_matches(self.job.job_id, self.candidate_ids)
+        self.assertEqual(match_writer.get_backlog()[0], 2)
+        self.assertGreaterEqual(gauges["matcher_match_backlog_age_seconds"][0]["value"], 30)
+        self.assertIn('matcher_match_writes_enqueued_total 2', self.client.get("/metrics/").content.decode())
+
+        out = StringIO()
+        call_command('flush_matches', '--once', stdout=out)
+        self.assertIn('Flushed 2 queued match results', out.getvalue())
+        self.assertEqual(match_writer.get_backlog(), (0, 0.0))
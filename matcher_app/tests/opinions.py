@@ -0,0 +1,78 @@
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from matcher_app import job_stats, match_cache, match_index, skill_registry
+from matcher_app.models import Candidate, Skill, Job, Like, Dislike
+
+
+class TestBulkOpinions(TransactionTestCase):
+    def setUp(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+        skill = Skill.objects.create(skill_name="Python")
+        self.candidates = [Candidate.objects.create(title="Software Developer") for _ in range(4)]
+        for candidate in self.candidates:
+            candidate.skills.set([skill.pk])
+        self.job = Job.objects.create(title="Software Developer", status="opened", skill="Python")
+        self.closed_job = Job.objects.create(title="Software Developer", status="closed", skill="Python")
+
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+
+    def post(self, entries):
+        return self.client.post("/candidate/opinions/", data=entries, content_type='application/json')
+
+    def test_per_item_results(self):
+        """valid entries are saved and every invalid entry gets its own error"""
+        first, second = self.candidates[0].candidate_id, self.candidates[1].candidate_id
+        entries = [{"candidate_id": first, "job_id": self.job.job_id, "is_liked": True},
+                   {"candidate_id": second, "job_id": self.job.job_id, "is_liked": False},
+                   {"candidate_id": first, "job_id": self.closed_job.job_id, "is_liked": True},
+                   {"candidate_id": first, "job_id": self.closed_job.job_id, "is_liked": False},
+                   {"candidate_id": 999, "job_id": self.job.job_id, "is_liked": True},
+                   {"candidate_id": first, "job_id": 999, "is_liked": True},
+                   {"candidate_id": first, "job_id": self.job.job_id, "is_liked": "yes"},
+                   "like"]
+        response = self.post(entries)
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([result["created"] for result in results], [True, True, False, True, False, False, False,
+                                                                      False])
+        self.assertEqual(results[2]["error"], 'Job is not open - cannot add like')
+        self.assertEqual(results[4]["error"], 'Candidate does not exist')
+        self.assertEqual(results[5]["error"], 'Job does not exist')
+        self.assertEqual(response.json()["created"], 3)
+        self.assertEqual(Like.objects.count(), 1)
+        self.assertEqual(Dislike.objects.count(), 2)
+
+        stats = job_stats.get_stats([self.job.job_id, self.closed_job.job_id])
+        self.assertEqual(stats, job_stats.rebuild_job_stats([self.job.job_id, self.closed_job.job_id]))
+        self.assertEqual(stats[self.job.job_id]["num_likes"], 1)
+        self.assertEqual(stats[self.closed_job.job_id]["num_dislikes"], 1)
+
+    def test_invalid_body(self):
+        self.assertEqual(self.post({"candidate_id": 1}).status_code, 400)
+
+    def test_constant_number_of_queries(self):
+        """the number of queries does not grow with the number of entries"""
+        def count_queries(candidates):
+            entries = [{"candidate_id": candidate.candidate_id, "job_id": self.job.job_id, "is_liked": True}
+                       for candidate in candidates]
+            with CaptureQueriesContext(connection) as queries:
+                self.post(entries)
+            return len(queries)
+
+        job_stats.get_stats([self.job.job_id])  # create the job's counters up front
+        self.assertEqual(count_queries(self.candidates[:1]), count_queries(self.candidates))
+
+    def test_cached_matches_are_invalidated(self):
+        """liked and disliked candidates are no longer returned for the job"""
+        url = f"/candidates/{self.job.job_id}/"
+        self.assertEqual(len(self.client.get(url).json()), 4)
+        self.post([{"candidate_id": self.candidates[0].candidate_id, "job_id": self.job.job_id, "is_liked": True},
+                   {"candidate_id": self.candidates[1].candidate_id, "job_id": self.job.job_id, "is_liked": False}])
+        self.assertEqual(self.client.get(url).json(), [self.candidates[2].candidate_id,
+                                                        self.candidates[3].candidate_id])
@@ -0,0 +1,148 @@
+from contextlib import ExitStack
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from matcher_app import match_cache, match_index, metrics, urls, skill_registry
+from matcher_app.models import Candidate, Skill, Job, JobStats, Like
+
+
+class QueryBudgetMixin:
+    """assertions on the query budgets declared on the views with @metrics.query_budget"""
+
+    def assertWithinQueryBudget(self, method, url, data=None):
+        """send a request and fail if it ran more queries than the budget of the view behind the url - the queries of
+        every database the test uses are counted, like QueryMetricsMiddleware counts those of every connection"""
+        view = resolve(url.split('?')[0]).func
+        budget = getattr(view, 'query_budget', None)
+        self.assertIsNotNone(budget, f'{url} has no query budget - declare one with @metrics.query_budget')
+        with ExitStack() as stack:
+            captures = [stack.enter_context(CaptureQueriesContext(connections[alias]))
+                        for alias in sorted(self.databases)]
+            response = getattr(self.client, method)(url, data=data, content_type='application/json')
+            if getattr(response, 'streaming', False):
+                b''.join(response.streaming_content)
+        queries = [query['sql'] for capture in captures for query in capture.captured_queries]
+        self.assertLessEqual(len(queries), budget, f'{method.upper()} {url} ran {len(queries)} queries '
+                                                   f'(budget {budget}):\n' + '\n'.join(queries))
+        return response
+
+
+@override_settings(MATCHER_REPLICA_DATABASE='replica')
+class TestQueryBudgets(QueryBudgetMixin, TransactionTestCase):
+    """the read-only endpoints read from the replica alias, which mirrors the default database in the tests - so the
+    data has to be committed for it"""
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+        metrics.reset_metrics()
+        python = Skill.objects.create(skill_name="Python")
+        self.candidates = [Candidate.objects.create(title="Software Developer") for _ in range(20)]
+        for candidate in self.candidates:
+            candidate.skills.set([python.pk])
+        self.job = Job.objects.create(title="Software Developer", status="opened", skill="Python")
+        self.other_job = Job.objects.create(title="Sofware Developer", status="opened", skill="Python")
+        for candidate in self.candidates[:10]:
+            Like.objects.create(candidate_id=candidate, job_id=self.job)
+            self.client.post("/candidate/note/", content_type='application/json',
+                             data={"job_id": self.job.job_id, "candidate_id": candidate.candidate_id, "note": "Good"})
+
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+        metrics.reset_metrics()
+
+    def test_every_view_declares_a_budget(self):
+        for pattern in urls.urlpatterns:
+            self.assertIsNotNone(getattr(pattern.callback, 'query_budget', None), f'{pattern} has no query budget')
+
+    def test_read_endpoints(self):
+        job_id = self.job.job_id
+        for url in (f"/candidates/{job_id}/", f"/candidates/{job_id}/?limit=5", f"/candidates/{job_id}/?stream=1",
+                    f"/candidates/liked/{job_id}/", f"/candidates/liked/{job_id}/?stream=1", f"/job/{job_id}/",
+                    f"/jobs/stats/?job_ids={job_id},{self.other_job.job_id}", f"/job/{job_id}/skills/",
+                    "/skills/?prefix=p", "/matches/cache/", "/metrics/"):
+            match_cache.reset_cache()
+            self.assertWithinQueryBudget('get', url)
+
+    def test_write_endpoints(self):
+        job_id, other_job_id = self.job.job_id, self.other_job.job_id
+        candidate_id = self.candidates[-1].candidate_id
+        self.assertWithinQueryBudget('post', "/candidates/batch/", {"job_ids": [job_id, other_job_id]})
+        self.assertWithinQueryBudget('post', "/candidate/opinion/",
+                                     {"job_id": job_id, "candidate_id": candidate_id, "is_liked": True})
+        self.assertWithinQueryBudget('post', "/candidate/opinion/",
+                                     {"job_id": other_job_id, "candidate_id": candidate_id, "is_liked": False})
+        self.assertWithinQueryBudget('post', "/candidate/opinions/",
+                                     [{"job_id": other_job_id, "candidate_id": candidate.candidate_id,
+                                       "is_liked": True} for candidate in self.candidates])
+        self.assertWithinQueryBudget('post', "/candidate/note/",
+                                     {"job_id": job_id, "candidate_id": candidate_id, "note": "Great"})
+        self.assertWithinQueryBudget('put', f"/job/{job_id}/skills/", [{"skill": "Python", "weight": 2.0}])
+        self.assertWithinQueryBudget('put', "/job/", {"job_id": job_id, "status": "pending"})
+
+    def test_cold_start(self):
+        """the first requests of a worker, which build its index, and the first writes for a job - a new one or one
+        whose counters do not exist yet - with the matches stored during the request"""
+        new_job = Job.objects.create(title="Software Developer", status="opened", skill="Python")
+        candidate_id = self.candidates[-1].candidate_id
+        with override_settings(MATCHER_MATCH_WRITE_BEHIND=False):
+            for job_id, has_counters in ((new_job.job_id, True), (self.other_job.job_id, False)):
+                match_index.reset_index()
+                match_cache.reset_cache()
+                for method, url, data in (
+                        ('get', f"/job/{job_id}/", None),
+                        ('get', f"/candidates/{job_id}/", None),
+                        ('post', "/candidate/opinion/", {"job_id": job_id, "candidate_id": candidate_id,
+                                                         "is_liked": True}),
+                        ('post', "/candidate/note/", {"job_id": job_id, "candidate_id": candidate_id,
+                                                      "note": "Great"})):
+                    if not has_counters:  # e.g. a job created before the counters table
+                        JobStats.objects.filter(job_id=job_id).delete()
+                    self.assertWithinQueryBudget(method, url, data)
+
+            JobStats.objects.all().delete()
+            match_index.reset_index()
+            match_cache.reset_cache()
+            self.assertWithinQueryBudget('get', f"/jobs/stats/?job_ids={self.job.job_id},{new_job.job_id}")
+            with override_settings(MATCHER_REPLICA_DATABASE=None):  # read from the primary, which stores the counters
+                self.assertWithinQueryBudget('get', f"/job/{self.job.job_id}/")
+                self.assertWithinQueryBudget('get', f"/jobs/stats/?job_ids={self.job.job_id},{new_job.job_id}")
+            JobStats.objects.all().delete()
+            self.assertWithinQueryBudget('post', "/candidates/batch/", {"job_ids": [self.job.job_id, new_job.job_id]})
+            JobStats.objects.all().delete()
+            self.assertWithinQueryBudget('post', "/candidate/opinions/",
+                                         [{"job_id": job_id, "candidate_id": candidate.candidate_id, "is_liked": False}
+                                          for job_id in (self.job.job_id, new_job.job_id)
+                                          for candidate in self.candidates])
+            JobStats.objects.all().delete()
+            self.assertWithinQueryBudget('post', "/candidate/opinion/",
+                                         {"job_id": self.job.job_id, "candidate_id": candidate_id, "is_liked": False})
+
+    def test_metrics_endpoint(self):
+        """requests and matching stages are exported as histograms"""
+        self.client.get(f"/candidates/{self.job.job_id}/")
+        text = self.client.get("/metrics/").content.decode()
+        self.assertIn('# TYPE matcher_stage_seconds histogram', text)
+        self.assertIn('matcher_stage_seconds_count{stage="rank"} 1', text)
+        self.assertIn('matcher_view_queries_count{view="matcher_app.views.get_all_candidates_for_job"} 1',
+                      text)
+        snapshot = self.client.get("/metrics/?format=json").json()
+        view_queries = snapshot["histograms"]["matcher_view_queries"]
+        candidates_view = [series for series in view_queries
+                           if series["labels"]["view"] == "matcher_app.views.get_all_candidates_for_job"]
+        self.assertEqual(candidates_view[0]["count"], 1)
+
+    def test_budget_overruns_are_counted(self):
+        view = resolve(f"/job/{self.job.job_id}/").func
+        budget, view.query_budget = view.query_budget, 0
+        try:
+            self.client.get(f"/job/{self.job.job_id}/")
+        finally:
+            view.query_budget = budget
+        counters = metrics.registry.snapshot()["counters"]["matcher_view_query_budget_exceeded_total"]
+        self.assertEqual(counters, [{"labels": {"view": "matcher_app.views.handle_given_job"}, "value": 1}])
@@ -0,0 +1,87 @@
+from django.db import connections, transaction
+from django.test import AsyncRequestFactory, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from matcher_app import async_views, match_cache, match_index, metrics, routers, skill_registry
+from matcher_app.models import Candidate, Job, JobStats, Like, Note
+
+
+@override_settings(MATCHER_REPLICA_DATABASE='replica')
+class TestReplicaRouter(TransactionTestCase):
+    """the replica alias mirrors the default database in the tests, so the data has to be committed for it"""
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+        metrics.reset_metrics()
+        self.candidate = Candidate.objects.create(title="Software Developer")
+        self.job = Job.objects.create(title="Software Developer", status="opened", skill="Python")
+        Like.objects.create(candidate_id=self.candidate, job_id=self.job)
+        Note.objects.create(candidate_id=self.candidate, job_id=self.job, note="Good")
+
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+        metrics.reset_metrics()
+
+    def capture(self):
+        return CaptureQueriesContext(connections['default']), CaptureQueriesContext(connections['replica'])
+
+    def test_read_only_endpoints_read_from_the_replica(self):
+        for url in (f"/candidates/liked/{self.job.job_id}/", f"/job/{self.job.job_id}/",
+                    f"/jobs/stats/?job_ids={self.job.job_id}", "/skills/?prefix=p"):
+            primary, replica = self.capture()
+            with primary, replica:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertEqual(len(primary), 0, url)
+            self.assertGreater(len(replica), 0, url)
+        self.assertEqual(self.client.get(f"/candidates/liked/{self.job.job_id}/").data[0]["notes"], ["Good"])
+
+    def test_missing_stats_are_not_stored_from_the_replica(self):
+        """stats counted on the replica are returned but only rebuilt by the primary"""
+        JobStats.objects.all().delete()
+        for url in (f"/job/{self.job.job_id}/", f"/jobs/stats/?job_ids={self.job.job_id}"):
+            primary, replica = self.capture()
+            with primary, replica:
+                response = self.client.get(url)
+            self.assertEqual(len(primary), 0, url)
+            self.assertFalse(JobStats.objects.exists())
+        self.assertEqual(response.json()[str(self.job.job_id)]["num_notes"], 1)
+        Like.objects.create(candidate_id=Candidate.objects.create(title="Lawyer"), job_id=self.job)
+        self.assertEqual(JobStats.objects.get().num_likes, 2)
+
+    def test_writes_and_other_endpoints_use_the_primary(self):
+        primary, replica = self.capture()
+        with primary, replica:
+            self.assertEqual(self.client.get(f"/candidates/{self.job.job_id}/").status_code, 200)
+            self.assertEqual(self.client.put("/job/", content_type='application/json',
+                                             data={"job_id": self.job.job_id, "status": "closed"}).status_code, 200)
+        self.assertGreater(len(primary), 0)
+        self.assertEqual(len(replica), 0)
+        self.assertEqual(Job.objects.get(job_id=self.job.job_id).status, "closed")
+
+    def test_routing(self):
+        router = routers.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Job))
+        with routers.read_only():
+            self.assertEqual(router.db_for_read(Job), 'replica')
+            with transaction.atomic():  # reads in a transaction on the primary must see its writes
+                self.assertIsNone(router.db_for_read(Job))
+            with override_settings(MATCHER_REPLICA_DATABASE=None):
+                self.assertIsNone(router.db_for_read(Job))
+        self.assertFalse(routers.is_read_only())
+        self.assertEqual(router.db_for_write(Job), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'matcher_app'))
+        self.assertIsNone(router.allow_migrate('default', 'matcher_app'))
+
+    async def test_async_views_route_the_reads_of_their_pool_calls(self):
+        @async_views.async_view(['GET', 'PUT'], budget=0, replica_reads=True)
+        async def view(request):
+            return await async_views.run_in_pool(request, routers.is_read_only)
+
+        self.assertTrue(await view(AsyncRequestFactory().get("/")))
+        self.assertFalse(await view(AsyncRequestFactory().put("/")))
+        self.assertFalse(routers.is_read_only())
@@ -0,0 +1,88 @@
+from django.test import TestCase, override_settings
+from matcher_app import candidate_finder, cooccurrence, match_cache, match_index, sharding, skill_registry
+from matcher_app.models import Candidate, Skill, Job, Like
+import numpy as np
+import threading
+
+
+class TestSharding(TestCase):
+    def setUp(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+        cooccurrence.reset_model()
+        python = Skill.objects.create(skill_name="Python")
+        django = Skill.objects.create(skill_name="Django")
+        law = Skill.objects.create(skill_name="Law")
+        titles = ["Software Developer", "Software Engineer", "Sofware Developer", "Lawyer"]
+        skill_sets = [[python.pk], [python.pk, django.pk], [django.pk], [law.pk], [python.pk, law.pk]]
+        self.candidates = []
+        for i in range(60):
+            candidate = Candidate.objects.create(title=titles[i % len(titles)])
+            candidate.skills.set(skill_sets[i % len(skill_sets)])
+            self.candidates.append(candidate)
+        self.job = Job.objects.create(title="Software Developer", status="opened", skill="Python")
+        self.lawyer_job = Job.objects.create(title="Judge", status="opened", skill="Law")
+        for candidate in self.candidates[:5]:
+            Like.objects.create(candidate_id=candidate, job_id=self.job)
+
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+        cooccurrence.reset_model()
+
+    def match(self, job):
+        return candidate_finder.candidate_finder(job)
+
+    def test_sharded_ranking_equals_single_process_ranking(self):
+        """every shard size gives the same candidates, scores and order"""
+        for job in (self.job, self.lawyer_job):  # the lawyer job has no title match, so it falls back to the union
+            expected = self.match(job)
+            for workers in (2, 3, 7):
+                with override_settings(MATCHER_SHARD_WORKERS=workers, MATCHER_SHARD_MIN_CANDIDATES=1):
+                    self.assertTrue(sharding.should_shard(len(self.candidates)))
+                    sharded = self.match(job)
+                self.assertEqual(sharded.ranked_ids().tolist(), expected.ranked_ids().tolist())
+                self.assertEqual(sorted(sharded.candidate_ids.tolist()), sorted(expected.candidate_ids.tolist()))
+                np.testing.assert_allclose(np.sort(sharded.scores), np.sort(expected.scores))
+                self.assertEqual(sharded.page(4)[0].tolist(), expected.page(4)[0].tolist())
+
+    @override_settings(MATCHER_SHARD_WORKERS=4, MATCHER_SHARD_MIN_CANDIDATES=1000)
+    def test_small_jobs_stay_in_process(self):
+        self.assertFalse(sharding.should_shard(999))
+        self.assertTrue(sharding.should_shard(1000))
+        self.assertFalse(sharding.should_shard(1000, workers=1))
+
+    @override_settings(MATCHER_SHARD_WORKERS=4, MATCHER_SHARD_MIN_CANDIDATES=1)
+    def test_threaded_processes_do_not_fork(self):
+        """jobs are matched in process by request threads and while other threads run, with the same ranking"""
+        self.assertTrue(sharding.should_shard(len(self.candidates)))
+        sharded = self.match(self.job).ranked_ids().tolist()
+        results = {}
+        thread = threading.Thread(target=lambda: results.setdefault('thread', sharding.should_shard(10 ** 6)))
+        thread.start()
+        thread.join()
+        self.assertEqual(results['thread'], False)
+
+        release = threading.Event()
+        idle = threading.Thread(target=release.wait)
+        idle.start()
+        try:
+            self.assertFalse(sharding.should_shard(len(self.candidates)))
+            self.assertEqual(self.match(self.job).ranked_ids().tolist(), sharded)
+        finally:
+            release.set()
+            idle.join()
+
+    def test_shard_bounds(self):
+        """shards cover every id once and get about the same number of ids"""
+        candidate_ids = np.array([1, 2, 3, 10, 11, 12, 50, 51, 52, 100])
+        bounds = sharding.get_shard_bounds(candidate_ids, 3)
+        self.assertEqual(bounds[0][0], 1)
+        self.assertEqual(bounds[-1][1], 101)
+        self.assertTrue(all(stop == start for (_, stop), (start, _) in zip(bounds, bounds[1:])))
+        sizes = [np.count_nonzero((candidate_ids >= start) & (candidate_ids < stop)) for start, stop in bounds]
+        self.assertEqual(sizes, [3, 3, 4])
+        self.assertEqual(sharding.get_shard_bounds(np.array([5, 6]), 8), [(5, 6), (6, 7)])
+        self.assertEqual(sharding.get_shard_bounds(np.array([], dtype=np.int64), 4), [])
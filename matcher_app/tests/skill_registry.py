@@ -0,0 +1,90 @@
+from django.test import TestCase, TransactionTestCase
+from matcher_app import importer, match_cache, match_index, skill_registry
+from matcher_app.models import Candidate, Job, Skill
+
+
+class TestSkillRegistry(TestCase):
+    def setUp(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+        self.javascript = Skill.objects.create(skill_name="Javascript")
+        self.postgres = Skill.objects.create(skill_name="Postgres")
+        self.python = Skill.objects.create(skill_name="Python")
+        self.machine_learning = Skill.objects.create(skill_name="Machine learning")
+
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+
+    def test_names_and_aliases_resolve_without_queries(self):
+        skill_registry.get_registry()
+        with self.assertNumQueries(0):
+            for name in ("Javascript", "javascript ", "JS", " js", "JavaScript"):
+                self.assertEqual(skill_registry.resolve(name), self.javascript.pk, name)
+            self.assertEqual(skill_registry.resolve("PostgreSQL"), self.postgres.pk)
+            self.assertEqual(skill_registry.resolve("machine   Learning"), self.machine_learning.pk)
+
+    def test_misses_read_the_database(self):
+        """skills created by another process are found on a miss, unknown names stay unknown"""
+        registry = skill_registry.get_registry()
+        cobol = Skill.objects.create(skill_name="Cobol")
+        registry.remove(cobol.pk)  # as if the skill was created by another process
+        with self.assertNumQueries(1):
+            self.assertEqual(skill_registry.resolve("COBOL"), cobol.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(skill_registry.resolve("cobol"), cobol.pk)
+        self.assertIsNone(skill_registry.resolve("Juggling"))
+        self.assertIsNone(skill_registry.resolve("  "))
+
+    def test_complete(self):
+        registry = skill_registry.get_registry()
+        self.assertEqual(registry.complete("p"), [(self.postgres.pk, "Postgres"), (self.python.pk, "Python")])
+        self.assertEqual(registry.complete("P", limit=1), [(self.postgres.pk, "Postgres")])
+        self.assertEqual(registry.complete("ecma"), [(self.javascript.pk, "Javascript")])
+        self.assertEqual(registry.complete("machine l"), [(self.machine_learning.pk, "Machine learning")])
+        self.assertEqual(registry.complete("z"), [])
+
+        response = self.client.get("/skills/?prefix=py&limit=5")
+        self.assertEqual(response.json(), [{"id": self.python.pk, "skill": "Python"}])
+        self.assertEqual(self.client.get("/skills/?limit=0").status_code, 400)
+
+    def test_jobs_are_matched_by_alias(self):
+        candidate = Candidate.objects.create(title="Developer")
+        candidate.skills.set([self.postgres.pk])
+        job = Job.objects.create(title="Developer", status="opened", skill="postgresql ")
+        self.assertEqual(self.client.get(f"/candidates/{job.job_id}/").json(), [candidate.candidate_id])
+
+        response = self.client.put(f"/job/{job.job_id}/skills/", content_type='application/json',
+                                   data=[{"skill": "JS"}, {"skill": "Javascript"}])
+        self.assertEqual(response.status_code, 400)
+        response = self.client.put(f"/job/{job.job_id}/skills/", content_type='application/json',
+                                   data=[{"skill": "psql"}, {"skill": "js", "required": False}])
+        self.assertEqual([entry["skill"] for entry in response.json()], ["Javascript", "Postgres"])
+
+    def test_import_resolves_aliases(self):
+        result = importer.import_candidates([("Developer", ["JS", "javascript", "Rust"]), ("Admin", ["rust "])])
+        self.assertEqual(result.skills_created, 1)
+        developer = Candidate.objects.get(title="Developer")
+        self.assertEqual(sorted(developer.skills.values_list('skill_name', flat=True)), ["Javascript", "Rust"])
+        self.assertEqual(skill_registry.resolve("RUST"), Skill.objects.get(skill_name="Rust").pk)
+
+
+class TestSkillRegistrySignals(TransactionTestCase):
+    def tearDown(self):
+        skill_registry.reset_registry()
+
+    def test_registry_follows_committed_writes(self):
+        registry = skill_registry.get_registry()
+        rust = Skill.objects.create(skill_name="Rust")
+        with self.assertNumQueries(0):
+            self.assertEqual(registry.resolve("rust"), rust.pk)
+        rust.skill_name = "Rust lang"
+        rust.save()
+        self.assertEqual(registry.lookup("rust lang"), rust.pk)
+        self.assertIsNone(registry.lookup("rust"))
+        skill_id = rust.pk
+        rust.delete()
+        self.assertIsNone(registry.lookup("rust lang"))
+        self.assertIsNone(registry.get_name(skill_id))
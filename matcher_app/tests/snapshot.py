@@ -0,0 +1,120 @@
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from matcher_app import match_index, snapshot, skill_registry
+from matcher_app.models import Candidate, CandidateChange, Skill
+from io import StringIO
+from unittest import mock
+import numpy as np
+import tempfile
+import shutil
+import json
+import os
+
+
+class TestMatchSnapshot(TestCase):
+    def setUp(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings_override = override_settings(MATCHER_SNAPSHOT_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.skills = [Skill.objects.create(skill_name=name) for name in ("Python", "Django", "Cobol")]
+        self.num_skills = max(skill.pk for skill in self.skills) + 1
+        self.candidates = []
+        for i, title in enumerate(["Software Developer", "Data Scientist", "Software Engineer", "Lawyer"]):
+            candidate = Candidate.objects.create(title=title)
+            candidate.skills.set([skill.pk for skill in self.skills[:i % 3 + 1]])
+            self.candidates.append(candidate)
+
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+
+    def assertSameIndex(self, index, expected):
+        for skill_id in range(self.num_skills + 1):
+            self.assertEqual(index.get_skill_matches(skill_id).tolist(), expected.get_skill_matches(skill_id).tolist())
+        for title in expected.titles + ["Plumber"]:
+            self.assertEqual(index.get_exact_title_matches(title).tolist(),
+                             expected.get_exact_title_matches(title).tolist())
+        candidate_ids = list(Candidate.objects.values_list('candidate_id', flat=True)) + [10 ** 6]
+        self.assertEqual([array.tolist() for array in index.get_skill_matrix(candidate_ids)],
+                         [array.tolist() for array in expected.get_skill_matrix(candidate_ids)])
+        self.assertEqual([np.asarray(value).tolist() for value in index.get_skill_statistics(self.num_skills)],
+                         [np.asarray(value).tolist() for value in expected.get_skill_statistics(self.num_skills)])
+
+    def test_workers_map_the_snapshot(self):
+        """the index is memory-mapped from the snapshot without reading the candidate tables"""
+        version = match_index.write_snapshot(self.directory)
+        with self.assertNumQueries(3):  # the changes, new candidates and their skills - nothing else
+            index = match_index.get_index()
+        self.assertEqual(index.snapshot_version, version)
+        self.assertIsInstance(index.rows.skill_ids, np.memmap)
+        self.assertSameIndex(index, match_index.CandidateIndex().build())
+
+    def test_writes_since_the_snapshot_are_replayed(self):
+        match_index.write_snapshot(self.directory)
+        newcomer = Candidate.objects.create(title="Software Developer")
+        newcomer.skills.set([self.skills[2].pk])
+        self.candidates[0].title = "Senior Software Developer"
+        self.candidates[0].save()
+        self.candidates[1].skills.remove(self.skills[0])
+        self.candidates[3].delete()
+        self.skills[1].delete()
+
+        index = match_index.get_index()
+        self.assertIsNotNone(index.snapshot_version)
+        self.assertSameIndex(index, match_index.CandidateIndex().build())
+        self.assertEqual(index.get_exact_title_matches("Software Developer").tolist(), [newcomer.candidate_id])
+
+    def test_new_snapshot_prunes_the_change_log(self):
+        out = StringIO()
+        call_command('build_match_snapshot', stdout=out)
+        Candidate.objects.create(title="Lawyer")
+        call_command('build_match_snapshot', stdout=out)
+        self.assertEqual(CandidateChange.objects.count(), 1)  # still needed by workers on the first snapshot
+        Candidate.objects.create(title="Lawyer")
+        call_command('build_match_snapshot', stdout=out)
+        self.assertEqual(CandidateChange.objects.count(), 1)
+        self.assertEqual(len([name for name in os.listdir(self.directory) if name != snapshot.CURRENT_FILE]),
+                         snapshot.KEPT_VERSIONS)
+        self.assertIn('Wrote match index snapshot', out.getvalue())
+
+    def test_snapshot_of_another_format_is_ignored(self):
+        version = match_index.write_snapshot(self.directory)
+        manifest_path = os.path.join(self.directory, version, snapshot.MANIFEST_FILE)
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+        manifest['format'] = snapshot.FORMAT_VERSION + 1
+        with open(manifest_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file)
+        index = match_index.get_index()
+        self.assertIsNone(index.snapshot_version)
+        self.assertEqual(index.num_candidates, len(self.candidates))
+
+
+class TestSnapshotConsistency(TransactionTestCase):
+    def setUp(self):
+        match_index.reset_index()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        Candidate.objects.create(title="Lawyer")
+
+    def tearDown(self):
+        match_index.reset_index()
+
+    def test_change_log_and_tables_are_read_in_one_transaction(self):
+        """the last change id and the candidates the snapshot is built from come from the same database snapshot"""
+        build = match_index.CandidateIndex.build
+        transactions = []
+
+        def build_in_transaction(index):
+            transactions.append(connection.in_atomic_block)
+            return build(index)
+
+        with mock.patch.object(match_index.CandidateIndex, 'build', build_in_transaction):
+            match_index.write_snapshot(self.directory)
+        self.assertEqual(transactions, [True])
+        self.assertFalse(connection.in_atomic_block)
@@ -0,0 +1,124 @@
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from matcher_app import candidate_finder, match_index, title_similarity, skill_registry
+from matcher_app.models import Candidate, Job
+from io import StringIO
+from unittest import mock
+import tempfile
+import shutil
+import json
+import os
+
+TITLES = ["Software Developer", "Electrical Engineer", "Lawyer", "Senior Software Engineer", "Data Analyst", "Writer"]
+
+
+class TestTitleVectors(TestCase):
+    def setUp(self):
+        self.synonyms = {"developer": "developer", "engineer": "developer", "analyst": "scientist",
+                         "scientist": "scientist"}
+        self.vectors = title_similarity.TitleVectors.train(TITLES, self.synonyms)
+
+    def test_similar_titles(self):
+        """synonyms make titles with different words similar, unrelated titles are not"""
+        titles, similarities = self.vectors.get_similar_titles("Software Engineer", 10, 0.5)
+        self.assertEqual(titles, ["Software Developer", "Senior Software Engineer"])
+        self.assertGreater(similarities[0], 0.8)
+        titles, similarities = self.vectors.get_similar_titles("Lawyer", 10, 0.3)
+        self.assertEqual(titles, ["Lawyer"])
+        self.assertAlmostEqual(similarities[0], 1.0, places=5)
+        self.assertEqual(self.vectors.get_similar_titles("Data Scientist", 1, 0.5)[0], ["Data Analyst"])
+        self.assertEqual(self.vectors.get_similar_titles("Plumber", 10, 0.1)[0], [])
+
+    def test_results_are_cached_per_title(self):
+        first = self.vectors.get_similar_titles("Software Engineer", 10, 0.5)
+        with self.assertNumQueries(0):
+            self.assertIs(self.vectors.get_similar_titles("Software Engineer", 10, 0.5)[1], first[1])
+        self.vectors.add_titles(["Software Engineer"])  # new titles drop the cached results
+        self.assertEqual(self.vectors.get_similar_titles("Software Engineer", 10, 0.5)[0][0], "Software Engineer")
+
+    def test_added_titles_are_scored_before_the_columns_are_rebuilt(self):
+        """titles added after training are found row by row, with the similarities of the rebuilt columns"""
+        self.vectors.add_titles(["Software Engineer", "Backend Developer"])
+        self.assertEqual(self.vectors.num_column_titles, len(TITLES))
+        added = [self.vectors.get_similar_titles(title, 10, 0.3) for title in ("Software Engineer", "Developer")]
+        self.assertIn("Backend Developer", added[1][0])
+        self.vectors._build_columns()
+        self.assertEqual(self.vectors.num_column_titles, len(TITLES) + 2)
+        for title, (titles, similarities) in zip(("Software Engineer", "Developer"), added):
+            rebuilt_titles, rebuilt_similarities = self.vectors.get_similar_titles(title, 10, 0.3)
+            self.assertEqual(rebuilt_titles, titles)
+            self.assertEqual(rebuilt_similarities.tolist(), similarities.tolist())
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'titles.npz')
+        self.vectors.save(path)
+        loaded = title_similarity.TitleVectors.load(path)
+        self.assertEqual(loaded.titles, self.vectors.titles)
+        self.assertEqual(loaded.synonyms, self.synonyms)
+        for title in ("Software Engineer", "Data Scientist", "Writer"):
+            loaded_titles, loaded_similarities = loaded.get_similar_titles(title, 10, 0.3)
+            titles, similarities = self.vectors.get_similar_titles(title, 10, 0.3)
+            self.assertEqual(loaded_titles, titles)
+            self.assertEqual(loaded_similarities.tolist(), similarities.tolist())
+
+
+class TestTitleSimilarityMatching(TestCase):
+    def setUp(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        title_similarity.reset_vectors()
+        self.candidates = {title: Candidate.objects.create(title=title) for title in TITLES}
+
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        title_similarity.reset_vectors()
+
+    def test_engineer_matches_developer(self):
+        """the README's "Developer" / "Engineer" case - the two words are far apart in edit distance"""
+        job = Job.objects.create(title="Software Engineer", status="opened", skill="Python")
+        developer_id = self.candidates["Software Developer"].candidate_id
+        with override_settings(MATCHER_TITLE_SIMILARITY=False):
+            candidate_ids, similarities = candidate_finder.get_matches_from_job_title(job)
+        self.assertEqual(dict(zip(candidate_ids.tolist(), similarities.tolist()))[developer_id], 0.5)
+        candidate_ids, similarities = candidate_finder.get_matches_from_job_title(job)
+        self.assertGreater(dict(zip(candidate_ids.tolist(), similarities.tolist()))[developer_id], 0.8)
+        self.assertEqual(len(set(candidate_ids.tolist())), len(candidate_ids))
+        self.assertEqual(similarities.tolist(), sorted(similarities.tolist(), reverse=True))
+
+        job = Job.objects.create(title="Attorney", status="opened", skill="Python")
+        candidate_ids, _ = candidate_finder.get_matches_from_job_title(job)
+        self.assertEqual(candidate_ids.tolist(), [self.candidates["Lawyer"].candidate_id])
+
+    def test_new_titles_are_vectorized(self):
+        index = match_index.get_index()
+        title_similarity.get_vectors(index)
+        newcomer = Candidate.objects.create(title="Backend Developer")
+        index.set_title(newcomer.candidate_id, newcomer.title)
+        candidate_ids, _ = title_similarity.get_similar_title_matches("Backend Developer", index)
+        self.assertEqual(candidate_ids[0], newcomer.candidate_id)
+
+    def test_vectors_are_trained_with_the_index(self):
+        """the thread building an index trains its vectors, requests do not"""
+        index = match_index.get_index()
+        self.assertIsNotNone(index.title_vectors)
+        with mock.patch.object(title_similarity.TitleVectors, 'train') as train:
+            self.assertIs(title_similarity.get_vectors(index), index.title_vectors)
+        train.assert_not_called()
+
+    def test_trained_vectors_are_loaded(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        synonyms_path = os.path.join(directory, 'synonyms.json')
+        with open(synonyms_path, 'w') as synonyms_file:
+            json.dump([["lawyer", "attorney"]], synonyms_file)
+        path = os.path.join(directory, 'titles.npz')
+        out = StringIO()
+        call_command('build_title_vectors', '--output', path, '--synonyms', synonyms_path, stdout=out)
+        self.assertIn(f'{len(TITLES)} titles', out.getvalue())
+
+        with override_settings(MATCHER_TITLE_VECTORS_PATH=path):
+            candidate_ids, _ = title_similarity.get_similar_title_matches("Attorney", match_index.get_index())
+        self.assertEqual(candidate_ids.tolist(), [self.candidates["Lawyer"].candidate_id])
@@ -0,0 +1,40 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from matcher_app import utils
+from matcher_app.models import Candidate, Job, Match
+
+
+class TestMatchUpsert(TestCase):
+    def setUp(self):
+        self.job = Job.objects.create(title="Software Developer", status="opened", skill="Python")
+        self.candidates = [Candidate.objects.create(title="Software Developer") for _ in range(3)]
+        self.candidate_ids = [candidate.candidate_id for candidate in self.candidates]
+
+    def test_rematching_does_not_duplicate_rows(self):
+        """matching the same candidates again only refreshes time_matched"""
+        utils.add_ranked_candidates_to_table(self.candidate_ids[:2], self.job.job_id)
+        first_matched = Match.objects.get(candidate_id=self.candidates[0]).time_matched
+        utils.add_ranked_candidates_to_table(self.candidate_ids, self.job.job_id)
+
+        self.assertEqual(Match.objects.filter(job_id=self.job).count(), 3)
+        self.assertGreater(Match.objects.get(candidate_id=self.candidates[0]).time_matched, first_matched)
+
+    def test_unknown_candidates_are_skipped(self):
+        """ids of candidates that no longer exist do not fail the insert"""
+        missing_id = max(self.candidate_ids) + 100
+        utils.add_ranked_candidates_to_table(self.candidate_ids + [missing_id], self.job.job_id)
+        self.assertEqual(sorted(Match.objects.values_list('candidate_id', flat=True)), self.candidate_ids)
+
+    def test_chunks(self):
+        """one statement is executed per chunk of candidates"""
+        chunk_size = utils.MATCH_UPSERT_CHUNK_SIZE
+        utils.MATCH_UPSERT_CHUNK_SIZE = 2
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                utils.add_ranked_candidates_to_table(self.candidate_ids, self.job.job_id)
+        finally:
+            utils.MATCH_UPSERT_CHUNK_SIZE = chunk_size
+        upserts = [query for query in queries if query['sql'].startswith('INSERT INTO "matcher_app_match"')]
+        self.assertEqual(len(upserts), 2)
+        self.assertEqual(Match.objects.count(), 3)
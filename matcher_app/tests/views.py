@@ -1,5 +1,7 @@
 from django.test import TestCase
-from matcher_app.models import Note, Job, Skill, Candidate
+from matcher_app import match_cache, match_index, skill_registry
+from matcher_app.models import Note, Job, Skill, Candidate, Like
+import json
 
 
 class TestNote(TestCase):
@@ -34,3 +36,77 @@ class TestNote(TestCase):
         opinion_data = {"job_id": job.job_id, "candidate_id": candidate.candidate_id, "is_liked": True}
         request = self.client.post("/candidate/opinion/", data=opinion_data, content_type='application/json')
         self.assertEqual(request.status_code, 200)
+
+
+class TestCandidatePagination(TestCase):
+    def setUp(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+        self.job = Job.objects.create(title="Software Developer", status="opened", skill="Python")
+        skill = Skill.objects.create(skill_name="Python")
+        for _ in range(5):
+            candidate = Candidate.objects.create(title="Software Developer")
+            candidate.skills.set([skill.pk])
+
+    def tearDown(self):
+        match_index.reset_index()
+        skill_registry.reset_registry()
+        match_cache.reset_cache()
+
+    def test_cursor_pagination(self):
+        """following next_cursor returns the same candidates as the full list"""
+        url = f"/candidates/{self.job.job_id}/"
+        all_candidates = self.client.get(url).json()
+        page = self.client.get(url, {"limit": 2}).json()
+        paged_candidates = page["results"]
+        while page["next_cursor"]:
+            page = self.client.get(url, {"limit": 2, "cursor": page["next_cursor"]}).json()
+            paged_candidates += page["results"]
+        self.assertEqual(paged_candidates, all_candidates)
+        self.assertEqual(self.client.get(url, {"cursor": "nonsense"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"limit": 0}).status_code, 400)
+
+    def test_streaming(self):
+        """the streamed response holds the full list"""
+        url = f"/candidates/{self.job.job_id}/"
+        response = self.client.get(url, {"stream": "true"})
+        self.assertEqual(json.loads(b"".join(response.streaming_content)), self.client.get(url).json())
+
+
+class TestLikedCandidates(TestCase):
+    def setUp(self):
+        self.job = Job.objects.create(title="Software Developer", status="opened", skill="Python")
+        self.other_job = Job.objects.create(title="Software Engineer", status="opened", skill="Python")
+        self.candidates = [Candidate.objects.create(title="Software Developer") for _ in range(5)]
+        for candidate in self.candidates:
+            Like.objects.create(candidate_id=candidate, job_id=self.job)
+        Note.objects.create(candidate_id=self.candidates[0], job_id=self.job, note="first")
+        Note.objects.create(candidate_id=self.candidates[0], job_id=self.job, note="second")
+        Note.objects.create(candidate_id=self.candidates[1], job_id=self.other_job, note="other job")
+
+    def test_notes_are_attached_to_their_candidate(self):
+        """each liked candidate gets the notes written for them for this job only"""
+        response = self.client.get(f"/candidates/liked/{self.job.job_id}/").json()
+        notes = {row["candidate_id"]: row["notes"] for row in response}
+        self.assertEqual(notes[self.candidates[0].candidate_id], ["first", "second"])
+        self.assertEqual(notes[self.candidates[1].candidate_id], [])
+        self.assertEqual(len(response), 5)
+
+    def test_latest_note_is_kept_as_note(self):
+        """clients reading the single note field still get one"""
+        response = self.client.get(f"/candidates/liked/{self.job.job_id}/").json()
+        rows = {row["candidate_id"]: row for row in response}
+        self.assertEqual(rows[self.candidates[0].candidate_id]["note"], "second")
+        self.assertNotIn("note", rows[self.candidates[1].candidate_id])
+
+    def test_constant_number_of_queries(self):
+        """the number of queries does not depend on the number of likes"""
+        with self.assertNumQueries(4):  # ETag versions, job, notes, likes
+            self.client.get(f"/candidates/liked/{self.job.job_id}/")
+
+    def test_streaming(self):
+        """the streamed response holds the full list"""
+        url = f"/candidates/liked/{self.job.job_id}/"
+        response = self.client.get(url, {"stream": "true"})
+        self.assertEqual(json.loads(b"".join(response.streaming_content)), self.client.get(url).json())
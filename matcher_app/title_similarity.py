@@ -0,0 +1,292 @@
+"""
+Title similarity by meaning rather than spelling - "Software Engineer" is close to "Software Developer" although
+the Levenshtein distance between engineer and developer is large.
+
+Every distinct candidate title is turned into a TF-IDF vector over two blocks of features:
+    * words and word bigrams, after mapping every word to the first word of its synonym group - the synonym table
+      (MATCHER_TITLE_SYNONYMS_PATH, a JSON list of word groups) is meant to be edited
+    * character trigrams of the words, which still catch typos and shared word stems ("analyst" / "analytics")
+Each block is normalized on its own and weighted so the cosine similarity of two titles is
+WORD_SHARE x word similarity + (1 - WORD_SHARE) x character similarity.
+
+The normalized vectors form a sparse title x feature matrix stored column-wise, so the titles similar to a job title
+are one sparse matrix-vector product (a bincount over the columns of the job title's features) and a top k. The
+vectors can be trained offline with `manage.py build_title_vectors` into MATCHER_TITLE_VECTORS_PATH, which workers
+load instead of training them over the titles of their candidate index - in the thread that builds the index, so
+they are swapped in with it. Titles that appeared after training are vectorized with the trained vocabulary and scored
+row by row until enough of them are added to rebuild the columns. Results are cached per job title, since many jobs
+share a title.
+"""
+from matcher_app import match_index
+from collections import OrderedDict
+from django.conf import settings
+from django.dispatch import receiver
+import numpy as np
+import threading
+import logging
+import json
+import time
+
+logger = logging.getLogger(__name__)
+
+NGRAM_SIZE = 3
+WORD_SHARE = 0.7  # weight of the word block in the similarity, the character block gets the rest
+CACHE_SIZE = 1024  # job titles whose similar titles are cached
+COLUMN_BATCH = 256  # titles added since the columns were built that are scored row by row before rebuilding them
+WORD_PREFIX = 'w '
+BIGRAM_PREFIX = 'b '
+NGRAM_PREFIX = 'c '
+
+
+def load_synonyms(path=None):
+    """{word: canonical word} read from a JSON list of synonym groups - the first word of a group is canonical"""
+    path = path or settings.MATCHER_TITLE_SYNONYMS_PATH
+    if not path:
+        return {}
+    with open(path) as synonyms_file:
+        groups = json.load(synonyms_file)
+    return {word.lower(): group[0].lower() for group in groups for word in group}
+
+
+def get_title_features(title, synonyms):
+    """{feature: count} of a title - see the module docstring"""
+    words = match_index.tokenize_title(title)
+    canonical_words = [synonyms.get(word, word) for word in words]
+    features = [WORD_PREFIX + word for word in canonical_words]
+    features += [f'{BIGRAM_PREFIX}{first} {second}' for first, second in zip(canonical_words, canonical_words[1:])]
+    for word in words:
+        padded = f' {word} '
+        features += [NGRAM_PREFIX + padded[i:i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)]
+    counts = {}
+    for feature in features:
+        counts[feature] = counts.get(feature, 0) + 1
+    return counts
+
+
+class TitleVectors:
+    """normalized TF-IDF vectors of titles - see the module docstring"""
+
+    def __init__(self, features, idf, synonyms):
+        self.features = list(features)
+        self.feature_ids = {feature: i for i, feature in enumerate(self.features)}
+        self.is_word_feature = np.array([not feature.startswith(NGRAM_PREFIX) for feature in self.features],
+                                        dtype=bool)
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.synonyms = synonyms
+        self.titles = []
+        self.title_rows = {}
+        # title x feature matrix as CSR rows, and the same as columns for the similarity product
+        self.row_indptr = np.zeros(1, dtype=np.int64)
+        self.row_features = np.zeros(0, dtype=np.int32)
+        self.row_values = np.zeros(0, dtype=np.float32)
+        self.column_indptr = np.zeros(len(self.features) + 1, dtype=np.int64)
+        self.column_rows = np.zeros(0, dtype=np.int32)
+        self.column_values = np.zeros(0, dtype=np.float32)
+        self.num_column_titles = 0  # the titles in the columns, the ones added later are scored row by row
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()  # job title -> (title rows, similarities), least recently used first
+
+    @classmethod
+    def train(cls, titles, synonyms):
+        """vocabulary and IDF weights (log((1 + N) / (1 + df)) + 1) over the given distinct titles"""
+        titles = sorted(set(titles))
+        title_features = [get_title_features(title, synonyms) for title in titles]
+        document_frequency = {}
+        for features in title_features:
+            for feature in features:
+                document_frequency[feature] = document_frequency.get(feature, 0) + 1
+        features = sorted(document_frequency)
+        frequencies = np.array([document_frequency[feature] for feature in features], dtype=np.float64)
+        vectors = cls(features, np.log((1.0 + len(titles)) / (1.0 + frequencies)) + 1.0, synonyms)
+        vectors.add_titles(titles)
+        vectors._build_columns()
+        return vectors
+
+    def vectorize(self, title):
+        """(feature ids, values) of the normalized vector of a title - features unknown to the vocabulary are left out"""
+        counts = self.get_known_features(title)
+        feature_ids = np.array(sorted(counts), dtype=np.int32)
+        tf = np.array([counts[feature_id] for feature_id in feature_ids], dtype=np.float64)
+        values = (1.0 + np.log(tf)) * self.idf[feature_ids] if len(feature_ids) else np.zeros(0)
+        is_word = self.is_word_feature[feature_ids]
+        for block, share in ((is_word, WORD_SHARE), (~is_word, 1.0 - WORD_SHARE)):
+            norm = np.sqrt(np.sum(values[block] ** 2))
+            if norm:
+                values[block] *= np.sqrt(share) / norm
+        return feature_ids, values.astype(np.float32)
+
+    def get_similarity(self, title, other_title):
+        """similarity of two titles - the one get_similar_titles ranks by"""
+        feature_ids, values = self.vectorize(title)
+        other_ids, other_values = self.vectorize(other_title)
+        _, positions, other_positions = np.intersect1d(feature_ids, other_ids, assume_unique=True,
+                                                       return_indices=True)
+        return min(float(np.dot(values[positions], other_values[other_positions])), 1.0)
+
+    def get_known_features(self, title):
+        """{feature id: count} of the features of a title that are in the vocabulary"""
+        counts = {}
+        for feature, count in get_title_features(title, self.synonyms).items():
+            feature_id = self.feature_ids.get(feature)
+            if feature_id is not None:
+                counts[feature_id] = count
+        return counts
+
+    def add_titles(self, titles):
+        """vectorize the titles that have no vector yet - the columns are only rebuilt once the titles added since they
+        were built outnumber COLUMN_BATCH and an eighth of the titles in them"""
+        new_titles = [title for title in dict.fromkeys(titles) if title not in self.title_rows]
+        if not new_titles:
+            return
+        vectors = [self.vectorize(title) for title in new_titles]
+        lengths = [len(feature_ids) for feature_ids, _ in vectors]
+        self.row_indptr = np.concatenate((self.row_indptr, self.row_indptr[-1] + np.cumsum(lengths)))
+        self.row_features = np.concatenate([self.row_features] + [feature_ids for feature_ids, _ in vectors])
+        self.row_values = np.concatenate([self.row_values] + [values for _, values in vectors])
+        for title in new_titles:
+            self.title_rows[title] = len(self.titles)
+            self.titles.append(title)
+        self.cache.clear()
+        if len(self.titles) - self.num_column_titles > max(COLUMN_BATCH, self.num_column_titles // 8):
+            self._build_columns()
+
+    def _build_columns(self):
+        rows = np.repeat(np.arange(len(self.titles), dtype=np.int32), np.diff(self.row_indptr))
+        order = np.argsort(self.row_features, kind='stable')
+        self.column_rows, self.column_values = rows[order], self.row_values[order]
+        self.column_indptr = np.concatenate(([0], np.cumsum(np.bincount(self.row_features,
+                                                                         minlength=len(self.features)))))
+        self.num_column_titles = len(self.titles)
+        self.cache.clear()
+
+    def get_similar_titles(self, title, k, min_similarity):
+        """(titles, similarities) of the k titles most similar to title with at least min_similarity, best first"""
+        key = (title, k, min_similarity)
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached is None:
+                cached = self._compute_similar_titles(title, k, min_similarity)
+                self.cache[key] = cached
+                while len(self.cache) > CACHE_SIZE:
+                    self.cache.popitem(last=False)
+            self.cache.move_to_end(key)
+        rows, similarities = cached
+        return [self.titles[row] for row in rows], similarities
+
+    def _compute_similar_titles(self, title, k, min_similarity):
+        feature_ids, values = self.vectorize(title)
+        starts, ends = self.column_indptr[feature_ids], self.column_indptr[feature_ids + 1]
+        lengths = ends - starts
+        positions = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths - starts, lengths)
+        similarities = np.bincount(self.column_rows[positions], minlength=len(self.titles),
+                                   weights=self.column_values[positions] * np.repeat(values, lengths))
+        if self.num_column_titles < len(self.titles) and len(feature_ids):
+            start = self.row_indptr[self.num_column_titles]
+            row_features, row_values = self.row_features[start:], self.row_values[start:]
+            rows = np.repeat(np.arange(self.num_column_titles, len(self.titles)),
+                             np.diff(self.row_indptr[self.num_column_titles:]))
+            found = np.minimum(np.searchsorted(feature_ids, row_features), len(feature_ids) - 1)
+            shared = feature_ids[found] == row_features
+            similarities += np.bincount(rows[shared], minlength=len(self.titles),
+                                        weights=row_values[shared] * values[found[shared]])
+        rows = np.flatnonzero((similarities >= min_similarity) & (similarities > 0))
+        rows = rows[np.lexsort((rows, -similarities[rows]))][:k]
+        return rows, np.minimum(similarities[rows], 1.0)
+
+    def save(self, path):
+        """write the vocabulary and the title vectors to a .npz file"""
+        words = sorted(self.synonyms)
+        with open(path, 'wb') as output:
+            np.savez_compressed(output, features=np.array(self.features), idf=self.idf, titles=np.array(self.titles),
+                                row_indptr=self.row_indptr, row_features=self.row_features,
+                                row_values=self.row_values, synonym_words=np.array(words),
+                                synonym_canonicals=np.array([self.synonyms[word] for word in words]))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            synonyms = dict(zip(data['synonym_words'].tolist(), data['synonym_canonicals'].tolist()))
+            vectors = cls(data['features'].tolist(), data['idf'], synonyms)
+            titles = data['titles'].tolist()
+            row_indptr, row_features, row_values = data['row_indptr'], data['row_features'], data['row_values']
+        vectors.title_rows = {title: row for row, title in enumerate(titles)}
+        vectors.titles = titles
+        vectors.row_indptr, vectors.row_features, vectors.row_values = row_indptr, row_features, row_values
+        vectors._build_columns()
+        return vectors
+
+
+_vectors = None  # loaded from MATCHER_TITLE_VECTORS_PATH, shared by every index
+_vectors_lock = threading.Lock()  # held while vectors are loaded, or trained for an index that has none
+
+
+def _create_vectors(index):
+    """the vectors loaded from MATCHER_TITLE_VECTORS_PATH when set, trained over the index titles otherwise"""
+    global _vectors
+    started = time.monotonic()
+    path = settings.MATCHER_TITLE_VECTORS_PATH
+    if path is not None:
+        if _vectors is None:
+            _vectors = TitleVectors.load(path)
+            logger.info(f'Loaded vectors of {len(_vectors.titles)} titles in {time.monotonic() - started:.2f}s')
+        index.num_vectorized_titles = 0
+        return _vectors
+    with index.lock:
+        titles = list(index.titles)
+    vectors = TitleVectors.train(titles, load_synonyms())
+    index.num_vectorized_titles = len(titles)
+    logger.info(f'Trained vectors of {len(vectors.titles)} titles in {time.monotonic() - started:.2f}s')
+    return vectors
+
+
+def get_vectors(index):
+    """return the title vectors covering every title of the given candidate index
+
+    they are prepared by the thread that built the index (see prepare_vectors), or on first use for an index built
+    otherwise - loaded from MATCHER_TITLE_VECTORS_PATH when set, trained over the index titles when not
+    """
+    vectors = index.title_vectors
+    if vectors is None:
+        with _vectors_lock:
+            if index.title_vectors is None:
+                index.title_vectors = _create_vectors(index)
+            vectors = index.title_vectors
+    if index.num_vectorized_titles < len(index.titles):
+        with vectors.lock:
+            with index.lock:
+                titles = index.titles[index.num_vectorized_titles:]
+            vectors.add_titles(titles)
+            index.num_vectorized_titles += len(titles)
+    return vectors
+
+
+@receiver(match_index.index_built)
+def prepare_vectors(sender, index, **kwargs):
+    """train the vectors of a new index in the thread building it, so they are swapped in with the index - requests
+    keep using the vectors of the current index meanwhile"""
+    if settings.MATCHER_TITLE_SIMILARITY:
+        get_vectors(index)
+
+
+def get_loaded_vectors():
+    """the title vectors of the loaded index if they were prepared, without preparing them"""
+    index = match_index.get_loaded_index()
+    return index.title_vectors if index is not None else None
+
+
+def reset_vectors():
+    """drop the vectors loaded from MATCHER_TITLE_VECTORS_PATH (used by tests)"""
+    global _vectors
+    _vectors = None
+
+
+def get_similar_title_matches(title, index, k=None, min_similarity=None):
+    """ids of candidates whose title is similar in meaning to the given title, and their similarity"""
+    k = k or settings.MATCHER_TITLE_SIMILARITY_TOP_K
+    if min_similarity is None:
+        min_similarity = settings.MATCHER_TITLE_MIN_SIMILARITY
+    titles, similarities = get_vectors(index).get_similar_titles(title, k, min_similarity)
+    members = [index.get_exact_title_matches(similar_title) for similar_title in titles]
+    if not members:
+        return match_index.EMPTY_IDS, np.empty(0)
+    return np.concatenate(members), np.repeat(similarities, [len(ids) for ids in members])
@@ -1,12 +1,23 @@
+from django.conf import settings
 from django.urls import path
-from matcher_app import views
+from matcher_app import views, async_views
+
+# the read endpoints are served by their async variants under ASGI (see matcher/asgi.py)
+read_views = async_views if settings.MATCHER_ASYNC_VIEWS else views
 
 urlpatterns = [
-    path('candidates/<int:job_id>/', views.get_all_candidates_for_job),
+    path('candidates/<int:job_id>/', read_views.get_all_candidates_for_job),
+    path('candidates/batch/', views.get_candidates_for_jobs),
     path('candidate/opinion/', views.add_opinion_for_candidate),
+    path('candidate/opinions/', views.add_opinions_for_candidates),
     path('candidate/note/', views.add_note_for_liked_candidate),
-    path('candidates/liked/<int:job_id>/', views.get_data_for_liked_candidates),
-    path('job/', views.handle_given_job),
-    path('job/<int:job_id>/', views.handle_given_job),
+    path('candidates/liked/<int:job_id>/', read_views.get_data_for_liked_candidates),
+    path('job/', read_views.handle_given_job),
+    path('job/<int:job_id>/', read_views.handle_given_job),
+    path('job/<int:job_id>/skills/', views.handle_job_skills),
+    path('jobs/stats/', views.get_stats_for_jobs),
+    path('skills/', views.search_skills),
+    path('matches/cache/', views.get_match_cache_stats),
+    path('metrics/', views.get_metrics),
 
 ]
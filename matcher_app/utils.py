@@ -1,31 +1,130 @@
-from matcher_app import models, serializers
+from matcher_app import models, job_stats, versions
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import serializers as rest_serializers
+from rest_framework.utils.encoders import JSONEncoder
+from itertools import islice
 import logging
+import base64
+import json
 
 logger = logging.getLogger(__name__)
 
+MATCH_UPSERT_CHUNK_SIZE = 1000
 
-def add_ranked_candidates_to_table(ranked_candidates, job_id):
-    res_list = [{"candidate_id": candidate.candidate_id, "job_id": job_id} for candidate in ranked_candidates]
-    match_serializer = serializers.MatchSerializer(data=res_list, many=True)
-    if match_serializer.is_valid(raise_exception=True):
-        logger.info(f"Adding new matched candidates to table...")
-        match_serializer.save()
-
-
-def get_notes_for_liked_candidates(liked_candidates):
-    """get all notes for each liked candidate for a particular job"""
-    candidate_num = 1
-    notes_dict = {}  # used for tracking notes for all candidates
-    for idx, candidate in enumerate(liked_candidates):
-        try:
-            # account for candidate who has received multiple likes but has not received the same number of notes
-            candidate_notes = models.Note.objects.filter(candidate_id_id=candidate['candidate_id'],
-                                                         job_id_id=candidate['job_id'])
-            for candidate_note in candidate_notes:
-                notes_dict[candidate_note.id] = candidate_note.note
-            if candidate_num in notes_dict:  # if given candidate has received a note
-                liked_candidates[idx]['note'] = notes_dict[candidate_num]
-        except Exception as e:
-            logger.error(f"Error querying note for candidate: {e}")
-        candidate_num += 1
-    return liked_candidates
+
+def _build_match_upsert(num_candidates):
+    """INSERT .. ON CONFLICT statement adding matches for num_candidates candidates of a single job
+
+    Candidates are selected from the candidate table, so ids of candidates that no longer exist are skipped
+    instead of failing the whole statement. Existing matches only get their time_matched refreshed.
+    """
+    quote = connection.ops.quote_name
+    match_meta, candidate_meta = models.Match._meta, models.Candidate._meta
+    candidate_column = quote(match_meta.get_field('candidate_id').column)
+    job_column = quote(match_meta.get_field('job_id').column)
+    time_column = quote(match_meta.get_field('time_matched').column)
+    candidate_pk = quote(candidate_meta.pk.column)
+    placeholders = ', '.join(['%s'] * num_candidates)
+    return (f'INSERT INTO {quote(match_meta.db_table)} ({candidate_column}, {job_column}, {time_column}) '
+            f'SELECT {candidate_pk}, %s, %s FROM {quote(candidate_meta.db_table)} '
+            f'WHERE {candidate_pk} IN ({placeholders}) '
+            f'ON CONFLICT ({job_column}, {candidate_column}) DO UPDATE SET {time_column} = excluded.{time_column}')
+
+
+def add_ranked_candidates_to_table(ranked_candidates, job_id, time_matched=None):
+    """save the matched candidates for the job - one upsert statement per chunk of candidates
+
+    time_matched defaults to now
+    """
+    candidate_ids = [int(candidate_id) for candidate_id in ranked_candidates]
+    time_matched = connection.ops.adapt_datetimefield_value(time_matched or timezone.now())
+    logger.info(f"Adding {len(candidate_ids)} matched candidates for job {job_id} to table...")
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(candidate_ids), MATCH_UPSERT_CHUNK_SIZE):
+            chunk = candidate_ids[start:start + MATCH_UPSERT_CHUNK_SIZE]
+            cursor.execute(_build_match_upsert(len(chunk)), [int(job_id), time_matched] + chunk)
+        job_stats.set_num_matches(job_id)
+        versions.bump_on_commit(versions.matches_key(job_id))
+
+
+def get_notes_per_candidate(job_id):
+    """{candidate id: notes written for the candidate for the job, oldest first} - a single query"""
+    notes = models.Note.objects.filter(job_id_id=job_id).order_by('id').values_list('candidate_id_id', 'note')
+    notes_per_candidate = {}
+    for candidate_id, note in notes:
+        notes_per_candidate.setdefault(candidate_id, []).append(note)
+    return notes_per_candidate
+
+
+def get_likes(job_id):
+    """(candidate id, time liked) of all likes for the job, newest first"""
+    return models.Like.objects.filter(job_id_id=job_id).values_list('candidate_id_id', 'time_liked')
+
+
+def attach_notes(job_id, likes, notes_per_candidate):
+    """yield one dict per (candidate id, time liked) like, with the notes written for the liked candidate
+
+    the latest note is also given as note, which clients of the single note responses read (left out when the
+    candidate has no notes, as before)
+    """
+    time_field = rest_serializers.DateTimeField()
+    for candidate_id, time_liked in likes:
+        liked_candidate = {"candidate_id": candidate_id, "time_liked": time_field.to_representation(time_liked),
+                           "job_id": job_id, "notes": notes_per_candidate.get(candidate_id, [])}
+        if liked_candidate["notes"]:
+            liked_candidate["note"] = liked_candidate["notes"][-1]
+        yield liked_candidate
+
+
+def get_liked_candidates_with_notes(job_id):
+    """all likes for a particular job (newest first), each with the notes written for the liked candidate
+
+    Runs two queries however many likes and notes the job has: the notes of the job are grouped per candidate in
+    one pass, then attached to the likes while they are read. Yields one dict per like.
+    """
+    yield from attach_notes(job_id, get_likes(job_id).iterator(), get_notes_per_candidate(job_id))
+
+
+def parse_page_size(limit):
+    """validated page size from the limit query parameter (MATCHER_PAGE_SIZE if not given)"""
+    if limit is None:
+        return settings.MATCHER_PAGE_SIZE
+    if not limit.isdigit() or not 0 < int(limit) <= settings.MATCHER_MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be a number between 1 and {settings.MATCHER_MAX_PAGE_SIZE}')
+    return int(limit)
+
+
+def encode_cursor(position):
+    """opaque cursor for a (score, candidate id) position - None stays None"""
+    if position is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """(score, candidate id) position from a cursor created by encode_cursor - None stays None"""
+    if cursor is None:
+        return None
+    try:
+        score, candidate_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(score), int(candidate_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+
+def stream_json_list(items, chunk_size=1000):
+    """streaming response with a JSON list of items (any iterable), encoded chunk by chunk instead of all at once"""
+    def generate_chunks():
+        items_iter = iter(items)
+        separator = '['
+        chunk = list(islice(items_iter, chunk_size))
+        while chunk:
+            yield separator + json.dumps(chunk, cls=JSONEncoder)[1:-1]
+            separator = ','
+            chunk = list(islice(items_iter, chunk_size))
+        yield '[]' if separator == '[' else ']'
+
+    return StreamingHttpResponse(generate_chunks(), content_type='application/json')
@@ -0,0 +1,85 @@
+"""
+Change counters behind the ETags of the read endpoints, so polling clients get `304 Not Modified` after one primary
+key lookup instead of a recomputed and serialized body.
+
+Counters are rows of the Version table, shared by every worker and kept across restarts:
+    * job:<job id> - bumped when the job (title / skill / status) or its skills change, and on every like, dislike
+      and note of the job
+    * matches:<job id> - bumped when matches of the job are written to the Match table
+    * candidates:<job id> - bumped when a candidate write may change the matches of the job (a candidate matching its
+      title, or gaining or losing one of its skills)
+    * candidates - bumped when candidates change in bulk (imports), or when the jobs a candidate write affects are
+      not known
+
+Bumps run once the surrounding transaction commits (see matcher_app.signals), so they never hold a lock on a
+counter while the write is in flight. A missing row counts as 0, and jobs that do not exist have no ETag.
+"""
+from matcher_app import models
+from django.db import transaction
+from django.db.models import F, Subquery
+
+CANDIDATES = 'candidates'
+
+
+def job_key(job_id):
+    return f'job:{job_id}'
+
+
+def matches_key(job_id):
+    return f'matches:{job_id}'
+
+
+def candidates_key(job_id):
+    return f'candidates:{job_id}'
+
+
+def bump(*keys):
+    """increment the given counters"""
+    keys = sorted(set(keys))
+    if models.Version.objects.filter(key__in=keys).update(value=F('value') + 1) < len(keys):
+        # some counters have no row yet - create them and increment again (incrementing a counter twice is harmless,
+        # losing an increment to a concurrent insert is not)
+        models.Version.objects.bulk_create([models.Version(key=key) for key in keys], ignore_conflicts=True)
+        models.Version.objects.filter(key__in=keys).update(value=F('value') + 1)
+
+
+def bump_on_commit(*keys):
+    """increment the given counters once the surrounding transaction commits"""
+    transaction.on_commit(lambda: bump(*keys))
+
+
+def _format_etag(values):
+    return 'W/"{}"'.format('.'.join(str(value or 0) for value in values))
+
+
+def get_etag(*keys):
+    """weak ETag made of the current values of the given counters - one query"""
+    values = dict(models.Version.objects.filter(key__in=keys).values_list('key', 'value'))
+    return _format_etag(values.get(key) for key in keys)
+
+
+def get_job_etag(job_id, *keys):
+    """like get_etag, or None if the job does not exist (so conditional requests fall through to the 404) - the job
+    and the counters are read in one query"""
+    counters = {f'version_{i}': Subquery(models.Version.objects.filter(key=key).values('value')[:1])
+                for i, key in enumerate(keys)}
+    for values in models.Job.objects.filter(job_id=job_id).annotate(**counters).values_list(*counters):
+        return _format_etag(values)
+    return None
+
+
+def candidates_etag(request, job_id):
+    """ETag of the candidates of a job"""
+    return get_job_etag(job_id, job_key(job_id), candidates_key(job_id), CANDIDATES)
+
+
+def liked_candidates_etag(request, job_id):
+    """ETag of the liked candidates of a job and their notes"""
+    return get_job_etag(job_id, job_key(job_id))
+
+
+def job_stats_etag(request, job_id=None):
+    """ETag of the stats of a job"""
+    if job_id is None:
+        return None
+    return get_job_etag(job_id, job_key(job_id), matches_key(job_id))
@@ -2,17 +2,30 @@ from rest_framework.response import Response
 from rest_framework.decorators import api_view
 from rest_framework import status
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 from django.shortcuts import get_object_or_404
-from matcher_app import models, serializers, utils, candidate_finder
+from django.http import HttpResponse
+from django.conf import settings
+from django.db import transaction
+from matcher_app import models, serializers, utils, candidate_finder, match_cache, signals, batch, job_stats, \
+    opinions, metrics, match_writer, versions, skill_registry, routers
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+@metrics.query_budget(17)
 @csrf_exempt
+@condition(etag_func=versions.candidates_etag)
 @api_view(['GET'])
 def get_all_candidates_for_job(request, job_id):
-    """returns list of all matching candidate ids for given job"""
+    """returns list of all matching candidate ids for given job, best candidates first
+
+    optional query parameters:
+        limit / cursor - return one page of candidates as {"results": [...], "next_cursor": ...}, where the
+            next_cursor is passed as the cursor of the following request (it is null on the last page)
+        stream - stream the full list instead of building the whole response in memory
+    """
     if request.method == 'GET':
         job_obj = get_object_or_404(models.Job.objects, job_id=job_id)
         is_closed = job_obj.status == 'closed'
@@ -20,12 +33,42 @@ def get_all_candidates_for_job(request, job_id):
             return Response([], status=status.HTTP_204_NO_CONTENT)
 
         # calls candidate_finder function - checks for valid matches, and adds the matches to the Match table
-        all_candidates_query_set = candidate_finder.candidate_finder(job_obj)
-        all_candidate_ids = [candidate.candidate_id for candidate in all_candidates_query_set]
-        logger.info(f'Number of candidates for job {job_id}: {len(all_candidate_ids)}')
-        return Response(all_candidate_ids, status=status.HTTP_200_OK)
+        # (skipped when nothing changed since the matches were last computed for the job)
+        ranked_candidates = match_cache.get_cache().get_or_compute(job_obj, candidate_finder.candidate_finder)
+        logger.info(f'Number of candidates for job {job_id}: {len(ranked_candidates)}')
+        if 'stream' in request.query_params:
+            return utils.stream_json_list(ranked_candidates.ranked_ids().tolist())
+
+        if 'limit' in request.query_params or 'cursor' in request.query_params:
+            try:
+                limit = utils.parse_page_size(request.query_params.get('limit'))
+                after = utils.decode_cursor(request.query_params.get('cursor'))
+            except ValueError as e:
+                return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+            page_ids, next_position = ranked_candidates.page(limit, after)
+            return Response({"results": page_ids.tolist(), "next_cursor": utils.encode_cursor(next_position)},
+                            status=status.HTTP_200_OK)
+
+        return Response(ranked_candidates.ranked_ids().tolist(), status=status.HTTP_200_OK)
 
 
+@metrics.query_budget(26)
+@csrf_exempt
+@api_view(['POST'])
+def get_candidates_for_jobs(request):
+    """returns lists of matching candidate ids for many jobs at once - job ids are given in the request body"""
+    if request.method == 'POST':
+        job_ids = request.data.get('job_ids')
+        if not isinstance(job_ids, list) or not all(isinstance(job_id, int) for job_id in job_ids):
+            return Response('job_ids must be a list of job ids', status=status.HTTP_400_BAD_REQUEST)
+
+        results, missing_job_ids = batch.match_jobs(job_ids, workers=settings.MATCHER_BATCH_WORKERS)
+        logger.info(f'Matched candidates for {len(results)} jobs')
+        results = {job_id: ranked_candidates.ranked_ids().tolist() for job_id, ranked_candidates in results.items()}
+        return Response({"results": results, "missing_job_ids": missing_job_ids}, status=status.HTTP_200_OK)
+
+
+@metrics.query_budget(10)
 @csrf_exempt
 @api_view(['POST'])
 def add_opinion_for_candidate(request):
@@ -44,36 +87,61 @@ def add_opinion_for_candidate(request):
             like_serializer = serializers.LikeSerializer(data=opinion_data)
             if like_serializer.is_valid(raise_exception=True):
                 logger.info(f"Creating new like...")
-                like_serializer.save()
+                with transaction.atomic():  # the job's counters are updated in the same transaction
+                    like_serializer.save()
                 return Response('Like added', status=status.HTTP_200_OK)
 
         else:  # add to dislike table
             dislike_serializer = serializers.DislikeSerializer(data=opinion_data)
             if dislike_serializer.is_valid(raise_exception=True):
                 logger.info(f"Creating new dislike...")
-                dislike_serializer.save()
+                with transaction.atomic():
+                    dislike_serializer.save()
                 return Response('Dislike added', status=status.HTTP_200_OK)
 
 
+@metrics.query_budget(12)
+@csrf_exempt
+@api_view(['POST'])
+def add_opinions_for_candidates(request):
+    """provide many opinions at once - the request body is a list of {candidate_id, job_id, is_liked} entries
+
+    returns the result of every entry in the given order - invalid entries are reported and the rest are saved
+    """
+    if request.method == 'POST':
+        entries = request.data
+        if not isinstance(entries, list):
+            return Response('Request body must be a list of opinions', status=status.HTTP_400_BAD_REQUEST)
+        results = opinions.add_opinions(entries)
+        return Response({"results": results, "created": sum(result["created"] for result in results)},
+                        status=status.HTTP_200_OK)
+
+
+@metrics.query_budget(4)
+@routers.replica_reads
 @csrf_exempt
+@condition(etag_func=versions.liked_candidates_etag)
 @api_view(['GET'])
 def get_data_for_liked_candidates(request, job_id):
-    """retrieve all data associated with liked candidates for a given job (order desc by time)"""
+    """retrieve all data associated with liked candidates for a given job (order desc by time)
+
+    add the stream query parameter to stream the list instead of building the whole response in memory
+    """
     if request.method == 'GET':
         job_obj = get_object_or_404(models.Job.objects, job_id=job_id)
         is_closed = job_obj.status == 'closed'
         if is_closed:  # do not return any candidates if given job is closed
             return Response([], status=status.HTTP_204_NO_CONTENT)
 
-        liked_candidates = models.Like.objects.filter(job_id_id=job_id)
-        serializer = serializers.LikeSerializer(liked_candidates, many=True)
-        data_list = list(serializer.data)
-        # add any notes that exist for liked candidates
-        all_results = utils.get_notes_for_liked_candidates(data_list)
-        # could return duplicate candidates if a given candidate has received multiple notes for same job
-        return Response(all_results, status=status.HTTP_200_OK)
+        # every like comes with the notes written for the liked candidate (candidates liked more than once are
+        # returned once per like)
+        liked_candidates = utils.get_liked_candidates_with_notes(job_id)
+        if 'stream' in request.query_params:
+            return utils.stream_json_list(liked_candidates)
+        return Response(list(liked_candidates), status=status.HTTP_200_OK)
 
 
+@metrics.query_budget(11)
 @csrf_exempt
 @api_view(['POST'])
 def add_note_for_liked_candidate(request):
@@ -93,11 +161,15 @@ def add_note_for_liked_candidate(request):
             serializer = serializers.NoteSerializer(data=note_data)
             if serializer.is_valid(raise_exception=True):
                 logger.info(f"Creating new note for job_id {note_data['job_id']}")
-                serializer.save()
+                with transaction.atomic():
+                    serializer.save()
         return Response('Added note successfully', status=status.HTTP_200_OK)
 
 
+@metrics.query_budget(5)
+@routers.replica_reads
 @csrf_exempt
+@condition(etag_func=versions.job_stats_etag)
 @api_view(['PUT', 'GET'])
 def handle_given_job(request, job_id=None):
     """handles actions related to a specific job - updating its status or getting various stats"""
@@ -109,14 +181,106 @@ def handle_given_job(request, job_id=None):
             return Response(f'Unable to update job with status {job_status}: ', status=status.HTTP_400_BAD_REQUEST)
 
         models.Job.objects.filter(job_id=job_id).update(status=job_status)
+        signals.invalidate_job_on_commit(job_id)  # update() does not send post_save
         return Response(f'Status updated to {job_status}', status=status.HTTP_200_OK)
 
-    if request.method == 'GET':  # get all stats on given job
-        num_likes = models.Like.objects.filter(job_id_id=job_id).count()
-        num_dislikes = models.Dislike.objects.filter(job_id_id=job_id).count()
-        num_notes = models.Note.objects.filter(job_id_id=job_id).count()
-        # get all unique candidate matches for given job (candidate could be matched multiple times for same job)
-        matching_candidates = models.Match.objects.filter(job_id_id=job_id).order_by().values('candidate_id').distinct()
-        res_dict = {"num_likes": num_likes, "num_dislikes": num_dislikes, "num_notes": num_notes,
-                    "num_matches": len(matching_candidates)}
+    if request.method == 'GET':  # get all stats on given job - read from the job's materialized counters
+        res_dict = job_stats.get_stats([job_id])[job_id]
         return Response(res_dict, status=status.HTTP_200_OK)
+
+
+@metrics.query_budget(8)
+@csrf_exempt
+@api_view(['GET', 'PUT'])
+def handle_job_skills(request, job_id):
+    """get or replace the skills a job asks for
+
+    PUT takes a list of {"skill": skill name, "weight": positive number (default 1), "required": bool (default true)}
+    """
+    job_obj = get_object_or_404(models.Job.objects, job_id=job_id)
+    if request.method == 'PUT':
+        entries = request.data
+        if not isinstance(entries, list) or not all(isinstance(entry, dict) and isinstance(entry.get('skill'), str)
+                                                    for entry in entries):
+            return Response('Request body must be a list of {"skill", "weight", "required"} entries',
+                            status=status.HTTP_400_BAD_REQUEST)
+        skill_names = [entry['skill'] for entry in entries]
+        skill_ids = skill_registry.get_registry().resolve_many(skill_names)
+        unknown_skills = sorted(set(skill_names) - set(skill_ids))
+        if unknown_skills:
+            return Response(f'Unknown skills: {", ".join(unknown_skills)}', status=status.HTTP_400_BAD_REQUEST)
+        if len(set(skill_ids[name] for name in skill_names)) != len(skill_names):
+            return Response('Every skill can only be given once', status=status.HTTP_400_BAD_REQUEST)
+
+        job_skills = []
+        for name, entry in zip(skill_names, entries):
+            weight, required = entry.get('weight', 1.0), entry.get('required', True)
+            if isinstance(weight, bool) or not isinstance(weight, (int, float)) or weight <= 0:
+                return Response(f'Invalid weight for skill {name}', status=status.HTTP_400_BAD_REQUEST)
+            if not isinstance(required, bool):
+                return Response(f'Invalid option for required field of skill {name}',
+                                status=status.HTTP_400_BAD_REQUEST)
+            job_skills.append(models.JobSkill(job_id=job_obj, skill_id_id=skill_ids[name], weight=weight,
+                                              required=required))
+        with transaction.atomic():
+            models.JobSkill.objects.filter(job_id=job_obj).delete()
+            models.JobSkill.objects.bulk_create(job_skills)
+            signals.invalidate_job_on_commit(job_id)  # bulk_create does not send post_save
+
+    job_skills = models.JobSkill.objects.filter(job_id=job_obj).order_by('skill_id__skill_name')
+    return Response([{"skill": skill_name, "weight": weight, "required": required} for skill_name, weight, required
+                     in job_skills.values_list('skill_id__skill_name', 'weight', 'required')],
+                    status=status.HTTP_200_OK)
+
+
+@metrics.query_budget(4)
+@routers.replica_reads
+@csrf_exempt
+@api_view(['GET'])
+def get_stats_for_jobs(request):
+    """get the stats of many jobs at once - job ids are given as a comma separated job_ids query parameter"""
+    if request.method == 'GET':
+        job_ids = request.query_params.get('job_ids', '').split(',')
+        if not all(job_id.isdigit() for job_id in job_ids):
+            return Response('job_ids must be a comma separated list of job ids', status=status.HTTP_400_BAD_REQUEST)
+        return Response(job_stats.get_stats([int(job_id) for job_id in job_ids]), status=status.HTTP_200_OK)
+
+
+@metrics.query_budget(1)
+@routers.replica_reads
+@csrf_exempt
+@api_view(['GET'])
+def search_skills(request):
+    """skills whose name or alias starts with the prefix query parameter, for autocomplete - at most limit (default
+    10) entries of {"id", "skill"} in name order"""
+    if request.method == 'GET':
+        try:
+            limit = utils.parse_page_size(request.query_params.get('limit', '10'))
+        except ValueError as e:
+            return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+        matches = skill_registry.get_registry().complete(request.query_params.get('prefix', ''), limit)
+        return Response([{"id": skill_id, "skill": name} for skill_id, name in matches], status=status.HTTP_200_OK)
+
+
+@metrics.query_budget(0)
+@csrf_exempt
+@api_view(['GET'])
+def get_match_cache_stats(request):
+    """hit / miss counters of the match result cache in this worker"""
+    if request.method == 'GET':
+        return Response(match_cache.get_cache().stats(), status=status.HTTP_200_OK)
+
+
+@metrics.query_budget(1)
+@csrf_exempt
+@api_view(['GET'])
+def get_metrics(request):
+    """matching stage timings and per view query metrics of this worker, and the backlog of the match writer
+
+    returned in the Prometheus text format, or as JSON with ?format=json
+    """
+    if request.method == 'GET':
+        match_writer.get_backlog()
+        if request.query_params.get('format') == 'json':
+            return Response(metrics.registry.snapshot(), status=status.HTTP_200_OK)
+        return HttpResponse(metrics.registry.render_prometheus(), content_type='text/plain; version=0.0.4')